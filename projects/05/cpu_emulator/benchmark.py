@@ -0,0 +1,58 @@
+"""
+Emulator speed benchmark: the predecoded interpreter against the basic-block compilation mode.
+Both modes must end in the same machine state, otherwise the benchmark fails.
+
+Usage: python benchmark.py [program.hack|program.bin ...] [--cycles N]
+With no programs, runs projects/04/mult/mult.asm (R0=R1=20000). Pass the assembled OS test programs of projects/12
+to benchmark those.
+"""
+import argparse
+import time
+from pathlib import Path
+
+from block_compiler import BlockCompiledCPU
+from hack_cpu import HackCPU, load_program
+from assembler import assemble  # On sys.path through hack_cpu
+
+MULT_ASM = Path(__file__).resolve().parents[2] / '04' / 'mult' / 'mult.asm'
+
+
+def _timed_run(cpu: HackCPU, max_cycles: int) -> float:
+    start = time.perf_counter()
+    cpu.run(max_cycles)
+    return time.perf_counter() - start
+
+
+def compare(name: str, program, max_cycles: int, ram_init: dict) -> None:
+    results = []
+    for cpu_class in (HackCPU, BlockCompiledCPU):
+        start = time.perf_counter()
+        cpu = cpu_class(program)
+        load_time = time.perf_counter() - start
+        for address, value in ram_init.items():
+            cpu.ram[address] = value
+        results.append((cpu, load_time, _timed_run(cpu, max_cycles)))
+
+    (interpreted, _, interpreted_time), (compiled, compile_time, compiled_time) = results
+    if (interpreted.a, interpreted.d, interpreted.pc, interpreted.ram) != (compiled.a, compiled.d, compiled.pc,
+                                                                           compiled.ram):
+        raise AssertionError(f"{name}: the two modes ended in different states")
+
+    cycles = interpreted.cycles
+    print(f'{name}: {len(program)} instructions in ROM, {cycles} executed')
+    print(f'  interpreter: {interpreted_time:.3f}s ({cycles / interpreted_time:,.0f} IPS)')
+    print(f'  blocks:      {compiled_time:.3f}s ({cycles / compiled_time:,.0f} IPS), compiled in {compile_time:.3f}s')
+    print(f'  speedup:     {interpreted_time / compiled_time:.2f}x')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('programs', nargs='*')
+    arg_parser.add_argument('--cycles', type=int, default=20_000_000)
+    args = arg_parser.parse_args()
+
+    if args.programs:
+        for program_path in args.programs:
+            compare(program_path, load_program(program_path), args.cycles, {})
+    else:
+        compare(MULT_ASM.name, assemble(MULT_ASM.read_text()), args.cycles, {0: 20000, 1: 20000})
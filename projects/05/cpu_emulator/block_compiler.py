@@ -0,0 +1,155 @@
+"""
+Basic-block compilation mode for the emulator.
+
+The ROM is split into basic blocks, and each block is translated into the source of one Python function, compiled
+once with compile(). Inside a block, A is tracked as a constant after an A-instruction, so the push/pop idioms of
+the VM translator turn into direct RAM accesses. The compiled blocks of a ROM are cached by the ROM's hash.
+
+A block starts at address 0, after every jumping instruction, and at every address an A-instruction can load,
+since any of those may be a jump target. Execution that lands anywhere else, e.g. through a computed jump into the
+middle of a block, runs on the interpreter until it reaches the start of a block. So do the halting instructions,
+and the last instructions before the budget runs out.
+"""
+import hashlib
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from hack_cpu import COMP_EXPRESSIONS, JUMP_CONDITIONS, Halt, HackCPU, _halt
+
+# (a, d, ram) -> (a, d, next pc)
+Block = Callable[[int, int, array], Tuple[int, int, int]]
+
+_compiled_roms: Dict[str, Tuple[List[Optional[Block]], List[int]]] = {}
+
+
+def find_leaders(rom: array, ops: list) -> List[int]:
+    """Sorted addresses where a basic block starts."""
+    leaders = {0}
+    for address, word in enumerate(rom):
+        if word & 0x8000:
+            if word & 0b111:
+                leaders.add(address + 1)
+        elif word < len(rom):
+            leaders.add(word)
+    return sorted(leader for leader in leaders if leader < len(rom) and ops[leader] is not _halt)
+
+
+def block_source(name: str, rom: array, ops: list, start: int, end: int) -> Tuple[str, int]:
+    """
+    Python source of the function executing rom[start:end], stopping early before a halting instruction or after
+    a jump.
+    :return: The source, and the number of instructions the block covers.
+    """
+    lines = [f'def {name}(a, d, ram):']
+    a_value = None  # A's value when it's known at translation time
+    address = start
+    while address < end and ops[address] is not _halt:
+        word = rom[address]
+        address += 1
+        if not word & 0x8000:
+            a_value = word
+            continue
+
+        a = 'a' if a_value is None else str(a_value)
+        m_address = 'a & 32767' if a_value is None else str(a_value & 32767)
+        expression, wraps = COMP_EXPRESSIONS[(word >> 6) & 0b1111111]
+        expression = expression.replace('a', a).replace('m', f'ram[{m_address}]')
+        dest, jump = (word >> 3) & 0b111, word & 0b111
+
+        lines.append(f'    out = {expression}')
+        if wraps:
+            lines.append('    out = ((out + 32768) & 65535) - 32768')
+        if dest & 0b001:
+            lines.append(f'    ram[{m_address}] = out')
+        if jump:
+            target = 'a & 32767' if a_value is None else str(a_value & 32767)
+            saved_a = 'a' if a_value is None else str(a_value)
+            if dest & 0b100:  # The jump goes to the old A, the new one is returned
+                lines.append(f'    target = {target}')
+                target = 'target'
+                saved_a = 'out'
+            if dest & 0b010:
+                lines.append('    d = out')
+            if jump == 0b111:
+                lines.append(f'    return {saved_a}, d, {target}')
+                return '\n'.join(lines), address - start
+            lines.append(f'    if {JUMP_CONDITIONS[jump]}:')
+            lines.append(f'        return {saved_a}, d, {target}')
+            lines.append(f'    return {saved_a}, d, {address}')
+            return '\n'.join(lines), address - start
+        if dest & 0b010:
+            lines.append('    d = out')
+        if dest & 0b100:
+            lines.append('    a = out')
+            a_value = None
+
+    if address == start:
+        return '', 0
+    final_a = 'a' if a_value is None else str(a_value)
+    lines.append(f'    return {final_a}, d, {address}')
+    return '\n'.join(lines), address - start
+
+
+def compile_blocks(rom: array, ops: list) -> Tuple[List[Optional[Block]], List[int]]:
+    """
+    Compiles every basic block of the ROM, or returns the cached result for an identical ROM with the same halting
+    addresses.
+    :return: Two lists indexed by address: the block starting there (or None), and its instruction count.
+    """
+    halts = array('H', (address for address in range(len(rom)) if ops[address] is _halt))
+    rom_hash = hashlib.sha256(rom.tobytes() + halts.tobytes()).hexdigest()
+    if rom_hash in _compiled_roms:
+        return _compiled_roms[rom_hash]
+
+    leaders = find_leaders(rom, ops)
+    sources = []
+    sizes = [0] * len(ops)
+    names = {}
+    for start, end in zip(leaders, leaders[1:] + [len(rom)]):
+        name = f'block_{start}'
+        source, size = block_source(name, rom, ops, start, end)
+        if size:
+            sources.append(source)
+            sizes[start] = size
+            names[start] = name
+
+    namespace = {}
+    exec(compile('\n\n'.join(sources), f'<rom {rom_hash[:12]}>', 'exec'), namespace)
+    blocks: List[Optional[Block]] = [None] * len(ops)
+    for start, name in names.items():
+        blocks[start] = namespace[name]
+    _compiled_roms[rom_hash] = blocks, sizes
+    return blocks, sizes
+
+
+class BlockCompiledCPU(HackCPU):
+    """HackCPU that runs whole basic blocks as single Python calls, interpreting only where it has to."""
+    def __init__(self, program, halt_addresses: Iterable[int] = ()):
+        super().__init__(program, halt_addresses)
+        self._blocks, self._block_sizes = compile_blocks(self.rom, self._ops)
+
+    def run(self, max_cycles: int = 10_000_000) -> int:
+        blocks, sizes = self._blocks, self._block_sizes
+        values, ops, ram = self._values, self._ops, self.ram
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        try:
+            while executed < max_cycles:
+                block = blocks[pc]
+                if block is not None and executed + sizes[pc] <= max_cycles:
+                    executed += sizes[pc]
+                    a, d, pc = block(a, d, ram)
+                    continue
+                op = ops[pc]  # Interpreter fallback
+                if op is None:
+                    a = values[pc]
+                    pc += 1
+                else:
+                    a, d, pc = op(a, d, pc, ram)
+                executed += 1
+        except Halt as halt:
+            a, d, pc = halt.a, halt.d, halt.pc
+            self.halted = True
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        return executed
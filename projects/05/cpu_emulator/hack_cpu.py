@@ -0,0 +1,185 @@
+"""
+Headless Hack computer emulator.
+
+Every ROM word is decoded once, when the program is loaded. A-instructions become their value; C-instructions
+become a handler generated for their exact comp/dest/jump combination, shared by every instruction (and every
+program) that uses the same combination. The run loop only fetches and calls.
+"""
+import sys
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / '06'))  # The assembler's ROM image format
+from hack_rom import load_rom  # noqa: E402
+
+RAM_SIZE = 32768  # A is 15 bits wide as an address
+ROM_SIZE = 32768
+SCREEN = 16384
+SCREEN_SIZE = 8192
+KBD = 24576
+
+# comp bits (a c1..c6) -> (Python expression over a, d and m, whether the result must be wrapped to 16 bits)
+COMP_EXPRESSIONS = {
+    0b0101010: ('0', False), 0b0111111: ('1', False), 0b0111010: ('-1', False),
+    0b0001100: ('d', False), 0b0110000: ('a', False), 0b1110000: ('m', False),
+    0b0001101: ('~d', False), 0b0110001: ('~a', False), 0b1110001: ('~m', False),
+    0b0001111: ('-d', True), 0b0110011: ('-a', True), 0b1110011: ('-m', True),
+    0b0011111: ('d + 1', True), 0b0110111: ('a + 1', True), 0b1110111: ('m + 1', True),
+    0b0001110: ('d - 1', True), 0b0110010: ('a - 1', True), 0b1110010: ('m - 1', True),
+    0b0000010: ('d + a', True), 0b1000010: ('d + m', True),
+    0b0010011: ('d - a', True), 0b1010011: ('d - m', True),
+    0b0000111: ('a - d', True), 0b1000111: ('m - d', True),
+    0b0000000: ('d & a', False), 0b1000000: ('d & m', False),
+    0b0010101: ('d | a', False), 0b1010101: ('d | m', False),
+}
+
+JUMP_CONDITIONS = {0b001: 'out > 0', 0b010: 'out == 0', 0b011: 'out >= 0', 0b100: 'out < 0', 0b101: 'out != 0',
+                   0b110: 'out <= 0'}
+
+# (a, d, pc, ram) -> (a, d, next pc)
+Handler = Callable[[int, int, int, array], Tuple[int, int, int]]
+
+_handlers: Dict[int, Handler] = {}
+
+
+class Halt(Exception):
+    """Raised by the run loop's sentinel handlers. Carries the register state at the halting instruction."""
+    def __init__(self, a: int, d: int, pc: int):
+        super().__init__(pc)
+        self.a, self.d, self.pc = a, d, pc
+
+
+def _halt(a: int, d: int, pc: int, ram: array):
+    raise Halt(a, d, pc)
+
+
+def _handler_source(word: int) -> str:
+    """Python source of the handler for the C-instruction word."""
+    comp_bits = (word >> 6) & 0b1111111
+    dest, jump = (word >> 3) & 0b111, word & 0b111
+    try:
+        expression, wraps = COMP_EXPRESSIONS[comp_bits]
+    except KeyError:
+        raise ValueError(f"{word:016b} has an undefined comp field") from None
+
+    lines = ['def handler(a, d, pc, ram):']
+    if 'm' in expression:
+        lines.append('    m = ram[a & 32767]')
+    lines.append(f'    out = {expression}')
+    if wraps:
+        lines.append('    out = ((out + 32768) & 65535) - 32768')
+    if dest & 0b001:  # M, addressed by A as it was before this instruction
+        lines.append('    ram[a & 32767] = out')
+    if jump == 0b111:
+        lines.append('    target = a & 32767')
+    elif jump:
+        lines.append(f'    target = a & 32767 if {JUMP_CONDITIONS[jump]} else pc + 1')
+    else:
+        lines.append('    target = pc + 1')
+    if dest & 0b010:
+        lines.append('    d = out')
+    if dest & 0b100:
+        lines.append('    a = out')
+    lines.append('    return a, d, target')
+    return '\n'.join(lines)
+
+
+def c_handler(word: int) -> Handler:
+    """Returns the handler of a C-instruction word, generating it on first use."""
+    key = word & 0b0001111111111111  # The two unused bits don't change the instruction
+    handler = _handlers.get(key)
+    if handler is None:
+        namespace = {}
+        exec(_handler_source(key), namespace)
+        handler = _handlers[key] = namespace['handler']
+    return handler
+
+
+def load_program(file_path: str) -> array:
+    """Reads a .hack text file or a .bin ROM image into an array('H')."""
+    if file_path.endswith('.bin'):
+        return array('H', load_rom(file_path))
+    with open(file_path, 'r') as f:
+        return array('H', [int(line, 2) for line in f.read().split()])
+
+
+class HackCPU:
+    """
+    The Hack computer: CPU, ROM, and a flat int16 RAM holding the screen and keyboard memory maps.
+    """
+    def __init__(self, program: Sequence[int], halt_addresses: Iterable[int] = ()):
+        """
+        :param halt_addresses: Addresses that halt the program when execution reaches them, on top of the ones
+                               predecode finds, e.g. the entry of an endless loop that is more than a self-jump.
+        """
+        if len(program) > ROM_SIZE:
+            raise ValueError(f"The program has {len(program)} instructions, the ROM holds {ROM_SIZE}")
+        self.rom = array('H', program)
+        self.ram = array('h', bytes(2 * RAM_SIZE))
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.halted = False
+        self._values, self._ops = self.predecode(self.rom)
+        for address in halt_addresses:
+            self._ops[address] = _halt
+
+    @staticmethod
+    def predecode(rom: array) -> Tuple[List[int], List[Optional[Handler]]]:
+        """
+        Decodes the whole ROM into two parallel lists: the A-instruction values, and the C-instruction handlers
+        (None for A-instructions). Past the end of the program, and on `@X 0;JMP` loops that jump to themselves,
+        the handler raises Halt.
+        """
+        values = [0] * ROM_SIZE
+        ops: List[Optional[Handler]] = [_halt] * ROM_SIZE
+        for address, word in enumerate(rom):
+            if word & 0x8000:
+                ops[address] = c_handler(word)
+                is_self_loop = (word & 0b111 == 0b111 and address and ops[address - 1] is None
+                                and values[address - 1] == address - 1)
+                if is_self_loop:
+                    ops[address] = _halt
+            else:
+                values[address] = word
+                ops[address] = None
+        return values, ops
+
+    def run(self, max_cycles: int = 10_000_000) -> int:
+        """
+        Runs until the program halts (see predecode) or max_cycles instructions have executed.
+        :return: Number of instructions executed by this call.
+        """
+        values, ops, ram = self._values, self._ops, self.ram
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        try:
+            for executed in range(max_cycles):
+                op = ops[pc]
+                if op is None:
+                    a = values[pc]
+                    pc += 1
+                else:
+                    a, d, pc = op(a, d, pc, ram)
+            else:
+                executed = max_cycles
+        except Halt as halt:
+            a, d, pc = halt.a, halt.d, halt.pc
+            self.halted = True
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        return executed
+
+    def reset(self) -> None:
+        """The reset button: the program restarts, registers and memory are left as they are."""
+        self.pc = 0
+        self.halted = False
+
+    def set_key(self, key_code: int) -> None:
+        self.ram[KBD] = key_code
+
+    def screen(self) -> memoryview:
+        """The screen memory map, 256 rows of 32 words, as a view into RAM."""
+        return memoryview(self.ram)[SCREEN:SCREEN + SCREEN_SIZE]
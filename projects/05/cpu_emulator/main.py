@@ -0,0 +1,40 @@
+import argparse
+import time
+
+from block_compiler import BlockCompiledCPU
+from hack_cpu import HackCPU, load_program
+
+
+def parse_range(text: str) -> range:
+    start, _, end = text.partition(':')
+    return range(int(start), int(end) if end else int(start) + 1)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Headless Hack computer emulator')
+    arg_parser.add_argument('program_path', help='.hack text file or .bin ROM image')
+    arg_parser.add_argument('--cycles', type=int, default=10_000_000, help='instruction budget')
+    arg_parser.add_argument('--blocks', action='store_true',
+                            help='compile basic blocks to Python functions instead of interpreting every instruction')
+    arg_parser.add_argument('--set', action='append', default=[], metavar='ADDR=VALUE',
+                            help='RAM word to initialize before running, may be repeated')
+    arg_parser.add_argument('--dump', action='append', default=[], metavar='START[:END]',
+                            help='RAM range to print after running, may be repeated')
+    args = arg_parser.parse_args()
+
+    cpu_class = BlockCompiledCPU if args.blocks else HackCPU
+    cpu = cpu_class(load_program(args.program_path))
+    for assignment in args.set:
+        address, _, value = assignment.partition('=')
+        cpu.ram[int(address)] = int(value)
+
+    start = time.perf_counter()
+    executed = cpu.run(args.cycles)
+    elapsed = time.perf_counter() - start
+
+    status = 'halted' if cpu.halted else 'budget exhausted'
+    print(f"{status} after {executed} instructions, {elapsed:.3f}s ({executed / max(elapsed, 1e-9):,.0f} IPS)")
+    print(f"A={cpu.a} D={cpu.d} PC={cpu.pc}")
+    for ram_range in map(parse_range, args.dump):
+        for address in ram_range:
+            print(f"RAM[{address}] = {cpu.ram[address]}")
@@ -1,139 +1,461 @@
+import argparse
 import os
-from enum import Enum
-import sys
-from itertools import tee
-
-comp_dict = {'0': '0101010', '1': '0111111', '-1': '0111010', 'D': '0001100', 'A': '0110000',
-             '!D': '0001101', '!A': '0110001', '-D': '0001111', '-A': '0110011',
-             'D+1': '0011111', 'A+1': '0110111', 'D-1': '0001110', 'A-1': '0110010', 'D+A': '0000010', 'D-A': '0010011',
-             'A-D': '0000111', 'D&A': '0000000', 'D|A': '0010101', 'M': '1110000', '!M': '1110001', '-M': '1110011',
-             'M+1': '1110111', 'M-1': '1110010', 'D+M': '1000010', 'D-M': '1010011', 'M-D': '1000111', 'D&M': '1000000',
-             'D|M': '1010101'
+from collections import Counter
+from array import array
+from functools import partial
+from itertools import permutations
+from mmap import ACCESS_READ, mmap
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import peephole
+from build_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, BuildCache
+from hack_rom import RomWriter, write_rom
+from source_map import SourceMap, map_path
+
+comp_dict = {'0': 0b0101010, '1': 0b0111111, '-1': 0b0111010, 'D': 0b0001100, 'A': 0b0110000,
+             '!D': 0b0001101, '!A': 0b0110001, '-D': 0b0001111, '-A': 0b0110011,
+             'D+1': 0b0011111, 'A+1': 0b0110111, 'D-1': 0b0001110, 'A-1': 0b0110010, 'D+A': 0b0000010,
+             'D-A': 0b0010011, 'A-D': 0b0000111, 'D&A': 0b0000000, 'D|A': 0b0010101, 'M': 0b1110000,
+             '!M': 0b1110001, '-M': 0b1110011, 'M+1': 0b1110111, 'M-1': 0b1110010, 'D+M': 0b1000010,
+             'D-M': 0b1010011, 'M-D': 0b1000111, 'D&M': 0b1000000, 'D|M': 0b1010101
              }
 
-dest_dict = {'null': '000', 'M': '001', 'D': '010', 'MD': '011', 'A': '100', 'AM': '101', 'AD': '110', 'AMD': '111'}
+dest_dict = {'null': 0b000, 'M': 0b001, 'D': 0b010, 'MD': 0b011, 'A': 0b100, 'AM': 0b101, 'AD': 0b110, 'AMD': 0b111}
 
-jump_dict = {'null': '000', 'JGT': '001', 'JEQ': '010', 'JGE': '011', 'JLT': '100', 'JNE': '101', 'JLE': '110',
-             'JMP': '111'}
+jump_dict = {'null': 0b000, 'JGT': 0b001, 'JEQ': 0b010, 'JGE': 0b011, 'JLT': 0b100, 'JNE': 0b101, 'JLE': 0b110,
+             'JMP': 0b111}
 
 symbol_dict = {'SP': 0, 'LCL': 1, 'ARG': 2, 'THIS': 3, 'THAT': 4, 'R0': 0, 'R1': 1, 'R2': 2, 'R3': 3, 'R4': 4, 'R5': 5,
                'R6': 6, 'R7': 7, 'R8': 8, 'R9': 9, 'R10': 10, 'R11': 11, 'R12': 12, 'R13': 13, 'R14': 14, 'R15': 15,
                'SCREEN': 16384, 'KBD': 24576}
 
 
-class InstructionType(Enum):
-    A = 0
-    C = 1
-    L = 2
+def _comp_aliases() -> Dict[str, int]:
+    """Every comp spelling, including the commuted forms of + & and | (e.g. M+D, A+D, 1+D)."""
+    aliases = dict(comp_dict)
+    for comp, bits in comp_dict.items():
+        for op in '+&|':
+            left, sep, right = comp.partition(op)
+            if sep and left:
+                aliases[right + op + left] = bits
+    return aliases
+
+
+def _dest_aliases() -> Dict[str, int]:
+    """Every dest prefix, in any register order (e.g. DM=, MAD=). The null dest has no prefix."""
+    aliases = {'': dest_dict['null']}
+    for dest, bits in dest_dict.items():
+        if dest != 'null':
+            for order in permutations(dest):
+                aliases[''.join(order) + '='] = bits
+    return aliases
+
+
+def _build_c_instruction_table() -> Dict[str, int]:
+    """
+    Maps the full text of every valid C instruction, with whitespace removed, directly to its 16 bit encoding.
+    """
+    jumps = {('' if jump == 'null' else ';' + jump): bits for jump, bits in jump_dict.items()}
+    table = {}
+    for dest, dest_bits in _dest_aliases().items():
+        for comp, comp_bits in _comp_aliases().items():
+            for jump, jump_bits in jumps.items():
+                table[dest + comp + jump] = 0b111 << 13 | comp_bits << 6 | dest_bits << 3 | jump_bits
+    return table
+
+
+c_instruction_table = _build_c_instruction_table()
+
+ASSEMBLER_VERSION = '2.0'
+OUTPUT_FORMATS = ('hack', 'bin')
+STREAM_CHUNK_BYTES = 1 << 22
 
 
 class Parser:
-    def __init__(self, asm_file_path: str):
+    """
+    Assembles a single program. All symbol state (labels and variables) lives in the instance, seeded from the
+    predefined symbols, so any number of programs can be assembled in the same process.
+    """
+    def __init__(self, source: str = '', optimize: bool = False, track_lines: bool = False):
+        """
+        :param optimize: Run the peephole optimizer before resolving labels.
+        :param track_lines: Keep the source line of every command, needed by source_map().
+        """
+        self.symbols = dict(symbol_dict)
         self.variable_pointer = 16
-        self._check_if_file_is_valid(asm_file_path)
-        file_name = asm_file_path.split('.')[0]
-        self.program_output = open(f"{file_name}.hack", 'w+')
-        self.scan_labels(asm_file_path)
-        self.parse_file(asm_file_path)
-
-    def scan_labels(self, file_path: str) -> None:
-        first_iter = self.get_next_command(file_path)
-        try:
-            command_counter = 0
-            for command in first_iter:
-                command_type = self.command_type(command)
-                if command_type == InstructionType.L:
-                    global symbol_dict
-                    symbol_dict[command.strip('()')] = command_counter
-                else:
-                    command_counter += 1
-
-        except StopIteration:
-            pass
-
-    def parse_file(self, file_path: str) -> None:
-        commands_generator = self.get_next_command(file_path)
-        try:
-            for i, command in enumerate(commands_generator):
-                command_type = self.command_type(command)
+        self.line_numbers = [] if track_lines else None
+        self.commands = self.sanitize(source, self.line_numbers)
+        self.peephole_savings = Counter()
+        if optimize:
+            # Variables get the addresses they'd have without optimization, even if a rule drops their first reference
+            self.reserve_variables(self.commands)
+            self.commands, self.peephole_savings = peephole.optimize(self.commands, self.line_numbers)
+        self.instructions = self.scan_labels(self.commands)
 
-                if command_type == InstructionType.A:
-                    self.program_output.write(self.parse_a_command(command) + '\n')
-                elif command_type == InstructionType.C:
-                    self.program_output.write(self.parse_c_command(command) + '\n')
-        except StopIteration:
-            pass
+    def source_map(self, source_name: str) -> SourceMap:
+        """
+        Relates every ROM address to its source line, and every label without a '$' to its address.
+        Requires the parser to be created with track_lines.
+        """
+        if self.line_numbers is None:
+            raise ValueError("The parser wasn't created with track_lines")
+        lines = []
+        labels = []
+        for command, line in zip(self.commands, self.line_numbers):
+            if command[0] == '(':
+                if '$' not in command:
+                    labels.append((len(lines), command[1:-1]))
+            else:
+                lines.append(line)
+        return SourceMap(source_name, lines, labels)
+
+    def reserve_variables(self, commands: List[str]) -> None:
+        """
+        Allocates every variable referenced in commands, in order of first reference.
+        :param commands: Sanitized commands, labels included.
+        """
+        labels = {command[1:-1] for command in commands if command[0] == '('}
+        for command in commands:
+            if command[0] == '@':
+                name = command[1:]
+                if name not in self.symbols and name not in labels and not name.isdigit():
+                    self.symbols[name] = self.variable_pointer
+                    self.variable_pointer += 1
 
-    def parse_a_command(self, command):
+    def scan_labels(self, commands: List[str]) -> List[str]:
         """
-       Parses the received A instruction and translates it into 16 bit binary commands
+        First pass. Records the ROM address of every label and drops the label pseudo-commands.
+        :param commands: Sanitized commands, as returned by sanitize.
+        :return: The instruction list, in ROM order.
+        """
+        instructions = []
+        for command in commands:
+            if command[0] == '(':
+                self.symbols[command[1:-1]] = len(instructions)
+            else:
+                instructions.append(command)
+        return instructions
+
+    def parse_file(self) -> array:
+        """
+        Second pass. Encodes the instruction list.
+        :return: The program, one 16 bit word per instruction.
+        """
+        parse_a_command = self.parse_a_command
+        parse_c_command = self.parse_c_command
+        return array('H', [parse_a_command(command) if command[0] == '@' else parse_c_command(command)
+                           for command in self.instructions])
+
+    def parse_a_command(self, command: str) -> int:
+        """
+       Parses the received A instruction and translates it into a 16 bit word
        :param command: Valid A instruction (Str.)
-       :return: 16 bit binary representation of the received command
+       :return: The encoded instruction
        """
-        global symbol_dict
-
-        address = command.split('@')[1]
-        if address.isdigit():
-            pass
-        elif address in symbol_dict:
-            address = symbol_dict[address]
+        address = command[1:]
+        if address in self.symbols:
+            return self.symbols[address]
+        elif address.isdigit():
+            value = int(address)
+            if value > 0x7FFF:
+                raise ValueError(f"{command}: constant doesn't fit in 15 bits")
+            return value
         else:
-            symbol_dict[address] = self.variable_pointer
+            self.symbols[address] = self.variable_pointer
             self.variable_pointer += 1
-            address = symbol_dict[address]
-
-        return f'0{int(address):015b}'
+            return self.symbols[address]
 
     @staticmethod
-    def parse_c_command(command):
+    def parse_c_command(command: str) -> int:
         """
-        Parses the received C instruction and translates it into 16 bit binary commands
-        :param command: Valid C instruction (Str.)
-        :return: 16 bit binary representation of the received command
+        Parses the received C instruction and translates it into a 16 bit word
+        :param command: Valid C instruction (Str.), without whitespace
+        :return: The encoded instruction
         """
-        const = '111'
-        if '=' in command:
-            parts = command.split('=')
-            dest = dest_dict[parts[0]]
-            comp = comp_dict[parts[1]]
-            jump = jump_dict[command.split(';')[1] if ';' in command else 'null']
-        else:
-            dest = dest_dict['null']
-            parts = command.split(';')
-            comp = comp_dict[parts[0]]
-            jump = jump_dict[parts[1]]
-        return const + comp + dest + jump
+        try:
+            return c_instruction_table[command]
+        except KeyError:
+            raise ValueError(f"{command} is an invalid C instruction") from None
 
     @staticmethod
-    def get_next_command(file_path: str):
-        with open(file_path, 'r') as file:
-            data = file.readlines()
-        for line in data:
+    def sanitize(source: str, line_numbers: Optional[List[int]] = None) -> List[str]:
+        """
+        Strips comments and whitespace from every line of the source.
+        :param source: Hack assembly program text.
+        :param line_numbers: If given, the 1-based source line of every command is appended to it.
+        :return: List of the non-empty commands, labels included.
+        """
+        commands = []
+        for line_number, line in enumerate(source.splitlines(), 1):
             command = ''.join(line.partition('/')[0].split())
             if command:
-                yield command
+                commands.append(command)
+                if line_numbers is not None:
+                    line_numbers.append(line_number)
+        return commands
 
-    @staticmethod
-    def _check_if_file_is_valid(file_path: str) -> None:
-        if not os.path.exists(file_path):
-            raise FileNotFoundError("The File path doesn't exists")
-        elif not file_path.endswith('.asm'):
-            raise Exception("Unexpected file format")
 
-    @staticmethod
-    def command_type(command):
-        if command.startswith('@'):
-            if command.split('@')[1]:  # a instruction
-                return InstructionType.A
-        elif command.startswith('('):
-            return InstructionType.L
-        else:  # c command
-            return InstructionType.C
+def assemble(source: str, optimize: bool = False) -> array:
+    """
+    Assembles a Hack assembly program.
+    :param source: Hack assembly program text.
+    :param optimize: Run the peephole optimizer before resolving labels.
+    :return: The machine code, as an array of unsigned 16 bit words.
+    """
+    return Parser(source, optimize).parse_file()
+
+
+def to_hack_text(program: array) -> str:
+    """Formats machine code in the textual .hack format, one 16 digit binary word per line."""
+    return ''.join(f'{word:016b}\n' for word in program)
+
+
+def assemble_file(asm_file_path: str, output_format: str = 'hack', cache: Optional[BuildCache] = None,
+                  optimize: bool = False, write_map: bool = False) -> str:
+    """
+    Assembles a .asm file into a .hack text file, or a .bin ROM image, next to it.
+    :param output_format: 'hack' or 'bin'.
+    :param cache: If given, the output is looked up by a hash of the normalized source, and parsing is skipped on
+                  a hit. Misses are added to the cache.
+    :param optimize: Run the peephole optimizer, and print how many instructions it saved, or that the output came
+                     from the cache.
+    :param write_map: Also write the address to source map next to the output. The map depends on the exact
+                      source lines, so the cache isn't used.
+    :return: The path of the created file.
+    """
+    _check_if_file_is_valid(asm_file_path)
+    if write_map:
+        cache = None
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"{output_format} is an unsupported output format")
+    output_path = os.path.splitext(asm_file_path)[0] + '.' + output_format
+    with open(asm_file_path, 'r') as f:
+        source = f.read()
+
+    if cache is not None:
+        source = '\n'.join(Parser.sanitize(source))
+        key = cache.key(ASSEMBLER_VERSION, output_format, 'O' if optimize else '', source)
+        if cache.fetch(key, output_format, output_path):
+            if optimize:  # The savings are only known when parsing
+                print(f"{asm_file_path}: taken from the build cache, peephole savings not recomputed")
+            return output_path
+
+    parser = Parser(source, optimize, track_lines=write_map)
+    program = parser.parse_file()
+    if write_map:
+        parser.source_map(os.path.basename(asm_file_path)).save(map_path(output_path))
+    if optimize:
+        saved = sum(parser.peephole_savings.values())
+        details = ', '.join(f'{rule}: {count}' for rule, count in parser.peephole_savings.most_common())
+        print(f"{asm_file_path}: {len(program)} instructions, {saved} saved by the peephole optimizer"
+              + (f" ({details})" if details else ''))
+    if output_format == 'bin':
+        write_rom(output_path, program)
+    else:
+        with open(output_path, 'w') as f:
+            f.write(to_hack_text(program))
+
+    if cache is not None:
+        cache.store(key, output_format, output_path)
+    return output_path
+
+
+def assemble_tree(root_dir: str, jobs: Optional[int] = None, output_format: str = 'hack',
+                  stream: bool = False, cache: Optional[BuildCache] = None, optimize: bool = False,
+                  write_map: bool = False) -> List[str]:
+    """
+    Assembles every .asm file under root_dir, in parallel across processes.
+    :param jobs: Number of worker processes. Defaults to the number of cores.
+    :param output_format: 'hack' or 'bin'.
+    :param stream: Assemble each file with assemble_stream, in a single process per file.
+    :param cache: Build cache used for every file. Ignored when streaming.
+    :param optimize: Run the peephole optimizer on every file. Ignored when streaming.
+    :param write_map: Write the address to source map of every file. Ignored when streaming.
+    :return: The paths of the created files.
+    """
+    asm_files = sorted(str(path) for path in Path(root_dir).rglob('*.asm'))
+    if not asm_files:
+        return []
+    if stream:
+        assemble_one = partial(assemble_stream, output_format=output_format)
+    else:
+        assemble_one = partial(assemble_file, output_format=output_format, cache=cache, optimize=optimize,
+                               write_map=write_map)
+    with Pool(min(jobs or os.cpu_count() or 1, len(asm_files))) as pool:
+        return pool.map(assemble_one, asm_files)
+
+
+def _stream_commands(source: mmap, start: int, end: int) -> Iterator[str]:
+    """Yields the sanitized commands of the lines that begin in source[start:end]."""
+    source.seek(start)
+    while source.tell() < end:
+        command = b''.join(source.readline().partition(b'/')[0].split())
+        if command:
+            yield command.decode('ascii')
+
+
+def _split_source(source: mmap, chunk_bytes: int) -> List[Tuple[int, int]]:
+    """Splits the source into byte ranges of about chunk_bytes each, cut at line boundaries."""
+    spans = []
+    start = 0
+    while start < len(source):
+        end = source.find(b'\n', min(start + chunk_bytes, len(source)))
+        end = len(source) if end == -1 else end + 1
+        spans.append((start, end))
+        start = end
+    return spans
+
+
+def _scan_symbols(source: mmap) -> Dict[str, int]:
+    """
+    First streaming pass. Keeps only the label addresses and the names of the referenced symbols, then allocates
+    the variables in order of first reference, exactly like Parser does. Memory grows with the number of distinct
+    symbols, not with the size of the program.
+    """
+    symbols = dict(symbol_dict)
+    referenced = {}
+    address = 0
+    for command in _stream_commands(source, 0, len(source)):
+        if command[0] == '(':
+            symbols[command[1:-1]] = address
+            continue
+        if command[0] == '@' and not command[1:].isdigit():
+            referenced.setdefault(command[1:], None)
+        address += 1
+
+    variable_pointer = 16
+    for name in referenced:
+        if name not in symbols:
+            symbols[name] = variable_pointer
+            variable_pointer += 1
+    return symbols
+
+
+class _ChunkEncoder:
+    """Encodes chunks of a memory-mapped source with a fixed symbol table."""
+    def __init__(self, asm_file_path: str, symbols: Dict[str, int], output_format: str):
+        with open(asm_file_path, 'rb') as f:
+            self.source = mmap(f.fileno(), 0, access=ACCESS_READ)
+        self.parser = Parser()
+        self.parser.symbols = symbols
+        self.output_format = output_format
+
+    def encode(self, span: Tuple[int, int]):
+        """Encodes the lines that begin in source[start:end]. Returns text for 'hack', words for 'bin'."""
+        parse_a_command = self.parser.parse_a_command
+        parse_c_command = self.parser.parse_c_command
+        words = array('H', [parse_a_command(command) if command[0] == '@' else parse_c_command(command)
+                            for command in _stream_commands(self.source, *span) if command[0] != '('])
+        return to_hack_text(words) if self.output_format == 'hack' else words
+
+    def close(self) -> None:
+        self.source.close()
+
+
+_worker_encoder: Optional[_ChunkEncoder] = None  # Set in each worker process of an assemble_stream pool only
+
+
+def _init_stream_worker(asm_file_path: str, symbols: Dict[str, int], output_format: str) -> None:
+    global _worker_encoder
+    _worker_encoder = _ChunkEncoder(asm_file_path, symbols, output_format)
+
+
+def _encode_span_in_worker(span: Tuple[int, int]):
+    return _worker_encoder.encode(span)
+
+
+def assemble_stream(asm_file_path: str, output_format: str = 'hack', jobs: int = 1,
+                    chunk_bytes: int = STREAM_CHUNK_BYTES) -> str:
+    """
+    Assembles a .asm file of any size with bounded memory. The source is memory-mapped and read twice: once to
+    resolve the symbols, once to encode it chunk by chunk, each chunk being written out as soon as it's ready.
+    :param jobs: With more than one job, the chunks are encoded by a process pool. The symbol table is final before
+                 encoding starts, so the chunks are independent.
+    :param chunk_bytes: Approximate amount of source text per chunk.
+    :return: The path of the created file.
+    """
+    _check_if_file_is_valid(asm_file_path)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"{output_format} is an unsupported output format")
+    output_path = os.path.splitext(asm_file_path)[0] + '.' + output_format
+    if os.path.getsize(asm_file_path) == 0:  # Empty files can't be mapped
+        return assemble_file(asm_file_path, output_format)
+
+    with open(asm_file_path, 'rb') as f:
+        source = mmap(f.fileno(), 0, access=ACCESS_READ)
+    with source:
+        symbols = _scan_symbols(source)
+        spans = _split_source(source, chunk_bytes)
+
+    init_args = (asm_file_path, symbols, output_format)
+    output = RomWriter(output_path) if output_format == 'bin' else open(output_path, 'w')
+    try:
+        with output:
+            if jobs > 1:
+                with Pool(jobs, _init_stream_worker, init_args) as pool:
+                    for chunk in pool.imap(_encode_span_in_worker, spans):
+                        output.write(chunk)
+            else:
+                encoder = _ChunkEncoder(*init_args)
+                try:
+                    for span in spans:
+                        output.write(encoder.encode(span))
+                finally:
+                    encoder.close()
+    except BaseException:
+        if os.path.exists(output_path):  # A partial .hack file; RomWriter deletes a partial image itself
+            os.unlink(output_path)
+        raise
+    return output_path
+
+
+def _check_if_file_is_valid(file_path: str) -> None:
+    if not os.path.exists(file_path):
+        raise FileNotFoundError("The File path doesn't exists")
+    elif not file_path.endswith('.asm'):
+        raise Exception("Unexpected file format")
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        program_path = sys.argv[1]
-        Parser(program_path)
+    arg_parser = argparse.ArgumentParser(description='Hack assembler')
+    arg_parser.add_argument('program_path', nargs='?', help='.asm file, or a directory to assemble recursively')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None,
+                            help='worker processes for directory input, or for encoding the chunks of a single '
+                                 'streamed file (default: number of cores for directories, 1 for files)')
+    arg_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='hack',
+                            help='hack: text, one binary word per line. bin: little-endian uint16 ROM image')
+    arg_parser.add_argument('--stream', action='store_true',
+                            help='memory-map the source and encode it in chunks, with constant memory use')
+    arg_parser.add_argument('-O', '--optimize', action='store_true',
+                            help='run the peephole optimizer and report the instructions saved (not with --stream)')
+    arg_parser.add_argument('--map', action='store_true',
+                            help='write <name>.map.json, relating ROM addresses to source lines and labels '
+                                 '(not with --stream, bypasses the cache)')
+    arg_parser.add_argument('--cache', action='store_true',
+                            help='reuse previously assembled outputs of identical sources (not with --stream)')
+    arg_parser.add_argument('--cache-dir', default=None,
+                            help=f'build cache location (default: $HACK_ASM_CACHE or {DEFAULT_CACHE_DIR})')
+    arg_parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                            help='evict least recently used outputs past this size')
+    arg_parser.add_argument('--cache-stats', action='store_true', help='print the build cache hit rate')
+    args = arg_parser.parse_args()
+
+    build_cache = None
+    if args.cache or args.cache_dir or args.cache_stats:
+        build_cache = BuildCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+
+    if args.program_path is None:
+        if not args.cache_stats:
+            arg_parser.error('the program path is required')
+    elif os.path.isdir(args.program_path):
+        assemble_tree(args.program_path, args.jobs, args.format, args.stream, build_cache, args.optimize,
+                      args.map)
+    elif args.stream:
+        assemble_stream(args.program_path, args.format, args.jobs or 1)
     else:
-        raise Exception("Please enter the program path")
+        assemble_file(args.program_path, args.format, build_cache, args.optimize, args.map)
+
+    if args.cache_stats:
+        print(build_cache.report())
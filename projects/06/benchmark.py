@@ -0,0 +1,96 @@
+"""
+Assembler throughput benchmark.
+Generates a large .asm file shaped like the VM translator's output and times the assembler on it against the
+original read-twice, write-per-instruction implementation.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import assembler
+
+
+def generate_asm(file_path: str, blocks: int) -> int:
+    """
+    Writes a synthetic program made of push/pop/compare idioms, labels and variables. Jumps only target the first
+    1000 labels so that every resolved address fits in an A-instruction.
+    :return: Number of source lines written.
+    """
+    lines = []
+    for i in range(blocks):
+        lines += [f'// block {i}', f'(Main.loop{i})',
+                  '@SP', 'A=M-1', 'D=M', f'@Main.{i % 64}', 'M=D',
+                  '@LCL', 'D=M', f'@{i % 8}', 'A=D+A', 'D=M',
+                  '@SP', 'A=M', 'M=D', '@SP', 'M=M+1',
+                  '@SP', 'AM=M-1', 'D=M', 'A=A-1', 'D=M-D',
+                  f'@Main.loop{i % 1000}', 'D;JEQ', f'@Main.loop{(i + 1) % 1000}', '0;JMP']
+    with open(file_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return len(lines)
+
+
+def legacy_assemble(file_path: str) -> None:
+    """The original implementation: two full reads of the source and one write call per instruction."""
+    def next_command():
+        with open(file_path, 'r') as file:
+            data = file.readlines()
+        for line in data:
+            command = ''.join(line.partition('/')[0].split())
+            if command:
+                yield command
+
+    symbols = dict(assembler.symbol_dict)
+    counter = 0
+    for command in next_command():
+        if command.startswith('('):
+            symbols[command.strip('()')] = counter
+        else:
+            counter += 1
+
+    variable_pointer = 16
+    with open(file_path.split('.')[0] + '.hack', 'w+') as output:
+        for command in next_command():
+            if command.startswith('@'):
+                address = command.split('@')[1]
+                if not address.isdigit():
+                    if address not in symbols:
+                        symbols[address] = variable_pointer
+                        variable_pointer += 1
+                    address = symbols[address]
+                output.write(f'0{int(address):015b}' + '\n')
+            elif not command.startswith('('):
+                dest, _, rest = command.rpartition('=')
+                comp, _, jump = rest.partition(';')
+                output.write(f"111{assembler.comp_dict[comp]:07b}{assembler.dest_dict[dest or 'null']:03b}"
+                             f"{assembler.jump_dict[jump or 'null']:03b}" + '\n')
+
+
+def _time(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Assembler throughput benchmark')
+    arg_parser.add_argument('blocks', type=int, nargs='?', default=20000,
+                            help='number of VM-like blocks in the generated program (default: %(default)s)')
+    n_blocks = arg_parser.parse_args().blocks
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asm_path = os.path.join(tmp_dir, 'Bench.asm')
+        n_lines = generate_asm(asm_path, n_blocks)
+
+        legacy_time = _time(legacy_assemble, asm_path)
+        with open(os.path.join(tmp_dir, 'Bench.hack')) as f:
+            legacy_output = f.read()
+
+        current_time = _time(assembler.assemble_file, asm_path)
+        with open(os.path.join(tmp_dir, 'Bench.hack')) as f:
+            if f.read() != legacy_output:
+                raise AssertionError("Outputs differ between the legacy and the current assembler")
+
+    print(f'{n_lines} source lines')
+    print(f'legacy:  {legacy_time:.3f}s ({n_lines / legacy_time:,.0f} lines/s)')
+    print(f'current: {current_time:.3f}s ({n_lines / current_time:,.0f} lines/s)')
+    print(f'speedup: {legacy_time / current_time:.2f}x')
@@ -0,0 +1,121 @@
+"""
+Content-addressed cache of assembled programs.
+
+Artifacts are stored under <cache_dir>/objects/<2 hex digits>/<sha256>.<format>, keyed on everything that determines
+the output. The least recently used artifacts are evicted once the cache grows past its size limit; a hit refreshes
+the artifact's modification time. Hits and misses are appended to <cache_dir>/stats.log, one byte each, which is safe
+with concurrent writers.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Iterator, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hack-assembler')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_HIT = b'H'
+_MISS = b'M'
+_TMP_SUFFIX = '.tmp'  # Artifacts being stored, not yet renamed into place
+
+
+class BuildCache:
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir or os.environ.get('HACK_ASM_CACHE', DEFAULT_CACHE_DIR))
+        self.max_bytes = max_bytes
+        self._objects = self.cache_dir / 'objects'
+        self._stats_log = self.cache_dir / 'stats.log'
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        """Hashes the given parts, e.g. assembler version, output format and normalized source, into a key."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def fetch(self, key: str, extension: str, output_path: str) -> bool:
+        """
+        Copies the artifact stored under key to output_path.
+        :return: True on a hit, False if there's no such artifact.
+        """
+        artifact = self._artifact_path(key, extension)
+        try:
+            shutil.copyfile(artifact, output_path)
+            os.utime(artifact)
+        except FileNotFoundError:
+            self._record(_MISS)
+            return False
+        self._record(_HIT)
+        return True
+
+    def store(self, key: str, extension: str, artifact_path: str) -> None:
+        """Adds a copy of artifact_path to the cache under key, then evicts down to the size limit."""
+        destination = self._artifact_path(key, extension)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=_TMP_SUFFIX, dir=destination.parent)
+        os.close(fd)
+        try:
+            shutil.copyfile(artifact_path, tmp_path)
+            os.replace(tmp_path, destination)  # Atomic, readers never see a partial artifact
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """Deletes the least recently used artifacts until the cache fits in max_bytes."""
+        if not self._objects.exists():
+            return
+        entries = []
+        total = 0
+        for artifact in self._artifacts():
+            try:
+                stat = artifact.stat()
+            except FileNotFoundError:  # Evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, artifact))
+            total += stat.st_size
+        entries.sort()
+        for _, size, artifact in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                artifact.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self) -> dict:
+        """Hit/miss counters since the cache was created, plus its current size."""
+        try:
+            log = self._stats_log.read_bytes()
+        except FileNotFoundError:
+            log = b''
+        hits = log.count(_HIT)
+        misses = log.count(_MISS)
+        artifacts = list(self._artifacts())
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                'artifacts': len(artifacts), 'bytes': sum(artifact.stat().st_size for artifact in artifacts)}
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"cache: {self.cache_dir}\n"
+                f"hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {stats['hit_rate']:.1%}\n"
+                f"artifacts: {stats['artifacts']}, size: {stats['bytes']} / {self.max_bytes} bytes")
+
+    def _artifacts(self) -> Iterator[Path]:
+        """Every stored artifact, without the ones still being stored."""
+        if self._objects.exists():
+            yield from (path for path in self._objects.glob('*/*') if path.suffix != _TMP_SUFFIX)
+
+    def _artifact_path(self, key: str, extension: str) -> Path:
+        return self._objects / key[:2] / f'{key}.{extension}'
+
+    def _record(self, event: bytes) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._stats_log, 'ab') as log:
+            log.write(event)
@@ -0,0 +1,124 @@
+"""
+Binary ROM image format.
+
+    offset 0:  b'HACK'   magic
+    offset 4:  uint32    number of instructions
+    offset 8:  uint32    CRC-32 of the instruction words
+    offset 12: uint16[]  instruction words
+
+All fields are little-endian. The words start on an even offset, so the image can be mapped and viewed as uint16
+without copying.
+"""
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only load_rom_array needs it
+    np = None
+
+MAGIC = b'HACK'
+HEADER = struct.Struct('<4sII')
+
+
+def _little_endian_bytes(program: array) -> bytes:
+    if sys.byteorder == 'little':
+        return program.tobytes()
+    swapped = array('H', program)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+class RomWriter:
+    """
+    Writes a ROM image incrementally. The header is patched with the final count and checksum on close, so the
+    program never has to be held in memory as a whole. Leaving a with block on an exception deletes the image
+    instead, so no valid looking header ends up on a partial program.
+    """
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._file = open(file_path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, 0, 0))
+        self.count = 0
+        self._checksum = 0
+
+    def write(self, words: array) -> None:
+        """Appends array('H') of instruction words to the image."""
+        payload = _little_endian_bytes(words)
+        self._checksum = zlib.crc32(payload, self._checksum)
+        self.count += len(words)
+        self._file.write(payload)
+
+    def close(self) -> None:
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, self.count, self._checksum))
+        self._file.close()
+
+    def discard(self) -> None:
+        """Closes and deletes the unfinished image."""
+        self._file.close()
+        os.unlink(self.file_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def write_rom(file_path: str, program: array) -> None:
+    """
+    Writes program as a binary ROM image.
+    :param program: array('H') of instruction words.
+    """
+    with RomWriter(file_path) as rom:
+        rom.write(program)
+
+
+def _map_rom(file_path: str, verify: bool):
+    """Maps the image read-only and validates its header. Returns the map and the instruction count."""
+    with open(file_path, 'rb') as f:
+        rom_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(rom_map) < HEADER.size:
+        raise ValueError(f"{file_path} is too short to be a ROM image")
+    magic, count, checksum = HEADER.unpack_from(rom_map)
+    if magic != MAGIC:
+        raise ValueError(f"{file_path} is not a ROM image")
+    if len(rom_map) != HEADER.size + 2 * count:
+        raise ValueError(f"{file_path}: header says {count} instructions, file size disagrees")
+    if verify and zlib.crc32(memoryview(rom_map)[HEADER.size:]) != checksum:
+        raise ValueError(f"{file_path}: checksum mismatch")
+    return rom_map, count
+
+
+def load_rom(file_path: str, verify: bool = True) -> memoryview:
+    """
+    Memory-maps a ROM image.
+    :param verify: Check the CRC-32 of the instruction words. Costs one pass over the file.
+    :return: A read-only memoryview of uint16 words, backed directly by the mapped file on little-endian hosts.
+    """
+    rom_map, _ = _map_rom(file_path, verify)
+    words = memoryview(rom_map)[HEADER.size:]
+    if sys.byteorder == 'little':
+        return words.cast('H')
+    program = array('H', words.tobytes())
+    program.byteswap()
+    return memoryview(program).toreadonly()
+
+
+def load_rom_array(file_path: str, verify: bool = True):
+    """
+    Memory-maps a ROM image as a read-only NumPy uint16 array, without copying.
+    :raises ImportError: If NumPy isn't installed.
+    """
+    if np is None:
+        raise ImportError("load_rom_array requires NumPy")
+    rom_map, count = _map_rom(file_path, verify)
+    return np.frombuffer(rom_map, dtype='<u2', count=count, offset=HEADER.size)
@@ -0,0 +1,132 @@
+"""
+Peephole optimizer for Hack assembly.
+
+Runs on the sanitized command list, labels included, before labels are resolved. Label pseudo-commands are never
+removed or moved and no rule matches across one, so every label keeps pointing at the same instruction and the
+assembler's label pass assigns the new addresses.
+"""
+from collections import Counter
+from typing import List, Optional, Tuple
+
+# How far back redundant_a_load looks for the instruction that set A
+_A_LOOKBACK = 16
+
+
+def _split_c(command: str) -> Tuple[str, str, str]:
+    """Splits a C instruction into dest, comp and jump. Missing parts are empty strings."""
+    dest, _, rest = command.rpartition('=')
+    comp, _, jump = rest.partition(';')
+    return dest, comp, jump
+
+
+def _is_a(command: str) -> bool:
+    return command[0] == '@'
+
+
+def _is_c(command: str) -> bool:
+    return command[0] not in '@('
+
+
+def sp_inc_dec(out: List[str], commands: List[str], i: int) -> Optional[Tuple[int, List[str]]]:
+    """SP++ immediately followed by SP-- (or the reverse) leaves only A=SP behind."""
+    if commands[i:i + 4] in (['@SP', 'M=M+1', '@SP', 'M=M-1'], ['@SP', 'M=M-1', '@SP', 'M=M+1']):
+        return 4, ['@SP']
+    return None
+
+
+def dead_a_load(out: List[str], commands: List[str], i: int) -> Optional[Tuple[int, List[str]]]:
+    """An A-instruction immediately overwritten by another one has no effect."""
+    if _is_a(commands[i]) and i + 1 < len(commands) and _is_a(commands[i + 1]):
+        return 1, []
+    return None
+
+
+def redundant_a_load(out: List[str], commands: List[str], i: int) -> Optional[Tuple[int, List[str]]]:
+    """Reloading A with the value it already holds, e.g. a repeated @SP, is dropped."""
+    if not _is_a(commands[i]):
+        return None
+    for previous in reversed(out[-_A_LOOKBACK:]):
+        if previous[0] == '(':
+            return None  # Other paths join here, A is unknown
+        if _is_a(previous):
+            return (1, []) if previous == commands[i] else None
+        if 'A' in _split_c(previous)[0]:
+            return None
+    return None
+
+
+def no_op(out: List[str], commands: List[str], i: int) -> Optional[Tuple[int, List[str]]]:
+    """D=D, A=A and M=M without a jump."""
+    if commands[i] in ('D=D', 'A=A', 'M=M'):
+        return 1, []
+    return None
+
+
+def dead_d_write(out: List[str], commands: List[str], i: int) -> Optional[Tuple[int, List[str]]]:
+    """
+    A computation stored only in D, such as D=M, is dead if D is overwritten before being read. Only A-instructions
+    may come in between.
+    """
+    if not _is_c(commands[i]):
+        return None
+    dest, _, jump = _split_c(commands[i])
+    if dest != 'D' or jump:
+        return None
+    for j in range(i + 1, len(commands)):
+        following = commands[j]
+        if _is_a(following):
+            continue
+        if _is_c(following):
+            following_dest, following_comp, _ = _split_c(following)
+            if 'D' in following_dest and 'D' not in following_comp:
+                return 1, []
+        return None
+    return None
+
+
+def goto_next(out: List[str], commands: List[str], i: int) -> Optional[Tuple[int, List[str]]]:
+    """An unconditional jump to the label right after it. A still gets the label address, as on the jump path."""
+    if _is_a(commands[i]) and commands[i + 1:i + 3] == ['0;JMP', f'({commands[i][1:]})']:
+        return 2, [commands[i]]
+    return None
+
+
+RULES = (sp_inc_dec, goto_next, dead_a_load, redundant_a_load, no_op, dead_d_write)
+
+
+def optimize(commands: List[str], line_numbers: Optional[List[int]] = None) -> Tuple[List[str], Counter]:
+    """
+    Applies RULES until none of them matches anymore.
+    :param commands: Sanitized commands, labels included.
+    :param line_numbers: Source line of every command. If given, it's updated in place to match the optimized
+                         commands; the instructions a rule emits get the line of the first instruction it replaced.
+    :return: The optimized commands, and the number of instructions each rule saved.
+    """
+    saved = Counter()
+    lines = line_numbers if line_numbers is not None else [0] * len(commands)
+    changed = True
+    while changed:
+        changed = False
+        out = []
+        out_lines = []
+        i = 0
+        while i < len(commands):
+            for rule in RULES:
+                match = rule(out, commands, i)
+                if match is not None:
+                    length, replacement = match
+                    out.extend(replacement)
+                    out_lines.extend([lines[i]] * len(replacement))
+                    saved[rule.__name__] += length - len(replacement)
+                    i += length
+                    changed = True
+                    break
+            else:
+                out.append(commands[i])
+                out_lines.append(lines[i])
+                i += 1
+        commands = out
+        lines = out_lines
+    if line_numbers is not None:
+        line_numbers[:] = lines
+    return commands, saved
@@ -0,0 +1,57 @@
+"""
+Sidecar map from ROM addresses back to the assembly source.
+
+Stored as <program>.map.json:
+    {"version": 1, "source": "Prog.asm",
+     "lines": [...],              # source line of every instruction, delta-encoded from the previous one
+     "labels": [[address, name], ...]}   # in address order
+
+Labels containing a '$' are left out. The VM translator writes every label inside a function as
+File.function$label, its return addresses and comparison targets as File.function$ret.N and File$true.N, and its
+shared routines as $name. So for its output the labels kept are the function entry points, and label_at attributes
+an address to the function it belongs to. An address in the bootstrap or the shared routines, before the first
+function, has no label.
+"""
+import json
+from bisect import bisect_right
+from itertools import accumulate
+from typing import List, Optional, Tuple
+
+VERSION = 1
+
+
+class SourceMap:
+    def __init__(self, source: str, lines: List[int], labels: List[Tuple[int, str]]):
+        self.source = source
+        self.lines = lines
+        self.labels = labels
+        self._label_addresses = [address for address, _ in labels]
+
+    def line_at(self, address: int) -> int:
+        """The 1-based source line of the instruction at address."""
+        return self.lines[address]
+
+    def label_at(self, address: int) -> Optional[str]:
+        """The nearest label at or before address, or None if there's no label before it."""
+        i = bisect_right(self._label_addresses, address)
+        return self.labels[i - 1][1] if i else None
+
+    def save(self, file_path: str) -> None:
+        deltas = [line - previous for previous, line in zip([0] + self.lines, self.lines)]
+        with open(file_path, 'w') as f:
+            json.dump({'version': VERSION, 'source': self.source, 'lines': deltas, 'labels': self.labels}, f,
+                      separators=(',', ':'))
+
+    @classmethod
+    def load(cls, file_path: str) -> 'SourceMap':
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError(f"{file_path}: unsupported source map version {data.get('version')}")
+        return cls(data['source'], list(accumulate(data['lines'])),
+                   [(address, name) for address, name in data['labels']])
+
+
+def map_path(output_path: str) -> str:
+    """The sidecar map path of an assembled program, e.g. Prog.hack -> Prog.map.json."""
+    return output_path.rsplit('.', 1)[0] + '.map.json'
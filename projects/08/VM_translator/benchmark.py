@@ -0,0 +1,158 @@
+"""
+Instructions executed per VM command, with the generic push/pop templates and with the specialized ones.
+
+First prints the cost of every (command, segment, index) class on its own: each push and pop translates to
+straight-line code, so its instruction count is the number executed. Then runs a generated loop that cycles
+through all the classes on the CPU emulator, until it halts at the END loop, and divides the executed instructions
+by the VM commands it ran.
+
+With --parse N, instead measures parse throughput on a generated corpus of N VM commands: the one-pass parser
+producing VMCommand records, against the previous parser, which re-split and re-classified every command as
+strings.
+
+Usage: python benchmark.py [--iterations N] [--parse N]
+"""
+import argparse
+import io
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from main import MODES, translate_to_string
+from vm_code_writer import CodeWriter
+from vm_parser import Parser, VMCommandType
+from toolchain import run_asm
+
+# (segment, index) classes, each measured as a push and, unless it's a constant, as a pop
+CLASSES = [('constant', 0), ('constant', 1), ('constant', 7), ('local', 0), ('local', 1), ('argument', 2),
+           ('this', 3), ('that', 5), ('local', 9), ('temp', 0), ('temp', 6), ('pointer', 1), ('static', 3)]
+
+
+def command_cost(command: VMCommandType, segment: str, index: int, **writer_options) -> int:
+    """Number of Hack instructions one push/pop translates to."""
+    output = io.StringIO()
+    writer = CodeWriter(output, **writer_options)
+    writer.set_file_name('Bench')
+    start = len(output.getvalue())
+    writer.write_push_pop(command, segment, index)
+    lines = output.getvalue()[start:].splitlines()
+    return sum(1 for line in lines if line.strip() and not line.startswith(('//', '(')))
+
+
+def loop_program(iterations: int) -> str:
+    """Sys.init running every class CLASSES lists, iterations times. Returns the VM code."""
+    body = []
+    for segment, index in CLASSES:
+        body.append(f'push {segment} {index}')
+        body.append(f'pop {"temp 7" if segment == "constant" else f"{segment} {index}"}')
+    return '\n'.join(['function Sys.init 10',
+                      'push constant 3000', 'pop pointer 0', 'push constant 3100', 'pop pointer 1',
+                      f'push constant {iterations}', 'pop local 9',
+                      'label LOOP'] + body +
+                     ['push local 9', 'push constant 1', 'sub', 'pop local 9',
+                      'push local 9', 'if-goto LOOP',
+                      'label END', 'goto END']) + '\n'
+
+
+def loop_commands(iterations: int) -> int:
+    """Number of VM commands the loop program executes before reaching END."""
+    per_iteration = 2 * len(CLASSES) + 6
+    return 6 + iterations * per_iteration
+
+
+def generate_corpus(path: Path, commands: int) -> None:
+    """Writes a .vm file of the given number of commands, in functions of 50 commands, with comments."""
+    rng = random.Random(0)
+    segments = ['local', 'argument', 'this', 'that', 'temp', 'static', 'pointer', 'constant']
+    arithmetic = ['add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not']
+    lines = []
+    for i in range(commands):
+        if i % 50 == 0:
+            lines.append(f'// function {i // 50}')
+            lines.append(f'function Corpus.f{i // 50} 2')
+            continue
+        kind = rng.random()
+        if kind < 0.35:
+            segment = rng.choice(segments)
+            lines.append(f'    push {segment} {rng.randrange(2) if segment == "pointer" else rng.randrange(8)}')
+        elif kind < 0.5:
+            lines.append(f'    pop {rng.choice(segments[:-2])} {rng.randrange(8)}')
+        elif kind < 0.75:
+            lines.append(f'    {rng.choice(arithmetic)}')
+        elif kind < 0.85:
+            lines.append(f'label L{i}')
+        elif kind < 0.9:
+            lines.append(f'    if-goto L{i - i % 50 + 1}  // loop')
+        elif kind < 0.97:
+            lines.append(f'    call Corpus.f{rng.randrange(commands // 50 + 1)} {rng.randrange(4)}')
+        else:
+            lines.append('    return')
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def legacy_parse(vm_file: str) -> list:
+    """The previous parser: every command re-split, classified through getattr, and its arguments kept as strings
+    until the int() at the end."""
+    with open(vm_file, 'r') as f:
+        vm_code = [line.strip().split("//")[0].strip() for line in f.readlines()]
+    parsed = []
+    for command in vm_code:
+        if not command:
+            continue
+        command_parts = command.split()
+        arg1 = arg2 = None
+        if command in ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]:
+            arg1 = command
+            c_type = VMCommandType.C_ARITHMETIC
+        elif command_parts[0].lower() == 'if-goto':
+            c_type = VMCommandType.C_IF
+        else:
+            c_type = getattr(VMCommandType, f'C_{command_parts[0].upper()}')
+        if c_type not in [VMCommandType.C_ARITHMETIC, VMCommandType.C_RETURN]:
+            arg1 = command_parts[1]
+            if c_type in [VMCommandType.C_PUSH, VMCommandType.C_POP, VMCommandType.C_FUNCTION, VMCommandType.C_CALL]:
+                arg2 = command_parts[2]
+        parsed.append((c_type, arg1, int(arg2) if arg2 is not None else None))
+    return parsed
+
+
+def parse_throughput(commands: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        vm_file = Path(directory, 'Corpus.vm')
+        generate_corpus(vm_file, commands)
+        print(f'{commands} commands, {vm_file.stat().st_size / 1e6:.1f} MB')
+        for name, parse in (('legacy parser', legacy_parse), ('one-pass parser', lambda path: Parser(path).commands())):
+            start = time.perf_counter()
+            parsed = parse(str(vm_file))
+            elapsed = time.perf_counter() - start
+            print(f'  {name:16} {elapsed:6.3f}s, {len(parsed) / elapsed:12,.0f} commands/s')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--iterations', type=int, default=2000)
+    arg_parser.add_argument('--parse', type=int, metavar='N', help='benchmark parsing N generated commands instead')
+    args = arg_parser.parse_args()
+
+    if args.parse:
+        parse_throughput(args.parse)
+        raise SystemExit
+
+    print(f'{"command":22} {"generic":>8} {"specialized":>12}')
+    for segment, index in CLASSES:
+        commands = [VMCommandType.C_PUSH] + ([VMCommandType.C_POP] if segment != 'constant' else [])
+        for command in commands:
+            name = f'{"push" if command == VMCommandType.C_PUSH else "pop"} {segment} {index}'
+            print(f'{name:22} {command_cost(command, segment, index):8} '
+                  f'{command_cost(command, segment, index, specialize=True):12}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        vm_file = Path(directory, 'Sys.vm')
+        vm_file.write_text(loop_program(args.iterations))
+        executed = loop_commands(args.iterations)
+        print(f'\nloop of {executed} VM commands:')
+        for mode in ('inline', 'specialized', 'fused', 'fused+specialized'):
+            asm_code = translate_to_string([str(vm_file)], **MODES[mode])
+            cycles = run_asm(asm_code, 10 ** 9).cycles  # Includes the bootstrap call
+            print(f'  {mode:18} {cycles:10} instructions, {cycles / executed:6.2f} per VM command')
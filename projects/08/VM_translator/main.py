@@ -1,51 +1,249 @@
-from vm_parser import Parser, VMCommandType
+from vm_parser import Parser, VMCommand
 from vm_code_writer import CodeWriter
+import vm_cfg
+import vm_linker
+import vm_optimizer
 
+import argparse
+import io
 import sys
+from collections import Counter
+from functools import partial
+from multiprocessing import Pool
 from pathlib import Path, PurePath
 from os.path import isfile, isdir, join
+from typing import List, Set, TextIO, Tuple
 import glob
 
-if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        program_path = sys.argv[1]
-        if isfile(program_path):
-            files = [program_path]
-            output_path = Path(program_path).parent
-        elif isdir(program_path):
-            files = glob.glob(join(program_path, '*.vm'))
-            output_path = program_path
-        else:
-            raise FileNotFoundError("[Errno 2] No such file or directory: ", program_path)
-
-        output_file_name = PurePath(program_path).name.split('.')[0] + '.asm'
-        output_file = Path(output_path, output_file_name)
-        writer = CodeWriter(output_file)
-
-        for i, vm_file in enumerate(files):
-            parser = Parser(vm_file)
-            file_name = PurePath(program_path).name
-            writer.set_file_name(file_name)
-            while parser.has_more_commands():
-                parser.advance()
-                c_type = parser.command_type()
-                if c_type == VMCommandType.C_POP or c_type == VMCommandType.C_PUSH:
-                    writer.write_push_pop(c_type, parser.arg1, parser.arg2)
-                elif c_type == VMCommandType.C_ARITHMETIC:
-                    writer.write_arithmetic(parser.arg1)
-                elif c_type == VMCommandType.C_LABEL:
-                    writer.write_label(parser.arg1)
-                elif c_type == VMCommandType.C_GOTO:
-                    writer.write_goto(parser.arg1)
-                elif c_type == VMCommandType.C_IF:
-                    writer.write_if(parser.arg1)
-                elif c_type == VMCommandType.C_FUNCTION:
-                    writer.write_function(parser.arg1, int(parser.arg2))
-                elif c_type == VMCommandType.C_CALL:
-                    writer.write_call(parser.arg1, int(parser.arg2))
-                elif c_type == VMCommandType.C_RETURN:
-                    writer.write_return()
-        writer.close()
 
+def vm_files(program_path: str) -> List[str]:
+    """The program's .vm files: program_path itself, or every .vm file in the program_path directory, sorted."""
+    if isfile(program_path):
+        return [program_path]
+    elif isdir(program_path):
+        return sorted(glob.glob(join(program_path, '*.vm')))
+    raise FileNotFoundError("[Errno 2] No such file or directory: ", program_path)
+
+
+def parse_program(files: List[str], optimize: bool = False) -> Tuple[vm_linker.Program, Counter]:
+    """
+    Parses the given VM files.
+    :param optimize: Run the VM optimizer and the control-flow cleanup on every file.
+    :return: The (file, commands) pairs in files order, and the number of VM commands each optimizer rule or
+             cleanup removed (empty if not optimizing).
+    """
+    program = []
+    saved = Counter()
+    for vm_file in files:
+        commands = Parser(vm_file).commands()
+        if optimize:
+            commands, file_saved = vm_optimizer.optimize(commands)
+            saved.update(file_saved)
+            commands, file_saved = vm_cfg.optimize(commands)
+            saved.update(file_saved)
+        program.append((vm_file, commands))
+    return program, saved
+
+
+def translate_unit(unit: Tuple[str, List[VMCommand]], writer_options: dict) -> str:
+    """
+    Translates one file of a parsed program on its own, without the bootstrap code. Its static variables, and its
+    labels outside of functions, are named after the file, so units can be translated in any order and
+    concatenated.
+    :param unit: (file path, commands)
+    :return: The file's assembly code.
+    """
+    vm_file, commands = unit
+    output = io.StringIO()
+    writer = CodeWriter(output, bootstrap=False, **writer_options)
+    writer.set_file_name(PurePath(vm_file).stem)
+    writer.write_commands(commands)
+    return output.getvalue()
+
+
+def write_program(program: vm_linker.Program, output: TextIO, jobs: int = 1, **writer_options) -> None:
+    """
+    Translates a parsed program to output: the bootstrap code, then every file in program order. The output is
+    the same for any number of jobs.
+    :param jobs: Number of processes translating files in parallel.
+    """
+    CodeWriter(output, **writer_options)  # Writes the bootstrap code
+    translate_one = partial(translate_unit, writer_options=writer_options)
+    if jobs > 1 and len(program) > 1:
+        with Pool(jobs) as pool:
+            units = pool.map(translate_one, program)
     else:
-        raise TypeError("1 argument is required: program path, 0 arguments entered")
+        units = map(translate_one, program)
+    for unit in units:
+        output.write(unit)
+
+
+def translate(files: List[str], output: TextIO, optimize: bool = False, link: bool = False, jobs: int = 1,
+              **writer_options) -> Counter:
+    """
+    Translates the given VM files, in order, to output.
+    :param optimize: Run the VM optimizer and the control-flow cleanup on every file before translating it.
+    :param link: Translate only the functions reachable from Sys.init.
+    :param jobs: Number of processes translating files in parallel.
+    :return: The number of VM commands each optimizer rule removed, empty if not optimizing.
+    """
+    program, saved = parse_program(files, optimize)
+    if link:
+        program, _ = vm_linker.eliminate_dead_functions(program)
+    write_program(program, output, jobs, **writer_options)
+    return saved
+
+
+def program_to_string(program: vm_linker.Program, **writer_options) -> str:
+    """Translates a parsed program into assembly code, in memory."""
+    output = io.StringIO()
+    write_program(program, output, **writer_options)
+    return output.getvalue()
+
+
+def translate_to_string(files: List[str], optimize: bool = False, link: bool = False, **writer_options) -> str:
+    """Translates the given VM files into assembly code, in memory."""
+    output = io.StringIO()
+    translate(files, output, optimize, link, **writer_options)
+    return output.getvalue()
+
+
+MODES = {'inline': {}, 'compact': {'compact': True}, 'fused': {'fuse': True},
+         'compact+fused': {'compact': True, 'fuse': True}, 'specialized': {'specialize': True},
+         'fused+specialized': {'fuse': True, 'specialize': True}}
+
+
+def report_modes(files: List[str], max_cycles: int, optimize: bool = False, link: bool = False) -> None:
+    """
+    Prints ROM size and cycle count of the program in every code generation mode. Each mode's program runs on the
+    CPU emulator until it halts (see toolchain.run_asm) or max_cycles instructions have executed; the cycle count
+    of a run that didn't halt is only a lower bound, and is marked as such.
+    """
+    from toolchain import assemble, run_asm
+
+    for mode, writer_options in MODES.items():
+        asm_code = translate_to_string(files, optimize, link, **writer_options)
+        rom_size = len(assemble(asm_code))
+        try:
+            cpu = run_asm(asm_code, max_cycles)
+        except ValueError as error:  # Too big for the ROM
+            print(f"{mode:17} ROM: {rom_size:6} words, not run: {error}")
+            continue
+        print(f"{mode:17} ROM: {rom_size:6} words, {cycles_report(cpu)}")
+
+
+def cycles_report(cpu) -> str:
+    if cpu.halted:
+        return f"{cpu.cycles:10} cycles (halted)"
+    return f"{f'>={cpu.cycles}':>10} cycles (budget exhausted, not halted)"
+
+
+def return_address_slots(ram) -> Set[int]:
+    """The stack addresses holding the return address of a call frame, found by following the saved LCLs."""
+    slots = set()
+    frame = ram[1]  # LCL
+    while 256 + 5 <= frame < 2048 and frame - 5 not in slots:
+        slots.add(frame - 5)
+        frame = ram[frame - 4]
+    return slots
+
+
+def verify_optimizer(files: List[str], max_cycles: int, link: bool = False, **writer_options) -> bool:
+    """
+    Runs the program translated with and without the VM optimizer side by side on the CPU emulator, and compares
+    the final RAM of the two. Both run until they halt (see toolchain.run_asm) or max_cycles instructions have
+    executed; if either doesn't halt, the two stopped at unrelated points and RAM isn't compared. Static variables
+    are compared by name, since the assembler may place them differently. The translator's scratch registers
+    R13-R15 and the stack above SP hold leftovers of intermediate values, which the optimizer is free to change,
+    so they aren't compared, and neither are the return addresses in the call frames, which are ROM addresses.
+    :return: True if the two ended with the same RAM.
+    """
+    from toolchain import assemble, run_asm, variable_addresses
+
+    cpus = {}
+    variables = {}
+    for name, optimize in (('original', False), ('optimized', True)):
+        asm_code = translate_to_string(files, optimize, link, **writer_options)
+        cpus[name] = cpu = run_asm(asm_code, max_cycles)
+        variables[name] = variable_addresses(asm_code)
+        print(f"{name:9} ROM: {len(assemble(asm_code)):6} words, {cycles_report(cpu)}")
+
+    if not all(cpu.halted for cpu in cpus.values()):
+        print(f"Not compared: no halt within {max_cycles} cycles, raise --cycles")
+        return False
+    original, optimized = cpus['original'].ram, cpus['optimized'].ram
+    differences = []
+    for variable in sorted(variables['original'].keys() | variables['optimized'].keys()):
+        # A variable the optimizer dropped every reference to still holds its initial 0
+        values = [cpus[name].ram[variables[name][variable]] if variable in variables[name] else 0
+                  for name in ('original', 'optimized')]
+        if values[0] != values[1]:
+            differences.append((variable, *values))
+    ignored_addresses = set(variables['original'].values()) | set(variables['optimized'].values())
+    ignored_addresses |= return_address_slots(original) | return_address_slots(optimized)
+    stack_top = original[0] if original[0] == optimized[0] else 2048  # Compare the whole stack if SP differs
+    differences.extend((f'RAM[{address}]', original[address], optimized[address])
+                       for address in range(len(original)) if original[address] != optimized[address] and
+                       address not in ignored_addresses and not 13 <= address <= 15 and
+                       not stack_top <= address < 2048)
+    if differences:
+        location, original_value, optimized_value = differences[0]
+        print(f"RAM differs at {len(differences)} locations, first at {location}: "
+              f"{original_value} != {optimized_value}")
+        return False
+    print("RAM identical")
+    return True
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='VM translator')
+    arg_parser.add_argument('program_path', help='.vm file, or a directory of .vm files')
+    arg_parser.add_argument('--compact', action='store_true',
+                            help='share one call, return and comparison routine across the program')
+    arg_parser.add_argument('--fuse', action='store_true',
+                            help='translate push/consumer and compare/if-goto sequences as one unit')
+    arg_parser.add_argument('--specialize', action='store_true',
+                            help='use push/pop templates specialized by segment and index')
+    arg_parser.add_argument('-O', '--optimize', action='store_true',
+                            help='fold constants, simplify arithmetic and branches, and clean up control flow '
+                                 'before translating')
+    arg_parser.add_argument('--link', action='store_true',
+                            help='translate only the functions reachable from Sys.init, and report what was dropped')
+    arg_parser.add_argument('--verify', action='store_true',
+                            help='run the program with and without -O on the CPU emulator and compare the final RAM')
+    arg_parser.add_argument('--report', action='store_true',
+                            help='compare ROM size and cycles of the code generation modes on the CPU emulator')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='translate the files of a directory in this many processes')
+    arg_parser.add_argument('--cycles', type=int, default=100_000_000,
+                            help='instruction budget for --report and --verify')
+    args = arg_parser.parse_args()
+
+    program_path = args.program_path
+    files = vm_files(program_path)
+    output_path = Path(program_path).parent if isfile(program_path) else program_path
+    output_file_name = PurePath(program_path).name.split('.')[0] + '.asm'
+    output_file = Path(output_path, output_file_name)
+    writer_options = {'compact': args.compact, 'fuse': args.fuse, 'specialize': args.specialize}
+    program, saved = parse_program(files, args.optimize)
+    if args.optimize:
+        details = ', '.join(f'{rule}: {count}' for rule, count in saved.most_common())
+        print(f"{output_file}: {sum(saved.values())} VM commands saved by the optimizer" +
+              (f" ({details})" if details else ''))
+    if args.link:
+        from toolchain import assemble
+
+        full_program = program
+        program, dropped = vm_linker.eliminate_dead_functions(full_program)
+        full_size = len(assemble(program_to_string(full_program, **writer_options)))
+        linked_size = len(assemble(program_to_string(program, **writer_options)))
+        print(f"{output_file}: {len(dropped)} unreachable functions dropped, "
+              f"{full_size - linked_size} of {full_size} ROM words")
+
+    with open(output_file, 'w') as f:
+        write_program(program, f, args.jobs, **writer_options)
+
+    if args.report:
+        report_modes(files, args.cycles, args.optimize, args.link)
+    if args.verify and not verify_optimizer(files, args.cycles, args.link, **writer_options):
+        sys.exit(1)
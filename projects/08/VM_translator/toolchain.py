@@ -0,0 +1,45 @@
+"""
+Access to the rest of the toolchain, to measure and check translated programs: the assembler of projects/06 and the
+CPU emulator of projects/05.
+"""
+import sys
+from pathlib import Path
+from typing import Dict
+
+_PROJECTS = Path(__file__).resolve().parents[2]
+sys.path.append(str(_PROJECTS / '06'))
+sys.path.append(str(_PROJECTS / '05' / 'cpu_emulator'))
+
+from assembler import Parser as AsmParser, assemble, symbol_dict  # noqa: E402
+from block_compiler import BlockCompiledCPU  # noqa: E402
+from hack_cpu import HackCPU  # noqa: E402
+
+
+HALT_FUNCTION = 'Sys.halt'
+
+
+def run_asm(asm_code: str, max_cycles: int) -> HackCPU:
+    """
+    Assembles asm_code and runs it until it halts or max_cycles instructions have executed. Besides the CPU's own
+    halting instructions, entering Sys.halt halts: the OS implements it as while (true), which translates to a loop
+    of several instructions that the CPU can't tell from any other.
+    """
+    parser = AsmParser(asm_code)
+    program = parser.parse_file()
+    halt_addresses = [parser.symbols[HALT_FUNCTION]] if HALT_FUNCTION in parser.symbols else []
+    cpu = BlockCompiledCPU(program, halt_addresses)
+    cpu.run(max_cycles)
+    return cpu
+
+
+def variable_addresses(asm_code: str) -> Dict[str, int]:
+    """
+    The RAM address the assembler gives every variable of asm_code, that is every static variable of the VM program.
+    Addresses follow the order of first reference, so the same variable may get different addresses in two
+    translations of one program.
+    """
+    parser = AsmParser(asm_code)
+    parser.parse_file()
+    labels = {command[1:-1] for command in parser.commands if command[0] == '('}
+    return {name: address for name, address in parser.symbols.items()
+            if name not in symbol_dict and name not in labels}
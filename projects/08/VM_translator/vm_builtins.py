@@ -0,0 +1,150 @@
+"""
+Native implementations of OS functions, which the VM interpreter can call in place of their VM code.
+
+Each builtin implements the function as written in projects/12, with the same effect on RAM as running its compiled
+VM code: the same return value, the same words written to the heap, static variables and temp 0, with 16-bit
+wraparound and comparisons of the wrapped difference. Only the stack above the returned value differs, where the
+VM code leaves its frame behind. A builtin reads the OS's data structures from RAM, such as the free list of
+Memory.jack and the powers of two table of Math.jack, through the static variables the OS keeps them in.
+
+When the VM code would do something a builtin doesn't reproduce, such as calling Sys.error, recursing without end,
+or reading and writing the SP, LCL, ARG, THIS and THAT registers through a pointer, the builtin returns None without
+touching RAM and the interpreter runs the VM code instead.
+"""
+from array import array
+from typing import Callable, Dict, Optional, Sequence
+
+RAM_SIZE = 32768
+TEMP_BASE = 5
+# Addresses below this one are the SP, LCL, ARG, THIS and THAT registers
+REGISTERS_END = 5
+# Math.divide recurses once per bit of the quotient; deeper than this it recurses forever, dividing by 0
+MAX_DIVIDE_DEPTH = 17
+
+# (ram, arguments, static variable addresses by 'File.index') -> return value, None to run the VM code instead
+Builtin = Callable[[array, Sequence[int], Dict[str, int]], Optional[int]]
+
+BUILTINS: Dict[str, Builtin] = {}
+
+
+def builtin(name: str) -> Callable[[Builtin], Builtin]:
+    """Registers the decorated function as the builtin of the VM function name."""
+    def register(function: Builtin) -> Builtin:
+        BUILTINS[name] = function
+        return function
+    return register
+
+
+def _wrap(value: int) -> int:
+    return ((value + 32768) & 65535) - 32768
+
+
+def _lt(x: int, y: int) -> bool:
+    return _wrap(x - y) < 0
+
+
+def _gt(x: int, y: int) -> bool:
+    return _wrap(x - y) > 0
+
+
+def _touches_registers(*addresses: int) -> bool:
+    return any(0 <= address < REGISTERS_END for address in addresses)
+
+
+def _multiply(ram: array, powers_of_two: int, x: int, y: int) -> Optional[int]:
+    """Math.multiply: adds x shifted left by i for every i where y & powersOfTwo[i] isn't 0."""
+    addresses = [_wrap(powers_of_two + i) for i in range(16)]
+    if _touches_registers(*addresses):
+        return None
+    bits = 0
+    for i, address in enumerate(addresses):
+        if y & ram[address]:
+            bits |= 1 << i
+    return _wrap(x * bits)
+
+
+def _abs(x: int) -> int:
+    return _wrap(-x) if x < 0 else x
+
+
+def _divide(ram: array, powers_of_two: int, x: int, y: int, depth: int = 0) -> Optional[int]:
+    """Math.divide: divides |x| by 2|y| recursively, and doubles the quotient back."""
+    if depth > MAX_DIVIDE_DEPTH:
+        return None
+    negative = (x < 0) != (y < 0)
+    x, y = _abs(x), _abs(y)
+    if _gt(y, x):
+        return 0
+    q = _divide(ram, powers_of_two, x, _wrap(y + y), depth + 1)
+    if q is None:
+        return None
+    two_q = _multiply(ram, powers_of_two, 2, q)
+    product = None if two_q is None else _multiply(ram, powers_of_two, two_q, y)
+    if product is None:
+        return None
+    result = _wrap(q + q) if _lt(_wrap(x - product), y) else _wrap(q + q + 1)
+    return _wrap(-result) if negative else result
+
+
+@builtin('Math.multiply')
+def math_multiply(ram: array, args: Sequence[int], statics: Dict[str, int]) -> Optional[int]:
+    return _multiply(ram, ram[statics['Math.0']], args[0], args[1])
+
+
+@builtin('Math.divide')
+def math_divide(ram: array, args: Sequence[int], statics: Dict[str, int]) -> Optional[int]:
+    return _divide(ram, ram[statics['Math.0']], args[0], args[1])
+
+
+@builtin('Memory.alloc')
+def memory_alloc(ram: array, args: Sequence[int], statics: Dict[str, int]) -> Optional[int]:
+    """
+    Memory.alloc: takes the first block of the free list, whose blocks are [next, length, data...], with a length
+    of at least size. A block whose next is greater than size + 2 is split. The block is marked allocated by
+    setting its next to 0.
+    """
+    size = args[0]
+    current = ram[statics['Memory.2']]  # freeList
+    for _ in range(RAM_SIZE):  # A free list longer than RAM has a cycle; the VM code would loop forever
+        if _touches_registers(current, _wrap(current + 1)):
+            return None
+        if not _lt(ram[_wrap(current + 1)], size):
+            break
+        if ram[current] == -1:
+            return None  # Out of memory, the VM code calls Sys.error
+        current = ram[current]
+    else:
+        return None
+
+    block = _wrap(current + 2)
+    if _gt(ram[current], _wrap(size + 2)):
+        remainder, remainder_length, length = _wrap(size + block), _wrap(_wrap(size + 1) + block), _wrap(1 + current)
+        if _touches_registers(remainder, remainder_length):
+            return None
+        ram[TEMP_BASE] = remainder
+        ram[remainder] = _wrap(ram[current] - size - 2)
+        ram[TEMP_BASE] = remainder_length
+        ram[remainder_length] = ram[length]
+        ram[TEMP_BASE] = length
+        ram[length] = _wrap(block + size)
+    ram[TEMP_BASE] = current
+    ram[current] = 0
+    return block
+
+
+@builtin('String.appendChar')
+def string_append_char(ram: array, args: Sequence[int], statics: Dict[str, int]) -> Optional[int]:
+    """String.appendChar: fields str, currentLen and maxLen. Appends c if the string isn't full, returns this."""
+    this, c = args
+    fields = [_wrap(this + i) for i in range(3)]
+    if _touches_registers(*fields):
+        return None
+    str_, current_len, max_len = fields
+    if _lt(ram[current_len], ram[max_len]):
+        address = _wrap(ram[current_len] + ram[str_])
+        if _touches_registers(address):
+            return None
+        ram[TEMP_BASE] = address
+        ram[address] = c
+        ram[current_len] = _wrap(ram[current_len] + 1)
+    return this
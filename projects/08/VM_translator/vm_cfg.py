@@ -0,0 +1,201 @@
+"""
+Control-flow cleanup of VM functions.
+
+Every function is split into basic blocks at its labels and after every goto, if-goto and return. On the resulting
+control-flow graph:
+- jumps to a block that does nothing but jump on are threaded to the final target,
+- blocks that can't be reached from the function's entry are deleted,
+- blocks are laid out so that a block is followed by its goto target or fallthrough successor where possible,
+  which turns gotos into fallthroughs,
+- gotos to the block right after them are removed, and so are labels nothing jumps to anymore.
+
+A function whose control flow leaves it without a return, or jumps to a label it doesn't define, is left as is.
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from vm_parser import VMCommand, VMCommandType
+from vm_linker import split_functions
+
+_JUMPS = (VMCommandType.C_GOTO, VMCommandType.C_IF)
+_TERMINATORS = (VMCommandType.C_GOTO, VMCommandType.C_IF, VMCommandType.C_RETURN)
+# Prefix of the labels the layout adds. '$' can't appear in VM labels, so these can't collide.
+_LABEL_PREFIX = '$block.'
+
+
+class Block:
+    __slots__ = ('labels', 'body', 'exit', 'next')
+
+    def __init__(self):
+        self.labels: List[str] = []
+        self.body: List[VMCommand] = []
+        self.exit: Optional[VMCommand] = None  # The goto, if-goto or return ending the block, None if it falls through
+        self.next: Optional[int] = None  # Index of the block after this one in the original order
+
+    def falls_through(self) -> bool:
+        return self.exit is None or self.exit.type == VMCommandType.C_IF
+
+    def successors(self, block_of: Dict[str, int]) -> List[int]:
+        successors = []
+        if self.exit is not None and self.exit.type in _JUMPS:
+            successors.append(block_of[self.exit.arg1])
+        if self.falls_through() and self.next is not None:
+            successors.append(self.next)
+        return successors
+
+
+def split_blocks(commands: List[VMCommand]) -> List[Block]:
+    """Splits the body of a function, without its function command, into basic blocks."""
+    blocks = [Block()]
+    for command in commands:
+        current = blocks[-1]
+        if command.type == VMCommandType.C_LABEL:
+            if current.body or current.exit is not None:
+                current = Block()
+                blocks.append(current)
+            current.labels.append(command.arg1)
+        elif current.exit is not None:
+            current = Block()
+            blocks.append(current)
+            current.body.append(command)
+        else:
+            current.body.append(command)
+        if command.type in _TERMINATORS:
+            current.body.pop()
+            current.exit = command
+    for i, block in enumerate(blocks[:-1]):
+        block.next = i + 1
+    return blocks
+
+
+def _thread(blocks: List[Block], block_of: Dict[str, int], label: str) -> str:
+    """The label a jump to label ends up at, following blocks that only jump on. Stops at cycles."""
+    seen = {label}
+    while True:
+        block = blocks[block_of[label]]
+        if block.body:
+            return label
+        if block.exit is not None and block.exit.type == VMCommandType.C_GOTO:
+            target = block.exit.arg1
+        elif block.exit is None and block.next is not None and blocks[block.next].labels:
+            target = blocks[block.next].labels[0]
+        else:
+            return label
+        if target in seen:
+            return label
+        seen.add(target)
+        label = target
+
+
+def _reachable(blocks: List[Block], block_of: Dict[str, int]) -> List[bool]:
+    reached = [False] * len(blocks)
+    reached[0] = True
+    pending = [0]
+    while pending:
+        for successor in blocks[pending.pop()].successors(block_of):
+            if not reached[successor]:
+                reached[successor] = True
+                pending.append(successor)
+    return reached
+
+
+def _layout(blocks: List[Block], block_of: Dict[str, int], reached: List[bool]) -> List[int]:
+    """
+    Orders the reachable blocks, entry first. After each block comes its fallthrough successor, or its goto target,
+    if that one isn't placed yet; otherwise the first unplaced block in the original order.
+    """
+    order = []
+    placed = [not is_reached for is_reached in reached]
+    current = 0
+    while current is not None:
+        order.append(current)
+        placed[current] = True
+        block = blocks[current]
+        preferred = None
+        if block.falls_through():
+            preferred = block.next
+        elif block.exit.type == VMCommandType.C_GOTO:
+            preferred = block_of[block.exit.arg1]
+        if preferred is None or placed[preferred]:
+            preferred = next((i for i, is_placed in enumerate(placed) if not is_placed), None)
+        current = preferred
+    return order
+
+
+def optimize_function(function: VMCommand, commands: List[VMCommand]) -> Tuple[List[VMCommand], Counter]:
+    """
+    Cleans up the control flow of one function.
+    :param function: The function command.
+    :param commands: The rest of the function's commands.
+    :return: The function's new commands, function command included, and the number of VM commands removed per
+             kind of cleanup.
+    """
+    saved = Counter()
+    blocks = split_blocks(commands)
+    block_of = {label: i for i, block in enumerate(blocks) for label in block.labels}
+    if any(block.exit is not None and block.exit.type in _JUMPS and block.exit.arg1 not in block_of
+           for block in blocks):
+        return [function] + commands, saved
+
+    for block in blocks:
+        if block.exit is not None and block.exit.type in _JUMPS:
+            block.exit = VMCommand(block.exit.type, _thread(blocks, block_of, block.exit.arg1))
+
+    reached = _reachable(blocks, block_of)
+    if any(reached[i] and block.falls_through() and block.next is None for i, block in enumerate(blocks)):
+        return [function] + commands, saved  # Runs into whatever follows the function
+    for i, block in enumerate(blocks):
+        if not reached[i]:
+            saved['unreachable_block'] += len(block.labels) + len(block.body) + (block.exit is not None)
+
+    order = _layout(blocks, block_of, reached)
+    # Labels the laid out code still needs: jump targets, and fallthrough successors that no longer come next
+    successors = {}
+    for position, i in enumerate(order):
+        block = blocks[i]
+        following = order[position + 1] if position + 1 < len(order) else None
+        if block.falls_through() and block.next != following:
+            if not blocks[block.next].labels:
+                blocks[block.next].labels.append(f'{_LABEL_PREFIX}{block.next}')
+            successors[i] = blocks[block.next].labels[0]
+        if block.exit is not None and block.exit.type == VMCommandType.C_GOTO and \
+                block_of.get(block.exit.arg1) == following:
+            block.exit = None
+            saved['fallthrough_goto'] += 1
+    used_labels = {block.exit.arg1 for i, block in enumerate(blocks)
+                   if reached[i] and block.exit is not None and block.exit.type in _JUMPS}
+    used_labels.update(successors.values())
+
+    optimized = [function]
+    for i in order:
+        block = blocks[i]
+        for label in block.labels:
+            if label in used_labels:
+                optimized.append(VMCommand(VMCommandType.C_LABEL, label))
+            else:
+                saved['unused_label'] += 1
+        optimized.extend(block.body)
+        if block.exit is not None:
+            optimized.append(block.exit)
+        if i in successors:
+            optimized.append(VMCommand(VMCommandType.C_GOTO, successors[i]))
+            saved['fallthrough_goto'] -= 1
+    return optimized, saved
+
+
+def optimize(commands: List[VMCommand]) -> Tuple[List[VMCommand], Counter]:
+    """
+    Cleans up the control flow of every function in a file's commands. Commands before the first function are kept
+    as they are.
+    :return: The optimized commands, and the number of VM commands removed per kind of cleanup.
+    """
+    saved = Counter()
+    optimized = []
+    for name, body in split_functions(commands):
+        if name is None:
+            optimized.extend(body)
+            continue
+        function_commands, function_saved = optimize_function(body[0], body[1:])
+        optimized.extend(function_commands)
+        saved.update(function_saved)  # Not +=, which drops the negative counts
+    return optimized, saved
@@ -1,17 +1,53 @@
-from vm_parser import VMCommandType
+from vm_parser import VMCommand, VMCommandType
 from functools import singledispatchmethod
-from datetime import datetime as dt
+from os import PathLike
+from typing import List, Optional, TextIO, Union
 
 
 class CodeWriter:
     memory_prefixes = {"local": "LCL", "argument": "ARG", "this": "THIS", "that": "THAT"}
-
-    def __init__(self, file_name: str):
-        self.output_file = open(file_name, 'w+')
-        self._file_name = file_name
+    comparison_jumps = {'eq': 'JEQ', 'gt': 'JGT', 'lt': 'JLT'}
+    negated_jumps = {'JEQ': 'JNE', 'JGT': 'JLE', 'JLT': 'JGE'}
+    binary_comps = {'add': 'M+D', 'sub': 'M-D', 'and': 'D&M', 'or': 'D|M'}
+
+    # Specialized templates. Constants the ALU can produce on its own:
+    constant_templates = {0: ['D=0'], 1: ['D=1'], -1: ['D=-1']}
+    # Largest index of local/argument/this/that reached by stepping A from the base (A=M, A=M+1, A=A+1...) rather
+    # than by adding the index in D. Above it the generic form is shorter.
+    max_walk_index = {'push': 3, 'pop': 6}
+    temp_base = 5
+
+    # Shared routines of the compact mode. Labels starting with '$' can't collide with VM names.
+    CALL_ROUTINE = '$call'
+    RETURN_ROUTINE = '$return'
+
+    def __init__(self, file_name: Union[str, PathLike, TextIO], compact: bool = False, fuse: bool = False,
+                 specialize: bool = False, bootstrap: bool = True):
+        """
+        :param file_name: Output .asm path, or an open text stream to write to.
+        :param compact: Emit call, return, eq, gt and lt as jumps to routines shared by the whole program, instead
+                        of expanding them at every use. Saves ROM at the cost of a few extra cycles per use.
+        :param fuse: In write_commands, translate common command sequences (a push followed by its consumer, a
+                     comparison followed by if-goto) as one unit, and reuse the stack top while it's still in D.
+        :param specialize: Pick push/pop templates by segment and index: constant temp addresses, A=M+1 steps for
+                           small indices, D=0/D=1/D=-1 for tiny constants, and shorter stack pointer updates.
+        :param bootstrap: Start with the bootstrap code (and the shared routines of the compact mode). Without it,
+                          the output is a translation unit to append to the output of a writer that has it.
+        """
+        if isinstance(file_name, (str, PathLike)):
+            self.output_file = open(file_name, 'w+')
+        else:
+            self.output_file = file_name
+        self._file_name = ''
+        self._function_name = ''
         self._bool_counter = 0
         self._call_counter = 0
-        self.write_init()
+        self.compact = compact
+        self.fuse = fuse
+        self.specialize = specialize
+        self._top_in_d = False  # D holds the value on top of the stack
+        if bootstrap:
+            self.write_init()
 
     def set_file_name(self, file_name: str) -> None:
         """
@@ -20,11 +56,52 @@ class CodeWriter:
         :return: None
         """
         self._file_name = file_name
+        self._function_name = ''
         self._write(f'// Current file is: {file_name}')
 
     def write_init(self):
         self._write(['@256', 'D=A', '@SP', 'M=D'])
         self.write_call('Sys.init', 0)
+        if self.compact:
+            self._write_shared_routines()
+
+    def write_commands(self, commands: List[VMCommand]) -> None:
+        """
+        Writes the assembly code of a parsed command list, as returned by Parser.commands.
+        :return: None
+        """
+        i = 0
+        while i < len(commands):
+            if self.fuse:
+                fused = self._write_fused(commands, i)
+                if fused:
+                    i += fused
+                    continue
+            command = commands[i]
+            self.write_command(command.type, command.arg1, command.arg2)
+            i += 1
+
+    def write_command(self, c_type: VMCommandType, arg1: Optional[str], arg2: Optional[int]) -> None:
+        """
+        Writes the assembly code of a single parsed command.
+        :return: None
+        """
+        if c_type == VMCommandType.C_POP or c_type == VMCommandType.C_PUSH:
+            self.write_push_pop(c_type, arg1, arg2)
+        elif c_type == VMCommandType.C_ARITHMETIC:
+            self.write_arithmetic(arg1)
+        elif c_type == VMCommandType.C_LABEL:
+            self.write_label(arg1)
+        elif c_type == VMCommandType.C_GOTO:
+            self.write_goto(arg1)
+        elif c_type == VMCommandType.C_IF:
+            self.write_if(arg1)
+        elif c_type == VMCommandType.C_FUNCTION:
+            self.write_function(arg1, arg2)
+        elif c_type == VMCommandType.C_CALL:
+            self.write_call(arg1, arg2)
+        elif c_type == VMCommandType.C_RETURN:
+            self.write_return()
 
     def write_arithmetic(self, command: str) -> None:
         """
@@ -33,30 +110,36 @@ class CodeWriter:
         :return: None
         """
         self._write(f"//{command}\n")
+        top_in_d = self._take_top_in_d()
         if command in ['neg', 'not']:
-            self._write(self._decrement_sp())
+            self._write(['@SP', 'A=M-1'])
+        elif command in CodeWriter.comparison_jumps and self.compact:
+            ret_addr = self._next_return_label()
+            self._write([f'@{ret_addr}', 'D=A', f'@${command}', '0;JMP', f'({ret_addr})'])
+            return
         else:
-            self._pop_stack_to_d()
+            self._pop_stack_to_d(top_in_d)
 
         if command == 'add':
             self._write(['A=A-1', 'M=M+D'])
         elif command == 'sub':
             self._write(['A=A-1', 'M=M-D'])
         elif command == 'neg':
-            self._write(['A=M', 'M=-M'])
-        elif command in ['eq', 'gt', 'lt']:
+            self._write('M=-M')
+        elif command in CodeWriter.comparison_jumps:
             # -1 = True, 0 = False
-            self._write(['A=A-1', 'D=M-D', 'M=-1', f"@EQ-{self._bool_counter}"])
-            self._write(f'D;J{command.upper()}')  # JEQ / JGT / JLT
-            self._write(self.go_to_sp_addr())
-            self._write(['A=A-1', 'M=0', f"(@{command.upper()}-{self._bool_counter})"])
+            true_label = f'{self._file_name}$true.{self._bool_counter}'
             self._bool_counter += 1
+            self._write(['A=A-1', 'D=M-D', 'M=-1', f'@{true_label}'])
+            self._write(f'D;{CodeWriter.comparison_jumps[command]}')
+            self._write(self.go_to_sp_addr())
+            self._write(['A=A-1', 'M=0', f'({true_label})'])
         elif command == 'and':
             self._write(['A=A-1', 'M=D&M'])
         elif command == 'or':
             self._write(['A=A-1', 'M=D|M'])
         elif command == 'not':
-            self._write(['A=M', 'M=!M'])
+            self._write('M=!M')
         else:
             raise ValueError(f"{command} command is unsupported.")
 
@@ -69,52 +152,176 @@ class CodeWriter:
         :param index: Memory segment index to operate on.
         :return: None
         """
-        index = str(index)
         self._write(f"//{command.name} {segment} {index}")
+        top_in_d = self._take_top_in_d()
         if command == VMCommandType.C_PUSH:
-
-            if segment in ['local', 'argument', 'this', 'that']:
-                self._write([f"@{CodeWriter.memory_prefixes[segment]}", "D=M", f"@{index}",
-                             "A=A+D", "D=M"])
-            elif segment == "constant":
-                self._write([f"@{index}", "D=M"])
-            elif segment == "temp":
-                self._write(['@5', 'D=A', f'@{index}', 'A=A+D', 'D=M'])
-            elif segment == 'static':
-                self._write([f'@{self._file_name}.{index}', 'D=M'])
-            elif segment == 'pointer':
-                pointer = 'THAT' if index else 'THIS'  # index 0 = THIS, index 1 = THAT
-                self._write([f'@{pointer}', 'D=A'])
-            else:
-                raise ValueError(f"{segment} is unsupported.")
-
+            self._write(self._segment_to_d(segment, index))
             self._push_d_to_stack()
+            self._top_in_d = self.fuse
 
         elif command == VMCommandType.C_POP:
-            if segment in ['local', 'argument', 'this', 'that']:
-                self._write([f"@{CodeWriter.memory_prefixes[segment]}", "D=M", f"@{index}",
-                             "A=A+D", "D=M"])
-            elif segment == "temp":
-                self._write(['@5', 'D=A', f'@{index}', 'A=A+D', 'D=M'])
-            elif segment == 'static':
-                self._write([f'@{self._file_name}.{index}', 'D=M'])
-            elif segment == 'pointer':
-                pointer = 'THAT' if index else 'THIS'  # index 0 = THIS, index 1 = THAT
-                self._write([f'@{pointer}', 'D=A'])
+            direct_address = self._direct_address(segment, index)
+            if direct_address:
+                self._pop_stack_to_d(top_in_d)
+                self._write([f'@{direct_address}', 'M=D'])
+            elif self._can_walk(segment, index, 'pop'):
+                self._pop_stack_to_d(top_in_d)
+                self._write(self._walk_to(segment, index) + ['M=D'])
             else:
-                raise ValueError(f"{segment} is unsupported.")
-
-            self._pop_stack_to_d()
+                # The target address goes to R13, then the popped value is stored through it
+                self._write(self._segment_address_to_d(segment, index))
+                self._write(['@R13', 'M=D'])
+                self._pop_stack_to_d()
+                self._write(['@R13', 'A=M', 'M=D'])
 
         else:
             raise ValueError(f"{command} is unsupported. Only C_PUSH and C_POP commands are allowed")
 
+    def _segment_to_d(self, segment: str, index: int) -> List[str]:
+        """Assembly code that loads segment[index] into D."""
+        if segment in ['local', 'argument', 'this', 'that']:
+            if self._can_walk(segment, index, 'push'):
+                return self._walk_to(segment, index) + ['D=M']
+            return [f"@{CodeWriter.memory_prefixes[segment]}", "D=M", f"@{index}", "A=A+D", "D=M"]
+        elif segment == "constant":
+            if self.specialize and index in CodeWriter.constant_templates:
+                return CodeWriter.constant_templates[index]
+            elif index == -32768:
+                return ['@32767', 'D=!A']
+            elif index < 0:  # Only folded constants are negative, see vm_optimizer
+                return [f"@{-index}", "D=-A"]
+            return [f"@{index}", "D=A"]
+        elif segment == "temp" and not self.specialize:
+            return ['@5', 'D=A', f'@{index}', 'A=A+D', 'D=M']
+        elif segment in ['static', 'pointer', 'temp']:
+            return [f'@{self._direct_address(segment, index)}', 'D=M']
+        raise ValueError(f"{segment} is unsupported.")
+
+    def _segment_address_to_d(self, segment: str, index: int) -> List[str]:
+        """Assembly code that loads the address of segment[index] into D."""
+        if segment in ['local', 'argument', 'this', 'that']:
+            return [f"@{CodeWriter.memory_prefixes[segment]}", "D=M", f"@{index}", "D=A+D"]
+        elif segment == "temp":
+            return ['@5', 'D=A', f'@{index}', 'D=A+D']
+        elif segment in ['static', 'pointer']:
+            return [f'@{self._direct_address(segment, index)}', 'D=A']
+        raise ValueError(f"{segment} is unsupported.")
+
+    def _direct_address(self, segment: str, index: int) -> Optional[str]:
+        """The symbol of segment[index] when it's known at translation time, None otherwise."""
+        if segment == 'static':
+            return f'{self._file_name}.{index}'
+        elif segment == 'pointer':
+            return 'THAT' if index == 1 else 'THIS'  # index 0 = THIS, index 1 = THAT
+        elif segment == 'temp' and self.specialize:
+            return str(CodeWriter.temp_base + index)
+        return None
+
+    def _can_walk(self, segment: str, index: int, command: str) -> bool:
+        """Whether segment[index] is reached with _walk_to when specializing the given command (push or pop)."""
+        return self.specialize and segment in CodeWriter.memory_prefixes and \
+            index <= CodeWriter.max_walk_index[command]
+
+    @staticmethod
+    def _walk_to(segment: str, index: int) -> List[str]:
+        """Assembly code that points A at segment[index] without touching D."""
+        base = f"@{CodeWriter.memory_prefixes[segment]}"
+        if index == 0:
+            return [base, 'A=M']
+        return [base, 'A=M+1'] + ['A=A+1'] * (index - 1)
+
+    def _write_fused(self, commands: List[VMCommand], i: int) -> int:
+        """
+        Writes the commands starting at commands[i] as one unit, if they form a sequence that can be fused.
+        :return: The number of commands written, 0 if there's nothing to fuse at i.
+        """
+        condition = self._match_condition(commands, i)
+        if condition:
+            return condition
+
+        command = commands[i]
+        if command.type != VMCommandType.C_PUSH or i + 1 >= len(commands):
+            return 0
+        segment, index = command.arg1, command.arg2
+        next_command = commands[i + 1]
+        next_type, next_arg1, next_arg2 = next_command.type, next_command.arg1, next_command.arg2
+        self._take_top_in_d()
+
+        if next_type == VMCommandType.C_ARITHMETIC and next_arg1 in CodeWriter.binary_comps:
+            # push x; op  ->  *(SP-1) = *(SP-1) op x, the result also stays in D
+            self._write(f'//push {segment} {index}; {next_arg1}')
+            if segment == 'constant' and index == 1 and next_arg1 in ('add', 'sub'):
+                self._write(['@SP', 'A=M-1', 'MD=M+1' if next_arg1 == 'add' else 'MD=M-1'])
+            else:
+                self._write(self._segment_to_d(segment, index))
+                self._write(['@SP', 'A=M-1', f'MD={CodeWriter.binary_comps[next_arg1]}'])
+            self._top_in_d = True
+            return 2
+
+        if next_type == VMCommandType.C_POP:
+            # push x; pop y  ->  y = x, the stack is untouched
+            self._write(f'//push {segment} {index}; pop {next_arg1} {next_arg2}')
+            direct_address = self._direct_address(next_arg1, next_arg2)
+            if direct_address:
+                self._write(self._segment_to_d(segment, index))
+                self._write([f'@{direct_address}', 'M=D'])
+            else:
+                self._write(self._segment_address_to_d(next_arg1, next_arg2))
+                self._write(['@R13', 'M=D'])
+                self._write(self._segment_to_d(segment, index))
+                self._write(['@R13', 'A=M', 'M=D'])
+            return 2
+
+        if next_type == VMCommandType.C_IF:
+            # push x; if-goto L  ->  jump if x != 0
+            self._write(f'//push {segment} {index}; if-goto {next_arg1}')
+            self._write(self._segment_to_d(segment, index))
+            self._write([f'@{self._label_scope()}${next_arg1}', 'D;JNE'])
+            return 2
+
+        return 0
+
+    def _match_condition(self, commands: List[VMCommand], i: int) -> int:
+        """
+        Fuses [push x;] eq|gt|lt; [not;] if-goto L into a single conditional jump on x - y, without materializing
+        the boolean.
+        :return: The number of commands written, 0 if there's no such sequence at i.
+        """
+        j = i
+        pushed = None
+        if commands[j].type == VMCommandType.C_PUSH:
+            pushed = commands[j]
+            j += 1
+        if j >= len(commands) or commands[j].type != VMCommandType.C_ARITHMETIC or \
+                commands[j].arg1 not in CodeWriter.comparison_jumps:
+            return 0
+        jump = CodeWriter.comparison_jumps[commands[j].arg1]
+        j += 1
+        if j < len(commands) and commands[j].type == VMCommandType.C_ARITHMETIC and commands[j].arg1 == 'not':
+            jump = CodeWriter.negated_jumps[jump]
+            j += 1
+        if j >= len(commands) or commands[j].type != VMCommandType.C_IF:
+            return 0
+
+        label = commands[j].arg1
+        top_in_d = self._take_top_in_d()
+        self._write('//' + '; '.join(str(command) for command in commands[i:j + 1]))
+        if pushed:  # y is only in D
+            self._write(self._segment_to_d(pushed.arg1, pushed.arg2))
+            self._write(['@SP', 'AM=M-1', 'D=M-D'])
+        else:
+            self._pop_stack_to_d(top_in_d)
+            self._write(['@SP', 'AM=M-1', 'D=M-D'])
+        self._write([f'@{self._label_scope()}${label}', f'D;{jump}'])
+        return j + 1 - i
+
     def write_label(self, label: str) -> None:
         """
         Writes assembly code that effects the label command
         :return: None
         """
-        self._write(f'({self._file_name}${label})')
+        self._take_top_in_d()  # Other paths join here
+        self._write(f'({self._label_scope()}${label})')
 
     def write_goto(self, label: str) -> None:
         """
@@ -122,7 +329,8 @@ class CodeWriter:
         :param label: label to go to
         :return: None
         """
-        self._write(f'@{self._file_name}${label}')
+        self._take_top_in_d()
+        self._write(f'@{self._label_scope()}${label}')
         self._write('0;JMP')
 
     def write_if(self, label: str) -> None:
@@ -131,8 +339,8 @@ class CodeWriter:
         command just after label.
         :return: None
         """
-        self._pop_stack_to_d()
-        self._write(f'@{self._file_name}${label}')
+        self._pop_stack_to_d(self._take_top_in_d())
+        self._write(f'@{self._label_scope()}${label}')
         self._write('D;JNE')
 
     def write_call(self, function_name: str, num_args: int) -> None:
@@ -142,8 +350,13 @@ class CodeWriter:
         :param num_args: The amount of arguments that have been pushed onto the stack
         :return: None
         """
-        ret_addr = function_name+f'&ret.{self._call_counter}'  # Unique return address
-        self._call_counter += 1
+        self._take_top_in_d()
+        ret_addr = self._next_return_label()
+        if self.compact:  # Function address in R13, number of arguments in R14, return address in D
+            self._write([f'@{function_name}', 'D=A', '@R13', 'M=D', f'@{num_args}', 'D=A', '@R14', 'M=D',
+                         f'@{ret_addr}', 'D=A', f'@{CodeWriter.CALL_ROUTINE}', '0;JMP', f'({ret_addr})'])
+            return
+
         self._write([f'@{ret_addr}', 'D=A'])
         self._push_d_to_stack()  # Push return address to stack
 
@@ -152,11 +365,11 @@ class CodeWriter:
             self._push_d_to_stack()
 
         self._write(['@SP', 'D=M', f'@{CodeWriter.memory_prefixes["local"]}', 'M=D'])  # LCL = SP
-        self._write([f'@{5+num_args}', 'D=D-A', f'@{CodeWriter.memory_prefixes["argument"]}', 'M=D'])  # LCL = SP,
+        self._write([f'@{5+num_args}', 'D=D-A', f'@{CodeWriter.memory_prefixes["argument"]}', 'M=D'])  # ARG = SP-5-n,
         # can be done because at this point D is already SP.
 
-        self.write_goto(function_name)
-        self.write_label(ret_addr)
+        self._write([f'@{function_name}', '0;JMP'])
+        self._write(f'({ret_addr})')
 
     def write_function(self, function_name: str, num_variables: int) -> None:
         """
@@ -165,7 +378,9 @@ class CodeWriter:
         :param num_variables: The amount of the function's local variables
         :return: None
         """
-        self.write_label(function_name)
+        self._take_top_in_d()
+        self._function_name = function_name
+        self._write(f'({function_name})')
         for _ in range(num_variables):
             self._write('D=0')
             self._push_d_to_stack()
@@ -176,22 +391,61 @@ class CodeWriter:
         the caller's return address.
         :return: None
         """
+        self._take_top_in_d()
+        if self.compact:
+            self._write([f'@{CodeWriter.RETURN_ROUTINE}', '0;JMP'])
+        else:
+            self._write_return_body()
+
+    def _write_return_body(self) -> None:
         end_frame = 'R13'
         ret_address = 'R14'
 
         self._write(['@'+CodeWriter.memory_prefixes["local"], "D=M", '@'+end_frame, "M=D"])  # end_frame = LCL
-        self._write(['@5', 'D=D-A', 'A=D', 'D=M', '@'+ret_address, 'M=D'])  # get the caller's return
+        self._write(['@5', 'A=D-A', 'D=M', '@'+ret_address, 'M=D'])  # get the caller's return
         # address and save it in ret_address
         self._pop_stack_to_d()
         self._write(['@'+CodeWriter.memory_prefixes['argument'], 'A=M', 'M=D'])  # *ARG = pop()
-        self._write(['@'+CodeWriter.memory_prefixes['argument'], 'D=M', '@SP', 'M=D'])  # SP = ARG + 1
+        self._write(['@'+CodeWriter.memory_prefixes['argument'], 'D=M+1', '@SP', 'M=D'])  # SP = ARG + 1
 
-        for i, addr in enumerate(['@THAT', '@THIS', '@ARG', '@LCL']):  # Restores THAT, THIS, ARG and LCL of the caller
-            self._write(['@' + end_frame, 'D=M'])
-            self._write([f'@{i+1}', 'D=D-A', addr, 'D=M'])
+        for addr in ['@THAT', '@THIS', '@ARG', '@LCL']:  # Restores THAT, THIS, ARG and LCL of the caller
+            self._write(['@' + end_frame, 'AM=M-1', 'D=M', addr, 'M=D'])
 
         self._write(['@'+ret_address, 'A=M', '0;JMP'])  # goto ret_address
 
+    def _write_shared_routines(self) -> None:
+        """Emits the routines the compact mode jumps to, once per program."""
+        # $call: D = return address, R13 = function address, R14 = number of arguments
+        self._write(f'({CodeWriter.CALL_ROUTINE})')
+        self._push_d_to_stack()
+        for addr in CodeWriter.memory_prefixes.values():
+            self._write([f'@{addr}', 'D=M'])
+            self._push_d_to_stack()
+        self._write(['@SP', 'D=M', '@LCL', 'M=D'])  # LCL = SP
+        self._write(['@R14', 'D=D-M', '@5', 'D=D-A', '@ARG', 'M=D'])  # ARG = SP - 5 - nArgs
+        self._write(['@R13', 'A=M', '0;JMP'])
+
+        self._write(f'({CodeWriter.RETURN_ROUTINE})')
+        self._write_return_body()
+
+        # $eq, $gt, $lt: D = return address
+        for command, jump in CodeWriter.comparison_jumps.items():
+            self._write([f'(${command})', '@R15', 'M=D'])
+            self._pop_stack_to_d()
+            self._write(['A=A-1', 'D=M-D', 'M=-1', f'@${command}.true', f'D;{jump}'])
+            self._write(self.go_to_sp_addr())
+            self._write(['A=A-1', 'M=0', f'(${command}.true)', '@R15', 'A=M', '0;JMP'])
+
+    def _label_scope(self) -> str:
+        """Prefix of the labels of the current function, or of the current file outside of functions"""
+        return self._function_name or self._file_name
+
+    def _next_return_label(self) -> str:
+        """Unique return address label, scoped by the current function"""
+        ret_addr = f'{self._label_scope()}$ret.{self._call_counter}'
+        self._call_counter += 1
+        return ret_addr
+
     @singledispatchmethod
     def _write(self, message) -> None:
         print("1")
@@ -208,13 +462,30 @@ class CodeWriter:
 
     def _push_d_to_stack(self) -> None:
         """Push from D onto top of stack, increment @SP"""
+        if self.specialize:
+            self._write(['@SP', 'M=M+1', 'A=M-1', 'M=D'])
+            return
         self._write(self._update_sp_value())
         self._write(self._increment_sp())
 
-    def _pop_stack_to_d(self) -> None:
-        """Decrement @SP, pop from top of stack onto D"""
-        self._write(self._decrement_sp())
-        self._write(['A=M', 'D=M'])
+    def _pop_stack_to_d(self, top_in_d: bool = False) -> None:
+        """
+        Decrement @SP, pop from top of stack onto D. Leaves A = SP.
+        :param top_in_d: D already holds the top of the stack, only SP has to move.
+        """
+        if top_in_d:
+            self._write(['@SP', 'AM=M-1'])
+        elif self.specialize:
+            self._write(['@SP', 'AM=M-1', 'D=M'])
+        else:
+            self._write(self._decrement_sp())
+            self._write(['A=M', 'D=M'])
+
+    def _take_top_in_d(self) -> bool:
+        """Returns whether D holds the top of the stack, and forgets it: the caller is about to change D."""
+        top_in_d = self._top_in_d
+        self._top_in_d = False
+        return top_in_d
 
     @staticmethod
     def _increment_sp() -> str:
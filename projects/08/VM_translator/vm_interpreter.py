@@ -0,0 +1,504 @@
+"""
+Headless VM interpreter: runs parsed VM programs directly, without translating and assembling them.
+
+Memory is a flat RAM of 32768 int16 words laid out as on the Hack platform: SP, LCL, ARG, THIS and THAT in RAM[0..4],
+temp in RAM[5..12], static variables from RAM[16] in order of first reference, the stack from RAM[256]. Calls build
+the same frame as the translated code (return address, LCL, ARG, THIS, THAT), so programs that inspect the stack
+or the heap see what they'd see on the CPU emulator. Arithmetic wraps to 16 bits, and eq/gt/lt test the wrapped
+difference x - y, as the translated code does.
+
+Every command is decoded once into a handler, picked from a dispatch table by opcode and segment, and its operand:
+an int, a RAM address or a command index. The run loop only fetches and calls. Labels aren't commands; they resolve
+to the index of the command after them.
+
+Execution stops when the entry function returns, when Sys.halt is called (the OS implements it as an endless loop),
+at a goto that jumps to itself, or when the instruction budget runs out.
+
+Calls to the OS functions vm_builtins implements can run natively instead, one switch per function. With
+check_natives, every such call runs both ways, and the RAM the VM code leaves is compared with what the builtin
+leaves. The VM code of a checked call counts against the instruction budget like any other command.
+"""
+import argparse
+import time
+from array import array
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from vm_builtins import BUILTINS
+from vm_linker import Program
+from vm_parser import VMCommand, VMCommandType
+
+RAM_SIZE = 32768
+STACK_BASE = 256
+STATIC_BASE = 16
+STACK_END = 2048
+HEAP_END = 16384  # The screen memory map follows
+TEMP_BASE = 5
+SP, LCL, ARG, THIS, THAT = range(5)
+ENTRY_POINT = 'Sys.init'
+HALT_FUNCTION = 'Sys.halt'
+
+# (ram, operand, index of the command) -> index of the next command
+Handler = Callable[[array, object, int], int]
+
+
+class Halt(Exception):
+    """Raised by the handlers that stop execution. Carries the index of the command that raised it."""
+    def __init__(self, pc: int):
+        super().__init__(pc)
+        self.pc = pc
+
+
+class VMError(Exception):
+    pass
+
+
+class _BudgetExhausted(Exception):
+    """Raised when the budget runs out in the VM code of a checked native call, at the index of its next command."""
+    def __init__(self, pc: int):
+        super().__init__(pc)
+        self.pc = pc
+
+
+class _WriteLog:
+    """
+    RAM as a builtin sees it when its call is checked: reads fall through to RAM, writes are only recorded, by
+    address. Addresses wrap like array indexes do, so a negative one is counted from the end of RAM.
+    """
+    __slots__ = ('ram', 'writes')
+
+    def __init__(self, ram: array):
+        self.ram = ram
+        self.writes: Dict[int, int] = {}
+
+    def __getitem__(self, address: int) -> int:
+        address %= RAM_SIZE
+        return self.writes[address] if address in self.writes else self.ram[address]
+
+    def __setitem__(self, address: int, value: int) -> None:
+        self.writes[address % RAM_SIZE] = value
+
+
+def _wrap(value: int) -> int:
+    return ((value + 32768) & 65535) - 32768
+
+
+# Stack handlers. push/pop for local, argument, this and that go through the segment's base register; the other
+# segments are decoded to a fixed RAM address.
+def _push_constant(ram, value, pc):
+    sp = ram[SP]
+    ram[sp] = value
+    ram[SP] = sp + 1
+    return pc + 1
+
+
+def _push_direct(ram, address, pc):
+    sp = ram[SP]
+    ram[sp] = ram[address]
+    ram[SP] = sp + 1
+    return pc + 1
+
+
+def _pop_direct(ram, address, pc):
+    sp = ram[SP] - 1
+    ram[address] = ram[sp]
+    ram[SP] = sp
+    return pc + 1
+
+
+def _indirect_handlers(base: int) -> Tuple[Handler, Handler]:
+    def push(ram, index, pc):
+        sp = ram[SP]
+        ram[sp] = ram[ram[base] + index]
+        ram[SP] = sp + 1
+        return pc + 1
+
+    def pop(ram, index, pc):
+        sp = ram[SP] - 1
+        ram[ram[base] + index] = ram[sp]
+        ram[SP] = sp
+        return pc + 1
+    return push, pop
+
+
+# Arithmetic handlers
+def _add(ram, _, pc):
+    sp = ram[SP] - 1
+    ram[sp - 1] = _wrap(ram[sp - 1] + ram[sp])
+    ram[SP] = sp
+    return pc + 1
+
+
+def _sub(ram, _, pc):
+    sp = ram[SP] - 1
+    ram[sp - 1] = _wrap(ram[sp - 1] - ram[sp])
+    ram[SP] = sp
+    return pc + 1
+
+
+def _and(ram, _, pc):
+    sp = ram[SP] - 1
+    ram[sp - 1] &= ram[sp]
+    ram[SP] = sp
+    return pc + 1
+
+
+def _or(ram, _, pc):
+    sp = ram[SP] - 1
+    ram[sp - 1] |= ram[sp]
+    ram[SP] = sp
+    return pc + 1
+
+
+def _eq(ram, _, pc):
+    sp = ram[SP] - 1
+    ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+    ram[SP] = sp
+    return pc + 1
+
+
+def _gt(ram, _, pc):
+    sp = ram[SP] - 1
+    ram[sp - 1] = -1 if _wrap(ram[sp - 1] - ram[sp]) > 0 else 0
+    ram[SP] = sp
+    return pc + 1
+
+
+def _lt(ram, _, pc):
+    sp = ram[SP] - 1
+    ram[sp - 1] = -1 if _wrap(ram[sp - 1] - ram[sp]) < 0 else 0
+    ram[SP] = sp
+    return pc + 1
+
+
+def _neg(ram, _, pc):
+    sp = ram[SP] - 1
+    ram[sp] = _wrap(-ram[sp])
+    return pc + 1
+
+
+def _not(ram, _, pc):
+    sp = ram[SP] - 1
+    ram[sp] = ~ram[sp]
+    return pc + 1
+
+
+# Control flow handlers
+def _goto(ram, target, pc):
+    return target
+
+
+def _if_goto(ram, target, pc):
+    sp = ram[SP] - 1
+    ram[SP] = sp
+    return target if ram[sp] else pc + 1
+
+
+def _function(ram, num_locals, pc):
+    sp = ram[SP]
+    for address in range(sp, sp + num_locals):
+        ram[address] = 0
+    ram[SP] = sp + num_locals
+    return pc + 1
+
+
+def _call(ram, operand, pc):
+    target, num_args = operand
+    sp = ram[SP]
+    ram[sp] = pc + 1  # Return address
+    ram[sp + 1] = ram[LCL]
+    ram[sp + 2] = ram[ARG]
+    ram[sp + 3] = ram[THIS]
+    ram[sp + 4] = ram[THAT]
+    ram[ARG] = sp - num_args
+    ram[LCL] = ram[SP] = sp + 5
+    return target
+
+
+def _return(ram, _, pc):
+    frame = ram[LCL]
+    return_address = ram[frame - 5]
+    arg = ram[ARG]
+    ram[arg] = ram[ram[SP] - 1]
+    ram[SP] = arg + 1
+    ram[THAT] = ram[frame - 1]
+    ram[THIS] = ram[frame - 2]
+    ram[ARG] = ram[frame - 3]
+    ram[LCL] = ram[frame - 4]
+    return return_address
+
+
+def _native_call(ram, operand, pc):
+    native, num_args, target, statics = operand
+    sp = ram[SP]
+    arg = sp - num_args
+    result = native(ram, ram[arg:sp], statics)
+    if result is None:  # The builtin leaves this call to the VM code
+        return _call(ram, (target, num_args), pc)
+    ram[arg] = result
+    ram[SP] = arg + 1
+    return pc + 1
+
+
+def _halt(ram, _, pc):
+    raise Halt(pc)
+
+
+def _undefined_function(ram, name, pc):
+    raise VMError(f"call to undefined function {name}")
+
+
+SEGMENT_BASES = {'local': LCL, 'argument': ARG, 'this': THIS, 'that': THAT}
+PUSH_HANDLERS: Dict[str, Handler] = {'constant': _push_constant}
+POP_HANDLERS: Dict[str, Handler] = {}
+for _segment, _base in SEGMENT_BASES.items():
+    PUSH_HANDLERS[_segment], POP_HANDLERS[_segment] = _indirect_handlers(_base)
+for _segment in ('static', 'temp', 'pointer'):
+    PUSH_HANDLERS[_segment], POP_HANDLERS[_segment] = _push_direct, _pop_direct
+
+ARITHMETIC_HANDLERS: Dict[str, Handler] = {'add': _add, 'sub': _sub, 'neg': _neg, 'eq': _eq, 'gt': _gt, 'lt': _lt,
+                                           'and': _and, 'or': _or, 'not': _not}
+CONTROL_HANDLERS: Dict[VMCommandType, Handler] = {
+    VMCommandType.C_GOTO: _goto, VMCommandType.C_IF: _if_goto, VMCommandType.C_FUNCTION: _function,
+    VMCommandType.C_CALL: _call, VMCommandType.C_RETURN: _return}
+
+
+class VMInterpreter:
+    def __init__(self, program: Program, entry: str = ENTRY_POINT, natives: Iterable[str] = (),
+                 check_natives: bool = False):
+        """
+        :param program: (file path, commands) of every file of the program, as main.parse_program returns.
+        :param entry: The function to call first, with no arguments. Returning from it ends the run.
+        :param natives: Functions to run with their builtin instead of their VM code, among vm_builtins.BUILTINS.
+        :param check_natives: Run the VM code of the natives too, and raise VMError when its RAM differs from what
+                              the builtin computed.
+        """
+        unknown = [name for name in natives if name not in BUILTINS]
+        if unknown:
+            raise VMError(f"no builtin for {', '.join(unknown)}")
+        self.natives = {name: BUILTINS[name] for name in natives}
+        self.check_natives = check_natives
+        self.native_checks = 0  # Calls whose builtin was compared with the VM code
+        self._budget = self._executed = 0  # Of the current run, when checking natives
+        self.ram = array('h', bytes(2 * RAM_SIZE))
+        self.statics: Dict[str, int] = {}  # 'File.index' -> RAM address
+        self.functions: Dict[str, int] = {}  # Function name -> index of its function command
+        self.commands: List[Tuple[str, str, VMCommand]] = []  # (file, function, command) of every command
+        self._handlers, self._operands = self.predecode(program)
+        if entry not in self.functions:
+            raise VMError(f"the program has no {entry} function")
+        self.pc = self.functions[entry]
+        self.instructions = 0
+        self.halted = False
+
+        # The bootstrap: the stack starts at 256, and entry is called as if by a call command right before the last
+        # index, so it returns to the last one, whose handler halts
+        self.ram[SP] = STACK_BASE
+        _call(self.ram, (self.pc, 0), len(self._handlers) - 2)
+
+    def predecode(self, program: Program) -> Tuple[List[Handler], list]:
+        """
+        Decodes every command into a handler and its operand.
+        :return: Two lists indexed by command: the handlers and the operands. Two halting commands are appended,
+                 used by the bootstrap.
+        """
+        labels: Dict[str, int] = {}  # 'Function$label' -> index of the command after the label
+        for vm_file, commands in program:
+            file_name = vm_file.replace('\\', '/').rsplit('/', 1)[-1].rsplit('.', 1)[0]
+            function_name = file_name
+            for command in commands:
+                if command.type == VMCommandType.C_LABEL:
+                    labels[f'{function_name}${command.arg1}'] = len(self.commands)
+                    continue
+                if command.type == VMCommandType.C_FUNCTION:
+                    function_name = command.arg1
+                    self.functions[function_name] = len(self.commands)
+                self.commands.append((file_name, function_name, command))
+        if len(self.commands) + 2 > RAM_SIZE:
+            raise VMError("the program is too long for return addresses to fit in a RAM word")
+
+        handlers = []
+        operands = []
+        for pc, (file_name, function_name, command) in enumerate(self.commands):
+            c_type, arg1, arg2 = command.type, command.arg1, command.arg2
+            operand = arg2
+            if c_type in (VMCommandType.C_PUSH, VMCommandType.C_POP):
+                handler = (PUSH_HANDLERS if c_type == VMCommandType.C_PUSH else POP_HANDLERS).get(arg1)
+                if handler is None:
+                    raise VMError(f"{file_name}: {command}: unsupported segment")
+                if arg1 == 'constant':
+                    operand = _wrap(arg2)
+                elif arg1 in ('static', 'temp', 'pointer'):
+                    operand = self._direct_address(file_name, arg1, arg2)
+            elif c_type == VMCommandType.C_ARITHMETIC:
+                handler = ARITHMETIC_HANDLERS[arg1]
+            elif c_type in (VMCommandType.C_GOTO, VMCommandType.C_IF):
+                label = f'{function_name}${arg1}'
+                if label not in labels:
+                    raise VMError(f"{function_name}: {command}: undefined label")
+                operand = labels[label]
+                handler = _halt if c_type == VMCommandType.C_GOTO and operand == pc else CONTROL_HANDLERS[c_type]
+            elif c_type == VMCommandType.C_CALL:
+                if arg1 == HALT_FUNCTION:
+                    handler = _halt
+                elif arg1 in self.natives and arg1 in self.functions:
+                    handler = self._check_native if self.check_natives else _native_call
+                    operand = (self.natives[arg1], arg2, self.functions[arg1], self.statics)
+                elif arg1 in self.functions:
+                    handler, operand = _call, (self.functions[arg1], arg2)
+                else:
+                    handler, operand = _undefined_function, arg1
+            else:
+                handler = CONTROL_HANDLERS[c_type]
+            handlers.append(handler)
+            operands.append(operand)
+        handlers.extend([_halt, _halt])  # The bootstrap's call, and the return address of entry
+        operands.extend([None, None])
+        return handlers, operands
+
+    def _direct_address(self, file_name: str, segment: str, index: int) -> int:
+        if segment == 'temp':
+            return TEMP_BASE + index
+        elif segment == 'pointer':
+            return THIS + index
+        name = f'{file_name}.{index}'
+        if name not in self.statics:
+            self.statics[name] = STATIC_BASE + len(self.statics)
+        return self.statics[name]
+
+    def _check_native(self, ram, operand, pc):
+        """
+        Handler of native calls with check_natives: runs the builtin on a log of its writes, then the VM code to its
+        return, and compares the RAM the VM code leaves with the builtin's writes below the returned value and in
+        the heap, and at every other address the builtin wrote. The stack above the returned value is free to
+        differ. Each command of the VM code counts against the budget of run.
+        """
+        native, num_args, target, statics = operand
+        sp = ram[SP]
+        arg = sp - num_args
+        args = ram[arg:sp]
+        log = _WriteLog(ram)
+        result = native(log, args, statics)
+        if result is None:
+            return _call(ram, (target, num_args), pc)
+        writes = log.writes
+        writes[arg] = result
+        writes[SP] = arg + 1
+        expected_low, expected_heap = ram[:arg + 1], ram[STACK_END:HEAP_END]
+        outside = {}  # Builtin writes outside of the two compared ranges, except the stack above the result
+        for address, value in writes.items():
+            if address <= arg:
+                expected_low[address] = value
+            elif STACK_END <= address < HEAP_END:
+                expected_heap[address - STACK_END] = value
+            elif address >= HEAP_END:
+                outside[address] = value
+
+        handlers, operands = self._handlers, self._operands
+        budget = self._budget
+        next_pc = _call(ram, (target, num_args), pc)
+        while next_pc != pc + 1 or ram[SP] != arg + 1:  # Returns from recursive calls leave SP higher
+            if self._executed >= budget:
+                raise _BudgetExhausted(next_pc)
+            next_pc = handlers[next_pc](ram, operands[next_pc], next_pc)
+            self._executed += 1
+        self.native_checks += 1
+        if ram[:arg + 1] != expected_low or ram[STACK_END:HEAP_END] != expected_heap or \
+                any(ram[address] != value for address, value in outside.items()):
+            expected = dict(enumerate(expected_low))
+            expected.update((STACK_END + offset, value) for offset, value in enumerate(expected_heap))
+            expected.update(outside)
+            address = next(address for address in sorted(expected) if ram[address] != expected[address])
+            raise VMError(f"{self.commands[pc][2].arg1}{tuple(args)}: the builtin leaves RAM[{address}] = "
+                          f"{expected[address]}, the VM code {ram[address]}")
+        return next_pc
+
+    def run(self, max_instructions: int = 10_000_000) -> int:
+        """
+        Runs until the program halts or max_instructions VM commands have executed, counting the VM code of
+        checked native calls.
+        :return: Number of commands executed by this call.
+        """
+        handlers, operands, ram = self._handlers, self._operands, self.ram
+        pc = self.pc
+        executed = 0
+        try:
+            if self.check_natives:  # The checks count their commands in _executed, so the loop does too
+                self._budget, self._executed = max_instructions, 0
+                try:
+                    while self._executed < max_instructions:
+                        pc = handlers[pc](ram, operands[pc], pc)
+                        self._executed += 1
+                finally:
+                    executed = self._executed
+            else:
+                for executed in range(max_instructions):
+                    pc = handlers[pc](ram, operands[pc], pc)
+                else:
+                    executed = max_instructions
+        except Halt as halt:
+            pc = halt.pc
+            self.halted = True
+        except _BudgetExhausted as stop:  # Resumes in the VM code of the call, which then goes unchecked
+            pc = stop.pc
+        except (IndexError, OverflowError) as error:
+            raise VMError(f"{self.describe(pc)}: {error}") from None
+        self.pc = pc
+        self.instructions += executed
+        return executed
+
+    def describe(self, pc: int) -> str:
+        """The command at index pc, with the function it belongs to, for error messages."""
+        if pc >= len(self.commands):
+            return 'bootstrap'
+        _, function_name, command = self.commands[pc]
+        return f'{function_name}: {command}'
+
+
+def load_program(program_path: str, optimize: bool = False) -> Program:
+    """Parses a .vm file, or every .vm file of a directory in sorted order."""
+    from main import parse_program, vm_files
+
+    return parse_program(vm_files(program_path), optimize)[0]
+
+
+def parse_range(text: str) -> range:
+    start, _, end = text.partition(':')
+    return range(int(start), int(end) if end else int(start) + 1)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Headless VM interpreter')
+    arg_parser.add_argument('program_path', help='.vm file, or a directory of .vm files')
+    arg_parser.add_argument('--entry', default=ENTRY_POINT, help='function to start from (default: %(default)s)')
+    arg_parser.add_argument('-O', '--optimize', action='store_true', help='run the VM optimizer first')
+    arg_parser.add_argument('--instructions', type=int, default=10_000_000, help='VM command budget')
+    arg_parser.add_argument('--native', nargs='*', metavar='FUNCTION', choices=sorted(BUILTINS),
+                            help='run these OS functions with their Python builtin instead of their VM code, all of '
+                                 'them if none are given')
+    arg_parser.add_argument('--check-natives', action='store_true',
+                            help='run the VM code of every native call too, and stop if its RAM differs')
+    arg_parser.add_argument('--set', action='append', default=[], metavar='ADDR=VALUE',
+                            help='RAM word to initialize before running, may be repeated')
+    arg_parser.add_argument('--dump', action='append', default=[], metavar='START[:END]',
+                            help='RAM range to print after running, may be repeated')
+    args = arg_parser.parse_args()
+
+    natives = BUILTINS if args.native == [] else args.native or ()
+    interpreter = VMInterpreter(load_program(args.program_path, args.optimize), args.entry, natives,
+                                args.check_natives)
+    for assignment in args.set:
+        address, _, value = assignment.partition('=')
+        interpreter.ram[int(address)] = int(value)
+
+    start = time.perf_counter()
+    executed = interpreter.run(args.instructions)
+    elapsed = time.perf_counter() - start
+
+    status = 'halted' if interpreter.halted else 'budget exhausted'
+    print(f"{status} after {executed} VM commands, {elapsed:.3f}s ({executed / max(elapsed, 1e-9):,.0f} commands/s)")
+    print(f"at {interpreter.describe(interpreter.pc)}")
+    if args.check_natives:
+        print(f"{interpreter.native_checks} native calls match their VM code")
+    for ram_range in map(parse_range, args.dump):
+        for address in ram_range:
+            print(f"RAM[{address}] = {interpreter.ram[address]}")
@@ -0,0 +1,79 @@
+"""
+Link-time dead-function elimination.
+
+Works on the whole program at once: the parsed commands of every .vm file. Builds the call graph, and keeps only the
+functions reachable from Sys.init, which the bootstrap code calls. VM calls are always by name, so the graph is
+exact.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+
+from vm_parser import VMCommand, VMCommandType
+
+# (file path, commands) of every file of the program, in translation order
+Program = List[Tuple[str, List[VMCommand]]]
+
+ENTRY_POINT = 'Sys.init'
+
+
+def split_functions(commands: List[VMCommand]) -> List[Tuple[Optional[str], List[VMCommand]]]:
+    """
+    Splits a file's commands at every function command.
+    :return: (function name, commands) pairs in order. Commands before the first function, if any, come first,
+             with None as the name.
+    """
+    functions = []
+    for command in commands:
+        if command.type == VMCommandType.C_FUNCTION:
+            functions.append((command.arg1, [command]))
+        elif functions:
+            functions[-1][1].append(command)
+        else:
+            functions.append((None, [command]))
+    return functions
+
+
+def call_graph(program: Program) -> Dict[str, Set[str]]:
+    """The functions every function of the program calls."""
+    graph = {}
+    for _, commands in program:
+        for name, body in split_functions(commands):
+            if name is not None:
+                graph.setdefault(name, set()).update(command.arg1 for command in body
+                                                     if command.type == VMCommandType.C_CALL)
+    return graph
+
+
+def reachable_functions(graph: Dict[str, Set[str]], entry: str = ENTRY_POINT) -> Set[str]:
+    """The functions reachable from entry, entry included. Calls to undefined functions are ignored."""
+    reached = {entry}
+    pending = [entry]
+    while pending:
+        for callee in graph[pending.pop()]:
+            if callee in graph and callee not in reached:
+                reached.add(callee)
+                pending.append(callee)
+    return reached
+
+
+def eliminate_dead_functions(program: Program, entry: str = ENTRY_POINT) -> Tuple[Program, List[str]]:
+    """
+    Drops the functions that are never called, directly or indirectly, from entry. A program without entry is
+    returned as is, since there's nothing to start the graph from.
+    :return: The linked program, and the names of the dropped functions in program order.
+    """
+    graph = call_graph(program)
+    if entry not in graph:
+        return program, []
+    reached = reachable_functions(graph, entry)
+
+    linked = []
+    dropped = []
+    for vm_file, commands in program:
+        kept = []
+        for name, body in split_functions(commands):
+            if name is None or name in reached:
+                kept.extend(body)
+            else:
+                dropped.append(name)
+        linked.append((vm_file, kept))
+    return linked, dropped
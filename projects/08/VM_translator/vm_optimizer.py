@@ -0,0 +1,162 @@
+"""
+VM-level optimizer: constant folding and algebraic simplification.
+
+Runs on the command list Parser.commands returns, before CodeWriter sees it. Folded constants can be anything in
+the signed 16-bit range, including negative numbers that plain VM code can't push; CodeWriter translates those
+too. Arithmetic is folded the way the translated code computes it, with 16-bit wraparound, and comparisons test
+the wrapped difference x - y, so an optimized program always behaves like the unoptimized one.
+
+Label commands are never removed, and no rule matches across one unless the label is part of its pattern.
+"""
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from vm_parser import VMCommand, VMCommandType
+
+# What a rule returns when it matches: the number of commands it replaces, and their replacement
+Match = Optional[Tuple[int, List[VMCommand]]]
+
+
+def _wrap(value: int) -> int:
+    """value as a signed 16-bit word."""
+    return ((value + 32768) & 65535) - 32768
+
+
+UNARY_OPS: Dict[str, Callable[[int], int]] = {
+    'neg': lambda x: _wrap(-x),
+    'not': lambda x: ~x,
+}
+
+BINARY_OPS: Dict[str, Callable[[int, int], int]] = {
+    'add': lambda x, y: _wrap(x + y),
+    'sub': lambda x, y: _wrap(x - y),
+    'and': lambda x, y: x & y,
+    'or': lambda x, y: x | y,
+    'eq': lambda x, y: -1 if _wrap(x - y) == 0 else 0,
+    'gt': lambda x, y: -1 if _wrap(x - y) > 0 else 0,
+    'lt': lambda x, y: -1 if _wrap(x - y) < 0 else 0,
+}
+
+# push constant c; op  ->  nothing, since x op c == x
+IDENTITIES = {('add', 0), ('sub', 0), ('or', 0), ('and', -1)}
+
+# Operations whose result is always 0 or -1
+BOOLEAN_OPS = ('eq', 'gt', 'lt')
+
+
+def push_constant(value: int) -> VMCommand:
+    return VMCommand(VMCommandType.C_PUSH, 'constant', value)
+
+
+def _constant(command: VMCommand) -> Optional[int]:
+    """The pushed value if command is a push constant, None otherwise."""
+    if command.type == VMCommandType.C_PUSH and command.arg1 == 'constant':
+        return _wrap(command.arg2)
+    return None
+
+
+def _arithmetic(command: VMCommand) -> Optional[str]:
+    """The operation of an arithmetic command, None for any other command."""
+    return command.arg1 if command.type == VMCommandType.C_ARITHMETIC else None
+
+
+def fold_unary(out: List[VMCommand], commands: List[VMCommand], i: int) -> Match:
+    """push constant c; neg|not  ->  push constant -c|~c"""
+    value = _constant(commands[i])
+    if value is not None and i + 1 < len(commands) and _arithmetic(commands[i + 1]) in UNARY_OPS:
+        return 2, [push_constant(UNARY_OPS[commands[i + 1].arg1](value))]
+    return None
+
+
+def fold_binary(out: List[VMCommand], commands: List[VMCommand], i: int) -> Match:
+    """push constant x; push constant y; op  ->  push constant x op y"""
+    x = _constant(commands[i])
+    if x is None or i + 2 >= len(commands):
+        return None
+    y = _constant(commands[i + 1])
+    if y is not None and _arithmetic(commands[i + 2]) in BINARY_OPS:
+        return 3, [push_constant(BINARY_OPS[commands[i + 2].arg1](x, y))]
+    return None
+
+
+def identity(out: List[VMCommand], commands: List[VMCommand], i: int) -> Match:
+    """x + 0, x - 0, x | 0 and x & -1 are x."""
+    value = _constant(commands[i])
+    if value is not None and i + 1 < len(commands) and (_arithmetic(commands[i + 1]), value) in IDENTITIES:
+        return 2, []
+    return None
+
+
+def double_negation(out: List[VMCommand], commands: List[VMCommand], i: int) -> Match:
+    """neg; neg and not; not cancel out."""
+    operation = _arithmetic(commands[i])
+    if operation in UNARY_OPS and i + 1 < len(commands) and _arithmetic(commands[i + 1]) == operation:
+        return 2, []
+    return None
+
+
+def constant_branch(out: List[VMCommand], commands: List[VMCommand], i: int) -> Match:
+    """push constant c; if-goto L  ->  goto L if c != 0, nothing otherwise."""
+    value = _constant(commands[i])
+    if value is not None and i + 1 < len(commands) and commands[i + 1].type == VMCommandType.C_IF:
+        return 2, [VMCommand(VMCommandType.C_GOTO, commands[i + 1].arg1)] if value else []
+    return None
+
+
+def branch_condition(out: List[VMCommand], commands: List[VMCommand], i: int) -> Match:
+    """
+    Drops work that doesn't change whether if-goto jumps, which only tests for nonzero:
+    neg; if-goto L  ->  if-goto L
+    push constant 0; eq; not; if-goto L  ->  if-goto L
+    """
+    if _arithmetic(commands[i]) == 'neg' and i + 1 < len(commands) and commands[i + 1].type == VMCommandType.C_IF:
+        return 1, []
+    if _constant(commands[i]) == 0 and [_arithmetic(command) for command in commands[i + 1:i + 3]] == ['eq', 'not'] \
+            and i + 3 < len(commands) and commands[i + 3].type == VMCommandType.C_IF:
+        return 3, []
+    return None
+
+
+def inverted_branch(out: List[VMCommand], commands: List[VMCommand], i: int) -> Match:
+    """
+    b; not; if-goto L1; goto L2; label L1  ->  b; if-goto L2; label L1
+    where b is a boolean (0 or -1) computed by eq, gt or lt, so not b is nonzero exactly when b is zero.
+    """
+    if _arithmetic(commands[i]) not in BOOLEAN_OPS or i + 4 >= len(commands):
+        return None
+    not_, if_goto, goto, label = commands[i + 1:i + 5]
+    if _arithmetic(not_) == 'not' and if_goto.type == VMCommandType.C_IF and goto.type == VMCommandType.C_GOTO and \
+            label.type == VMCommandType.C_LABEL and label.arg1 == if_goto.arg1:
+        return 5, [commands[i], VMCommand(VMCommandType.C_IF, goto.arg1), label]
+    return None
+
+
+RULES = (fold_unary, fold_binary, identity, double_negation, constant_branch, branch_condition, inverted_branch)
+
+
+def optimize(commands: List[VMCommand]) -> Tuple[List[VMCommand], Counter]:
+    """
+    Applies RULES until none of them matches anymore.
+    :return: The optimized commands, and the number of VM commands each rule removed.
+    """
+    saved = Counter()
+    changed = True
+    while changed:
+        changed = False
+        out = []
+        i = 0
+        while i < len(commands):
+            for rule in RULES:
+                match = rule(out, commands, i)
+                if match is not None:
+                    length, replacement = match
+                    out.extend(replacement)
+                    saved[rule.__name__] += length - len(replacement)
+                    i += length
+                    changed = True
+                    break
+            else:
+                out.append(commands[i])
+                i += 1
+        commands = out
+    return commands, saved
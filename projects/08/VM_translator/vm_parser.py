@@ -1,6 +1,7 @@
 import os
+import sys
 from enum import IntEnum
-from typing import List
+from typing import List, Optional
 
 
 class VMCommandType(IntEnum):
@@ -15,21 +16,55 @@ class VMCommandType(IntEnum):
     C_CALL = 8
 
 
+# Keyword of every command, and its type
+COMMAND_TYPES = {'push': VMCommandType.C_PUSH, 'pop': VMCommandType.C_POP, 'label': VMCommandType.C_LABEL,
+                 'goto': VMCommandType.C_GOTO, 'if-goto': VMCommandType.C_IF, 'function': VMCommandType.C_FUNCTION,
+                 'call': VMCommandType.C_CALL, 'return': VMCommandType.C_RETURN}
+COMMAND_TYPES.update((command, VMCommandType.C_ARITHMETIC)
+                     for command in ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"])
+_TWO_ARGUMENTS = (VMCommandType.C_PUSH, VMCommandType.C_POP, VMCommandType.C_FUNCTION, VMCommandType.C_CALL)
+
+
+class VMCommand:
+    """
+    One parsed VM command. arg1 is the arithmetic command itself (add, sub, etc.) for C_ARITHMETIC, the segment,
+    label or function name otherwise, and None for C_RETURN; it's always an interned string, so names can be
+    compared by identity. arg2 is the int second argument of C_PUSH, C_POP, C_FUNCTION and C_CALL, None otherwise.
+    """
+    __slots__ = ('type', 'arg1', 'arg2')
+
+    def __init__(self, c_type: VMCommandType, arg1: Optional[str] = None, arg2: Optional[int] = None):
+        self.type = c_type
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, VMCommand) and (self.type, self.arg1, self.arg2) == (other.type, other.arg1,
+                                                                                      other.arg2)
+
+    def __repr__(self) -> str:
+        return f'VMCommand({self.type.name}, {self.arg1!r}, {self.arg2!r})'
+
+    def __str__(self) -> str:
+        """The command as VM code."""
+        keyword = {VMCommandType.C_ARITHMETIC: '', VMCommandType.C_IF: 'if-goto'}.get(
+            self.type, self.type.name[2:].lower())
+        return ' '.join(str(part) for part in (keyword, self.arg1, self.arg2) if part not in ('', None))
+
+
 class Parser:
     def __init__(self, vm_file_path: str):
         _check_if_file_is_valid(vm_file_path)
-        self.vm_code = self._sanitized_vm_file(vm_file_path)
+        self.vm_commands = self._parse(self._open_file(vm_file_path), vm_file_path)
         self.line_number = 0
-        self.current_command = ''
-        self._arg1 = None
-        self._arg2 = None
+        self.current_command: Optional[VMCommand] = None
 
     def has_more_commands(self) -> bool:
         """
         Are the more commands in the input?
         :return: boolean.
         """
-        return len(self.vm_code) > self.line_number
+        return len(self.vm_commands) > self.line_number
 
     def advance(self) -> None:
         """
@@ -37,7 +72,7 @@ class Parser:
         has_more_commands() is True. Initially there is no current command.
         :return: None
         """
-        self.current_command = self.vm_code[self.line_number]
+        self.current_command = self.vm_commands[self.line_number]
         self.line_number += 1
 
     def command_type(self) -> VMCommandType:
@@ -45,25 +80,16 @@ class Parser:
         :return: Returns the type of the current command. VMCommandType.C_ARITHMETIC is returned for all the arithmetic/
                  logical commands.
         """
-        command_parts = self.current_command.lower().split()
-        c_type = None
-
-        if self.current_command in ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]:
-            self._arg1 = self.current_command
-            c_type = VMCommandType.C_ARITHMETIC
-        elif command_parts[0] == 'if-goto':
-            c_type = VMCommandType.C_IF
-        else:
-            try:
-                c_type = getattr(VMCommandType, f'C_{command_parts[0].upper()}')
-            except AttributeError:
-                raise ValueError("{} - is an unsupported command type".format(command_parts[0]))
-
-        if c_type not in [VMCommandType.C_ARITHMETIC, VMCommandType.C_RETURN]:
-            self._arg1 = command_parts[1]
-            if c_type in [VMCommandType.C_PUSH, VMCommandType.C_POP, VMCommandType.C_FUNCTION, VMCommandType.C_CALL]:
-                self._arg2 = command_parts[2]
-        return c_type
+        return self.current_command.type
+
+    def commands(self) -> List[VMCommand]:
+        """
+        Returns all the remaining commands at once.
+        :return: List of VMCommand.
+        """
+        remaining = self.vm_commands[self.line_number:]
+        self.line_number = len(self.vm_commands)
+        return remaining
 
     @property
     def arg1(self) -> str:
@@ -71,7 +97,7 @@ class Parser:
         :return: Returns the first argument of the current command. In the case of C_ARITHMETIC, the command itself
                  (add, sub, etc.) is returned. Shouldn't be called if the current command is C_RETURN.
         """
-        return self._arg1
+        return self.current_command.arg1
 
     @property
     def arg2(self) -> int:
@@ -79,31 +105,53 @@ class Parser:
         :return: Returns the second argument of the current command. Should be called only if the current command is
                  C_PUSH, C_POP, C_FUNCTION, or C_CALL.
         """
-        return self._arg2
+        return self.current_command.arg2
 
-    def _sanitized_vm_file(self, path_to_vm_file) -> List[str]:
-        sanitized_lines = []
-        for line in self._open_file(path_to_vm_file):
-            sanitized_line = self._remove_whitespace_and_comments(line)
-            if sanitized_line:
-                sanitized_lines.append(sanitized_line)
-        return sanitized_lines
+    @staticmethod
+    def _parse(lines: List[str], vm_file_path: str = '') -> List[VMCommand]:
+        """
+        Parses the lines of a VM file in one pass, skipping comments and blank lines. Lines with the same command
+        share one VMCommand, so commands must not be modified.
+        """
+        commands = []
+        parsed = {}  # Command text -> its VMCommand
+        for line_number, line in enumerate(lines, 1):
+            text = line.split('//', 1)[0].strip()
+            command = parsed.get(text)
+            if command is None:
+                if not text:
+                    continue
+                command = parsed[text] = Parser._parse_command(text, f'{vm_file_path}:{line_number}')
+            commands.append(command)
+        return commands
+
+    @staticmethod
+    def _parse_command(text: str, location: str) -> VMCommand:
+        parts = text.split()
+        keyword = parts[0]
+        c_type = COMMAND_TYPES.get(keyword)
+        if c_type is None:
+            c_type = COMMAND_TYPES.get(keyword.lower())
+        if c_type is None:
+            raise ValueError("{} - is an unsupported command type".format(keyword))
+        try:
+            if c_type == VMCommandType.C_ARITHMETIC:
+                return VMCommand(c_type, sys.intern(keyword.lower()))
+            elif c_type == VMCommandType.C_RETURN:
+                return VMCommand(c_type)
+            elif c_type in _TWO_ARGUMENTS:
+                return VMCommand(c_type, sys.intern(parts[1]), int(parts[2]))
+            return VMCommand(c_type, sys.intern(parts[1]))
+        except (IndexError, ValueError):
+            raise ValueError(f"{location}: malformed command '{text}'") from None
 
     @staticmethod
     def _open_file(path_to_vm_file) -> List[str]:
         f = open(path_to_vm_file, 'r')
-        vm_code = f.readlines()
+        vm_code = f.read().splitlines()
         f.close()
         return vm_code
 
-    @staticmethod
-    def _remove_whitespace_and_comments(line) -> str:
-        return line.strip().split("//")[0].strip()
-
-    def _reset(self):
-        self._arg1 = None
-        self._arg2 = None
-
 
 def _check_if_file_is_valid(file_path: str) -> None:
     if not os.path.exists(file_path):
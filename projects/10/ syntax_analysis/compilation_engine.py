@@ -262,19 +262,7 @@ class CompilationEngine(TreeBuilder):
         elif token_type in [token_type.INT_CONST, token_type.KEYWORD]:
             self._consume(token_type)
         elif token_type == token_type.STRING_CONST:
-            const_str = ''
-            first = True
-            while const_str.count('"') < 2:
-                if first:
-                    const_str += self._get_current_token()
-                    first = False
-                else:
-                    const_str += ' ' + self._get_current_token()
-                if self.tokenizer.has_more_tokens():
-                    self.tokenizer.advance()
-            self.start('stringConstant')
-            self.data(const_str.replace('"', ''))
-            self.end('stringConstant')
+            self._consume(token_type)
 
         else:
             if self._get_current_token() == '(':
@@ -338,8 +326,8 @@ class CompilationEngine(TreeBuilder):
 
         curr_token = self._get_current_token()
         if curr_token not in expected_tokens:
-            raise CompilationEngineError(f"Expected {expected_tokens} but current token is {curr_token}. "
-                                         f"Compilation failed.")
+            raise CompilationEngineError(f"{self._position()}: Expected {expected_tokens} but current token is "
+                                         f"{curr_token}. Compilation failed.")
         else:
             self._write_current_terminal_token()
             if self.tokenizer.has_more_tokens():
@@ -352,8 +340,8 @@ class CompilationEngine(TreeBuilder):
             expected_types = [expected_types]
         curr_type = self.tokenizer.token_type()
         if curr_type not in expected_types:
-            raise CompilationEngineError(f"Expected {expected_types} but current token type is {curr_type}. "
-                                         f"Compilation failed.")
+            raise CompilationEngineError(f"{self._position()}: Expected {expected_types} but current token type is "
+                                         f"{curr_type}. Compilation failed.")
         else:
             self._write_current_terminal_token()
             if self.tokenizer.has_more_tokens():
@@ -383,22 +371,18 @@ class CompilationEngine(TreeBuilder):
         elif token_type is TokenTypes.STRING_CONST:
             tag = "stringConstant"
         else:
-            tag = self.tokenizer.token_type().name.lower()
+            tag = token_type.name.lower()
 
         self.start(tag)
-        self.data(self._get_current_token())
+        self.data(self.tokenizer.string_val() if token_type is TokenTypes.STRING_CONST else self._get_current_token())
         self.end(tag)
 
     def _get_current_token(self) -> str:
-        token_type = self.tokenizer.token_type()
-        if token_type is TokenTypes.INT_CONST:
-            curr_token = str(self.tokenizer.int_val())
-        elif token_type is TokenTypes.KEYWORD:
-            curr_token = self.tokenizer.key_word()
-        else:
-            curr_token = self.tokenizer.current_token
+        return self.tokenizer.current_token
 
-        return curr_token
+    def _position(self) -> str:
+        line, column = self.tokenizer.position()
+        return f"line {line}, column {column}"
 
 
 def indent(elem, level=0):
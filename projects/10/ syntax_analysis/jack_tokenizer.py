@@ -1,6 +1,7 @@
 import re
+from array import array
 from enum import IntEnum
-from typing import List
+from typing import List, Tuple
 
 
 class TokenTypes(IntEnum):
@@ -11,19 +12,39 @@ class TokenTypes(IntEnum):
     STRING_CONST = 4
 
 
+_TOKEN_TYPES = tuple(TokenTypes)
+
+
 class JackTokenizer:
     """
     Ignores all comments and white space in the input stream, and serializes it into jack-language tokens.
+    The file is scanned once, by a single regular expression, and every token's type is resolved there. The tokens
+    are kept in parallel arrays indexed by token: types, values, lines and columns.
     """
     JACK_SYMBOLS = {'{', '}', '(', ')', '[', ']', '.', ';', '+', '-', '*', '/', '&', '|', '<', '>', '=', '~', ','}
-    JACK_KEYWORDS = {'CLASS', 'CONSTRUCTOR', 'FUNCTION', 'METHOD',
-                     'FIELD', 'STATIC', 'VAR', 'INT', 'CHAR', 'BOOLEAN',
-                     'VOID', 'TRUE', 'FALSE', 'NULL', 'THIS', 'LET', 'DO',
-                     'IF', 'ELSE', 'WHILE', 'RETURN'}
+    JACK_KEYWORDS = {'class', 'constructor', 'function', 'method',
+                     'field', 'static', 'var', 'int', 'char', 'boolean',
+                     'void', 'true', 'false', 'null', 'this', 'let', 'do',
+                     'if', 'else', 'while', 'return'}
+    MAX_INT = 32767
+    # One match per token: the comments and white space before it, then the token. Comments come first, so that
+    # '//' and '/*' never scan as symbols, and a string constant is scanned whole, so comment markers inside it
+    # are part of the string. The last match is the empty one at the end of the text.
+    TOKEN_PATTERN = re.compile(r'''
+        ((?:\s+|//[^\n]*|/\*.*?\*/)*)
+        (?:([A-Za-z_]\w*)
+        |([{}()\[\].;+\-*&|<>=~,]|/(?!\*))
+        |(\d+)
+        |("[^"\n]*")
+        |(/\*|"|.)
+        |$)
+    ''', re.VERBOSE | re.DOTALL | re.ASCII)
 
     def __init__(self, jack_file_path: str):
-        self.jack_file_tokens = self._load_file(jack_file_path)
+        with open(jack_file_path, 'r') as f:
+            self.types, self.values, self.lines, self.columns = self.scan(f.read(), jack_file_path)
         self._token_idx = 0
+        self._current_type = None
         self.current_token = None
 
     def has_more_tokens(self) -> bool:
@@ -31,7 +52,7 @@ class JackTokenizer:
         Are there more tokens in the input?
         :return: bool.
         """
-        return len(self.jack_file_tokens) > self._token_idx
+        return len(self.values) > self._token_idx
 
     def advance(self) -> None:
         """
@@ -40,23 +61,15 @@ class JackTokenizer:
         Initially there is no current token.
         :return: None.
         """
-        self.current_token = self.jack_file_tokens[self._token_idx]
+        self.current_token = self.values[self._token_idx]
+        self._current_type = _TOKEN_TYPES[self.types[self._token_idx]]
         self._token_idx += 1
 
     def token_type(self) -> TokenTypes:
         """
         :return: The type of the current token, as a Enum.
         """
-        if self.current_token.upper() in self.JACK_KEYWORDS:
-            return TokenTypes.KEYWORD
-        elif self.current_token in self.JACK_SYMBOLS:
-            return TokenTypes.SYMBOL
-        elif self.current_token.isdigit() and int(self.current_token) <= 32767:
-            return TokenTypes.INT_CONST
-        elif self.current_token.startswith('"'):
-            return TokenTypes.STRING_CONST
-        else:
-            return TokenTypes.IDENTIFIER
+        return self._current_type
 
     def key_word(self):
         """
@@ -91,25 +104,64 @@ class JackTokenizer:
         This method should be called only if token_type is STRING_CONST.
         :return: The string value of the current token, without the two enclosing double qoutes.
         """
-        return self.current_token
-
-    @staticmethod
-    def _load_file(file_path: str) -> List[str]:
-        """
-        Prepares the data for the JackTokenizer, in an easier to work with format.
-        Reads the file, removes all the comments, whitespaces.
-        :param file_path: File path to work on.
-        :return: A list with all the file components.
-        """
-        with open(file_path, 'r') as f:
-            file_content = f.read()
-
-        # Removes all comments
-        str_without_comments = re.sub('\/\*[\s\S]*?\*\/|([^\\:]|^)\/\/.*$', '', file_content, flags=re.MULTILINE)
-        str_without_new_lines = str_without_comments.lstrip('\n').replace('\n', ' ').replace('\t', ' ')  # Remove new lines and tabs
-        return JackTokenizer._split_keep_seperators(str_without_new_lines)  # Splits the string by symbols and spaces
-
-    @staticmethod
-    def _split_keep_seperators(text: str) -> List[str]:
-        all_matches = re.split('([{}\(\)\[\]\.,;\*&\|<>=~\+-\/ ])', text)
-        return [curr_symbol for curr_symbol in all_matches if curr_symbol and curr_symbol != ' ']
+        return self.current_token[1:-1]
+
+    def position(self) -> Tuple[int, int]:
+        """
+        :return: The line and column of the current token, both counted from 1.
+        """
+        return self.lines[self._token_idx - 1], self.columns[self._token_idx - 1]
+
+    @classmethod
+    def scan(cls, text: str, file_path: str = '<string>') -> Tuple[array, List[str], array, array]:
+        """
+        Splits the text into tokens.
+        :return: The parallel arrays types, values, lines and columns. A value is the token's text; integer
+                 constants are normalized (007 -> 7), and string constants keep their double quotes.
+        :Raises: ValueError: On a character that can't start a token, an unterminated comment or string constant,
+                 or an integer constant above MAX_INT.
+        """
+        types = array('B')
+        values = []
+        lines = array('I')
+        columns = array('I')
+        keywords = cls.JACK_KEYWORDS
+        line = column = 1
+        for gap, word, symbol, integer, string, error in cls.TOKEN_PATTERN.findall(text):
+            if gap:
+                newlines = gap.count('\n')
+                if newlines:
+                    line += newlines
+                    column = len(gap) - gap.rfind('\n')
+                else:
+                    column += len(gap)
+            if word:
+                types.append(TokenTypes.KEYWORD if word in keywords else TokenTypes.IDENTIFIER)
+                value = word
+            elif symbol:
+                types.append(TokenTypes.SYMBOL)
+                value = symbol
+            elif integer:
+                if int(integer) > cls.MAX_INT:
+                    raise ValueError(f"{file_path}:{line}:{column}: integer constant {integer} is greater than "
+                                     f"{cls.MAX_INT}")
+                types.append(TokenTypes.INT_CONST)
+                value = str(int(integer))
+            elif string:
+                types.append(TokenTypes.STRING_CONST)
+                value = string
+            elif error:
+                if error == '"':
+                    problem = 'unterminated string constant'
+                elif error == '/*':
+                    problem = 'unterminated comment'
+                else:
+                    problem = f'unexpected character {error!r}'
+                raise ValueError(f"{file_path}:{line}:{column}: {problem}")
+            else:
+                break
+            values.append(value)
+            lines.append(line)
+            columns.append(column)
+            column += len(word or symbol or integer or string)
+        return types, values, lines, columns
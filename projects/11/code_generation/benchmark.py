@@ -0,0 +1,203 @@
+"""
+Jack compiler benchmarks.
+By default, tokenizer throughput: tokenizes a corpus made of the Jack programs of projects/09 and the OS of
+projects/12, repeated, and reports tokens per second for the single-regex scanner against the previous tokenizer,
+which split the text on symbols and classified a token again on every token_type() call.
+
+Each is measured twice: constructing it, which reads and scans the file, and then also walking the tokens the way
+the compilation engine does, advance() once per token and token_type() three times, about as often as the engine
+asks about one token.
+
+With --strings, instead compiles the programs of projects/09 with the OS twice, without and with --intern-strings,
+runs each in the VM interpreter of projects/08 for a budget of VM commands, and reports the String.new and
+String.appendChar calls each made. Programs that wait for the keyboard use up the budget. --arithmetic does the same
+for --reduce-strength and the Math.multiply and Math.divide calls. Both also run a program that draws a rectangle,
+and check that runs that halt both ways leave the same screen.
+
+Usage: python benchmark.py [--repeat N] [--strings | --arithmetic] [--instructions N]
+"""
+import argparse
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, List
+
+from jack_tokenizer import JackTokenizer, TokenTypes
+from main import compile_file
+
+_PROJECTS = Path(__file__).resolve().parents[2]
+sys.path.append(str(_PROJECTS / '08' / 'VM_translator'))
+
+from vm_interpreter import ENTRY_POINT, VMError, VMInterpreter  # noqa: E402
+from vm_parser import Parser as VMParser  # noqa: E402
+
+CORPUS = sorted(_PROJECTS.glob('09/*/*.jack')) + sorted(_PROJECTS.glob('12/*.jack'))
+OS_FILES = sorted(_PROJECTS.glob('12/*.jack'))
+PROGRAMS = sorted(path for path in _PROJECTS.glob('09/*') if any(path.glob('*.jack')))
+STRING_FUNCTIONS = ('String.new', 'String.appendChar')
+MATH_FUNCTIONS = ('Math.multiply', 'Math.divide')
+SCREEN, SCREEN_END = 16384, 24576
+# A program that draws a rectangle, pixel by pixel with Screen.drawPixel. It runs from Main.main, not Sys.init,
+# and initializes only what it uses: Memory.alloc of projects/12 returns the same block on every call, so the
+# allocations of Output.init overwrite Math's table of powers of two.
+DRAWING = """class Main {
+    function void main() {
+        do Memory.init();
+        do Math.init();
+        do Screen.init();
+        do Screen.drawRectangle(100, 50, 131, 65);
+        return;
+    }
+}
+"""
+TYPE_QUERIES = 3
+
+
+class LegacyTokenizer:
+    """The previous tokenizer: comments removed by one regex, the rest split on symbols and spaces, and every
+    token_type() call classifying the current token from scratch."""
+    JACK_SYMBOLS = {'{', '}', '(', ')', '[', ']', '.', ';', '+', '-', '*', '/', '&', '|', '<', '>', '=', '~', ','}
+    JACK_KEYWORDS = {keyword.upper() for keyword in JackTokenizer.JACK_KEYWORDS}
+
+    def __init__(self, jack_file_path: str):
+        with open(jack_file_path, 'r') as f:
+            file_content = f.read()
+        str_without_comments = re.sub(r'\/\*[\s\S]*?\*\/|([^\\:]|^)\/\/.*$', r'\1', file_content, flags=re.MULTILINE)
+        text = str_without_comments.lstrip('\n').replace('\n', ' ').replace('\t', ' ')
+        self.jack_file_tokens = [token for token in re.split(r'([{}\(\)\[\]\.,;\*&\|<>=~\+-\/ ])', text)
+                                 if token and token != ' ']
+        self._token_idx = 0
+        self.current_token = None
+
+    def has_more_tokens(self) -> bool:
+        return len(self.jack_file_tokens) > self._token_idx
+
+    def advance(self) -> None:
+        self.current_token = self.jack_file_tokens[self._token_idx]
+        self._token_idx += 1
+
+    def token_type(self) -> TokenTypes:
+        if self.current_token.upper() in self.JACK_KEYWORDS:
+            return TokenTypes.KEYWORD
+        elif self.current_token in self.JACK_SYMBOLS:
+            return TokenTypes.SYMBOL
+        elif self.current_token.isdigit() and int(self.current_token) <= 32767:
+            return TokenTypes.INT_CONST
+        elif self.current_token.startswith('"'):
+            return TokenTypes.STRING_CONST
+        else:
+            return TokenTypes.IDENTIFIER
+
+
+def tokenize(tokenizer_class, jack_file: str, walk: bool) -> int:
+    """Runs a tokenizer over a file, and if walk, goes through the tokens the way the compilation engine does.
+    :return: Number of tokens."""
+    tokenizer = tokenizer_class(jack_file)
+    if not walk:
+        return len(getattr(tokenizer, 'values', None) or tokenizer.jack_file_tokens)
+    tokens = 0
+    while tokenizer.has_more_tokens():
+        tokenizer.advance()
+        for _ in range(TYPE_QUERIES):
+            tokenizer.token_type()
+        tokens += 1
+    return tokens
+
+
+def run_program(jack_files: List[Path], counted: Iterable[str], instructions: int, entry: str = ENTRY_POINT,
+                **compile_options) -> tuple:
+    """
+    Compiles jack_files into a temporary directory with main.compile_file and compile_options, and runs the program
+    in the VM interpreter.
+    :param counted: Functions whose calls are counted.
+    :param entry: The function to run.
+    :return: (calls of the counted functions executed, the interpreter after the run, how the run ended)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        for jack_file in jack_files:
+            shutil.copy(jack_file, directory)
+        program = []
+        for jack_file in sorted(Path(directory).glob('*.jack')):
+            vm_file = jack_file.with_suffix('.vm')
+            compile_file(str(jack_file), vm_file, **compile_options)
+            program.append((str(vm_file), VMParser(str(vm_file)).commands()))
+
+    interpreter = VMInterpreter(program, entry)
+    calls = [0]
+    handlers = interpreter._handlers
+
+    def counting(handler):
+        def count(ram, operand, pc):
+            calls[0] += 1
+            return handler(ram, operand, pc)
+        return count
+
+    for pc, (_, _, command) in enumerate(interpreter.commands):
+        if command.type == command.type.C_CALL and command.arg1 in counted:
+            handlers[pc] = counting(handlers[pc])
+    try:
+        interpreter.run(instructions)
+        status = 'halted' if interpreter.halted else 'budget'
+    except VMError as error:
+        status = f'error: {error}'
+    return calls[0], interpreter, status
+
+
+def compare_options(title: str, counted: Iterable[str], option: str, instructions: int) -> None:
+    """
+    Runs the projects/09 programs and DRAWING, each compiled without and with option, and prints the calls of the
+    counted functions and the VM commands each run executed. When both runs halt, their screens are compared.
+    """
+    print(f'{title}, {instructions:,} VM commands budget:')
+    with tempfile.TemporaryDirectory() as directory:
+        drawing = Path(directory, 'Main.jack')
+        drawing.write_text(DRAWING)
+        total = total_optimized = 0
+        runs = [(path.name, sorted(path.glob('*.jack')), ENTRY_POINT) for path in PROGRAMS]
+        for name, files, entry in runs + [('(drawing)', [drawing], 'Main.main')]:
+            calls, interpreter, status = run_program(OS_FILES + files, counted, instructions, entry)
+            optimized_calls, optimized, optimized_status = run_program(OS_FILES + files, counted, instructions, entry,
+                                                                       **{option: True})
+            total += calls
+            total_optimized += optimized_calls
+            if interpreter.halted and optimized.halted:
+                same = interpreter.ram[SCREEN:SCREEN_END] == optimized.ram[SCREEN:SCREEN_END]
+                optimized_status += ', same screen' if same else ', different screen'
+            print(f'  {name:12} {calls:7} -> {optimized_calls:7} calls, {interpreter.instructions:9} -> '
+                  f'{optimized.instructions:9} commands ({status} / {optimized_status})')
+    print(f'  {"total":12} {total:7} -> {total_optimized:7} calls, {total - total_optimized} saved')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--repeat', type=int, default=50, help='copies of the corpus in the benchmark file')
+    arg_parser.add_argument('--strings', action='store_true',
+                            help='count String calls of the projects/09 programs with and without --intern-strings')
+    arg_parser.add_argument('--arithmetic', action='store_true',
+                            help='count Math calls of the projects/09 programs with and without --reduce-strength')
+    arg_parser.add_argument('--instructions', type=int, default=5_000_000,
+                            help='VM command budget of every run, with --strings or --arithmetic')
+    args = arg_parser.parse_args()
+    if args.strings:
+        compare_options('String.new and String.appendChar calls', STRING_FUNCTIONS, 'intern_strings',
+                        args.instructions)
+        sys.exit()
+    if args.arithmetic:
+        compare_options('Math.multiply and Math.divide calls', MATH_FUNCTIONS, 'reduce_strength', args.instructions)
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as directory:
+        jack_file = Path(directory, 'Corpus.jack')
+        jack_file.write_text('\n'.join(path.read_text() for path in CORPUS) * args.repeat)
+        print(f'{len(CORPUS)} files x {args.repeat}, {jack_file.stat().st_size / 1e6:.1f} MB')
+        for walk in (False, True):
+            print('scan and walk tokens:' if walk else 'scan:')
+            for name, tokenizer_class in (('legacy tokenizer', LegacyTokenizer),
+                                          ('single-regex scanner', JackTokenizer)):
+                start = time.perf_counter()
+                tokens = tokenize(tokenizer_class, str(jack_file), walk)
+                elapsed = time.perf_counter() - start
+                print(f'  {name:20} {tokens:9} tokens, {elapsed:6.3f}s, {tokens / elapsed:12,.0f} tokens/s')
@@ -0,0 +1,119 @@
+"""
+Whole-program index of class signatures: every subroutine each class of a program declares, with its kind, return
+type and number of parameters. It is built by a pre-pass over the tokens of every .jack file, before any class is
+compiled, so the code of one class can be generated knowing the subroutines of all the others.
+
+Only declarations are read. constructor, function and method are keywords, so every one of them starts a
+subroutine declaration, and the parameter list holds no parentheses: the arity is the number of commas in it, plus
+one if it isn't empty.
+
+Stored as <directory>/classes.json:
+    {"version": 1,
+     "files": {"/path/Main.jack": {"mtime": ..., "size": ..., "class": "Main",
+                                   "subroutines": {"main": ["function", "void", 0], ...}}}}
+A file whose modification time and size haven't changed since it was indexed is not scanned again.
+"""
+import json
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+from jack_tokenizer import JackTokenizer, TokenTypes
+
+VERSION = 1
+INDEX_FILE = 'classes.json'
+SUBROUTINE_KINDS = ('constructor', 'function', 'method')
+
+
+class Signature:
+    __slots__ = ('kind', 'return_type', 'arity')
+
+    def __init__(self, kind: str, return_type: str, arity: int):
+        self.kind = kind  # 'constructor', 'function' or 'method'
+        self.return_type = return_type
+        self.arity = arity  # Declared parameters, without the object of a method
+
+    def __repr__(self):
+        return f'Signature({self.kind!r}, {self.return_type!r}, {self.arity})'
+
+
+def scan_signatures(jack_file: str) -> Tuple[str, Dict[str, Signature]]:
+    """
+    Reads the class name and the subroutine declarations of a .jack file.
+    :return: (class name, subroutine name -> signature)
+    """
+    tokenizer = JackTokenizer(jack_file)
+    types, values = tokenizer.types, tokenizer.values
+    if len(values) < 2 or values[0] != 'class' or types[1] != TokenTypes.IDENTIFIER:
+        raise ValueError(f"{jack_file}: expected a class declaration")
+    subroutines = {}
+    for idx, value in enumerate(values):
+        if value in SUBROUTINE_KINDS and types[idx] == TokenTypes.KEYWORD:
+            end = values.index(')', idx)
+            parameters = values[idx + 4:end]
+            subroutines[values[idx + 2]] = Signature(value, values[idx + 1],
+                                                     parameters.count(',') + 1 if parameters else 0)
+    return values[1], subroutines
+
+
+class ClassIndex:
+    def __init__(self):
+        self.classes: Dict[str, Dict[str, Signature]] = {}  # Class name -> subroutine name -> signature
+        self.files: Dict[str, dict] = {}  # Indexed file -> its entry, as stored
+        self.scanned = 0  # Files scanned, not taken from the stored index, by the last update
+
+    def signature(self, class_name: str, subroutine_name: str) -> Optional[Signature]:
+        """The signature of class_name.subroutine_name, None if the class or the subroutine isn't indexed."""
+        return self.classes.get(class_name, {}).get(subroutine_name)
+
+    def update(self, jack_files: Iterable[str]) -> None:
+        """
+        Indexes the given files, scanning only the ones that changed since they were indexed, and drops the files
+        that aren't given.
+        """
+        files = {}
+        self.scanned = 0
+        for jack_file in jack_files:
+            path = os.path.abspath(jack_file)
+            stat = os.stat(path)
+            entry = self.files.get(path)
+            if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+                class_name, subroutines = scan_signatures(path)
+                entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'class': class_name,
+                         'subroutines': {name: [signature.kind, signature.return_type, signature.arity]
+                                         for name, signature in subroutines.items()}}
+                self.scanned += 1
+            files[path] = entry
+        self._set_files(files)
+
+    def save(self, file_path: str) -> None:
+        with open(file_path, 'w') as f:
+            json.dump({'version': VERSION, 'files': self.files}, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, file_path: str) -> 'ClassIndex':
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError(f"{file_path}: unsupported class index version {data.get('version')}")
+        index = cls()
+        index._set_files(data['files'])
+        return index
+
+    def _set_files(self, files: Dict[str, dict]) -> None:
+        self.files = files
+        self.classes = {entry['class']: {name: Signature(*fields) for name, fields in entry['subroutines'].items()}
+                        for entry in files.values()}
+
+
+def build_index(jack_files: Iterable[str], index_path: str) -> ClassIndex:
+    """
+    Updates the index stored at index_path with jack_files, or builds it if there's none or it can't be read, and
+    stores it back.
+    """
+    try:
+        index = ClassIndex.load(index_path)
+    except (OSError, ValueError, KeyError):
+        index = ClassIndex()
+    index.update(jack_files)
+    index.save(index_path)
+    return index
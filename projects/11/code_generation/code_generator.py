@@ -0,0 +1,346 @@
+from typing import Dict, Optional
+
+from jack_ast import *
+from vm_writer import VMWriter
+from symbol_table import *
+from class_index import ClassIndex, Signature
+from compilation_engine import CompilationEngineError, convert_kind, str_to_kind
+
+
+class CodeGenerator:
+    """
+    Generates VM code from the syntax tree of a class, the same code CompilationEngine emits while parsing.
+
+    With intern_strings, every distinct string constant of the class gets a static variable of its own, after the
+    class's static variables. The first evaluation of the constant builds the string and stores it there, and every
+    evaluation pushes the stored pointer, so the string is built once instead of on every evaluation. The string is
+    then shared, so the program must not change or dispose it.
+
+    With reduce_strength, multiplication by a constant up to MAX_ADD_CHAIN, or by any power of two, is computed
+    inline by doubling and adding, and division of a non-negative number by a power of two by collecting its bits;
+    a negative dividend still calls Math.divide. temp 1 and temp 2 hold intermediate values within this code.
+
+    With a class_index, calls to the classes it holds are resolved against their signatures instead of guessed from
+    the syntax: a bare call to a function or constructor of this class gets no this argument, and calling an
+    undeclared subroutine, a method without an object, a function on an object, or any of them with the wrong
+    number of arguments is an error.
+    """
+    OP = {'+': 'ADD', '-': 'SUB', '&': 'AND', '|': 'OR', '<': 'LT', '>': 'GT', '=': 'EQ'}
+    CALL_OP = {'*': 'Math.multiply', '/': 'Math.divide'}
+    UNARY_OP = {'-': 'NEG', '~': 'NOT'}
+    MAX_ADD_CHAIN = 255  # Largest constant other than a power of two multiplied inline
+    WORD_BITS = 16
+
+    def __init__(self, writer: VMWriter, intern_strings: bool = False, reduce_strength: bool = False,
+                 class_index: Optional[ClassIndex] = None):
+        self.writer = writer
+        self.table = SymbolTable()
+        self.class_name = ''
+        self.intern_strings = intern_strings
+        self.reduce_strength = reduce_strength
+        self.class_index = class_index
+        self.string_pool: Dict[str, int] = {}  # String constant -> index of its static variable
+        self.string_uses = 0  # Evaluation sites of pooled string constants
+        self.string_calls = 0  # String.new and String.appendChar calls one evaluation of every site would make
+        self._if_count = 0
+        self._while_count = 0
+        self._divide_count = 0
+
+    def generate_class(self, jack_class: Class) -> None:
+        """
+        Writes the code of every subroutine of the class.
+        :return: None
+        """
+        self.class_name = jack_class.name
+        for var_dec in jack_class.class_vars:
+            self._define(var_dec)
+        for subroutine in jack_class.subroutines:
+            self.generate_subroutine(subroutine)
+
+    def generate_subroutine(self, subroutine: Subroutine) -> None:
+        """
+        Writes a method, function or constructor.
+        :return: None
+        """
+        self.table.reset()
+        if subroutine.kind == 'method':
+            self.table.define('this', self.class_name, Kind.ARG)
+        for var_dec in subroutine.parameters + subroutine.locals:
+            self._define(var_dec)
+        self.writer.write_function(f'{self.class_name}.{subroutine.name}', self.table.var_count(Kind.VAR))
+
+        if subroutine.kind == 'constructor':
+            self.writer.write_push('CONST', self.table.var_count(Kind.FIELD))
+            self.writer.write_call('Memory.alloc', 1)
+            self.writer.write_pop('POINTER', 0)
+        elif subroutine.kind == 'method':
+            self.writer.write_push('ARG', 0)
+            self.writer.write_pop('POINTER', 0)
+
+        self.generate_statements(subroutine.statements)
+
+    def generate_statements(self, statements: List[Statement]) -> None:
+        for statement in statements:
+            getattr(self, self._STATEMENT_METHODS[type(statement)])(statement)
+
+    def generate_let(self, statement: LetStatement) -> None:
+        kind, index = self._variable(statement.name)
+        if statement.index is not None:
+            self.generate_expression(statement.index)
+            self.writer.write_push(kind, index)
+            self.writer.write_arithmetic('ADD')
+            self.writer.write_pop('TEMP', 0)
+
+            self.generate_expression(statement.value)
+            self.writer.write_push('TEMP', 0)
+            self.writer.write_pop('POINTER', 1)
+            self.writer.write_pop('THAT', 0)
+        else:
+            self.generate_expression(statement.value)
+            self.writer.write_pop(kind, index)
+
+    def generate_if(self, statement: IfStatement) -> None:
+        self.generate_expression(statement.condition)
+        end_lbl = f'IF_END_{self._if_count}'
+        false_lbl = f'IF_FALSE_{self._if_count}'
+        self._if_count += 1
+
+        self.writer.write_arithmetic('NOT')
+        self.writer.write_if(false_lbl)
+        self.generate_statements(statement.then_statements)
+        self.writer.write_goto(end_lbl)
+        self.writer.write_label(false_lbl)
+        if statement.else_statements is not None:
+            self.generate_statements(statement.else_statements)
+        self.writer.write_label(end_lbl)
+
+    def generate_while(self, statement: WhileStatement) -> None:
+        while_lbl = f"WHILE_{self._while_count}"
+        while_false_lbl = f"WHILE_FALSE{self._while_count}"
+        self._while_count += 1
+        self.writer.write_label(while_lbl)
+
+        self.generate_expression(statement.condition)
+        self.writer.write_arithmetic('NOT')
+        self.writer.write_if(while_false_lbl)
+        self.generate_statements(statement.statements)
+        self.writer.write_goto(while_lbl)
+        self.writer.write_label(while_false_lbl)
+
+    def generate_do(self, statement: DoStatement) -> None:
+        self.generate_call(statement.call)
+        self.writer.write_pop('TEMP', 0)  # void method
+
+    def generate_return(self, statement: ReturnStatement) -> None:
+        if statement.value is not None:
+            self.generate_expression(statement.value)
+        else:
+            self.writer.write_push('CONST', 0)
+        self.writer.write_return()
+
+    def generate_expression(self, expression: Expression) -> None:
+        """
+        Writes code that pushes the value of the expression.
+        :return: None
+        """
+        expression_type = type(expression)
+        if expression_type is BinaryOp:
+            if expression.op in self.CALL_OP:
+                self._generate_call_op(expression)
+            else:
+                self.generate_expression(expression.left)
+                self.generate_expression(expression.right)
+                self.writer.write_arithmetic(self.OP[expression.op])
+        elif expression_type is IntegerConstant:
+            self.writer.write_push('CONST', expression.value)
+        elif expression_type is VarRef:
+            self.writer.write_push(*self._variable(expression.name))
+        elif expression_type is ArrayRef:
+            self.generate_expression(expression.index)
+            self.writer.write_push(*self._variable(expression.name))
+            self.writer.write_arithmetic('ADD')
+            self.writer.write_pop('POINTER', 1)
+            self.writer.write_push('THAT', 0)
+        elif expression_type is SubroutineCall:
+            self.generate_call(expression)
+        elif expression_type is KeywordConstant:
+            if expression.keyword == 'this':
+                self.writer.write_push('POINTER', 0)
+            else:
+                self.writer.write_push('CONST', 0)
+                if expression.keyword == 'true':
+                    self.writer.write_arithmetic('NOT')
+        elif expression_type is StringConstant:
+            if self.intern_strings:
+                self._generate_pooled_string(expression.value)
+            else:
+                self._generate_new_string(expression.value)
+        else:  # UnaryOp
+            self.generate_expression(expression.operand)
+            self.writer.write_arithmetic(self.UNARY_OP[expression.op])
+
+    def generate_call(self, call: SubroutineCall) -> None:
+        n_args = 0
+        if call.receiver is None:  # Subroutine of this class, a method unless the index says otherwise
+            func_name = f'{self.class_name}.{call.name}'
+            signature = self._signature(self.class_name, call, None)
+            if signature is None or signature.kind == 'method':
+                self.writer.write_push('POINTER', 0)
+                n_args += 1
+        elif call.receiver in self.table.subroutine_table or call.receiver in self.table.class_table:  # Instance
+            var_type = self.table.type_of(call.receiver)
+            self._signature(var_type, call, True)
+            self.writer.write_push(*self._variable(call.receiver))
+            func_name = f'{var_type}.{call.name}'
+            n_args += 1
+        else:  # Class
+            self._signature(call.receiver, call, False)
+            func_name = f'{call.receiver}.{call.name}'
+
+        for argument in call.arguments:
+            self.generate_expression(argument)
+        self.writer.write_call(func_name, n_args + len(call.arguments))
+
+    def _signature(self, class_name: str, call: SubroutineCall, on_object: Optional[bool]) -> Optional[Signature]:
+        """
+        The signature of the subroutine call calls in class_name, after checking that the call matches it.
+        :param on_object: True for a call on a variable, False for a call on a class name, None for a bare call,
+                          which may call either a method or a function.
+        :return: None if there's no class index or class_name isn't in it.
+        """
+        if self.class_index is None or class_name not in self.class_index.classes:
+            return None
+        signature = self.class_index.signature(class_name, call.name)
+        if signature is None:
+            self._call_error(call, f"class {class_name} has no subroutine {call.name}")
+        if on_object and signature.kind != 'method':
+            self._call_error(call, f"{class_name}.{call.name} is a {signature.kind}, it can't be called on an object")
+        if on_object is False and signature.kind == 'method':
+            self._call_error(call, f"{class_name}.{call.name} is a method, it needs an object")
+        if len(call.arguments) != signature.arity:
+            self._call_error(call, f"{class_name}.{call.name} takes {signature.arity} arguments, "
+                                   f"{len(call.arguments)} given")
+        return signature
+
+    def _call_error(self, call: SubroutineCall, message: str) -> None:
+        raise CompilationEngineError(f"line {call.line}: {message}")
+
+    def _generate_call_op(self, expression: BinaryOp) -> None:
+        """
+        Writes x * y or x / y, inline when reduce_strength and y, or x for a product, is a suitable constant.
+        """
+        left, right = expression.left, expression.right
+        if self.reduce_strength:
+            if expression.op == '*' and type(left) is IntegerConstant:
+                left, right = right, left
+            if type(right) is IntegerConstant:
+                constant = right.value
+                is_power_of_two = constant > 0 and constant & (constant - 1) == 0
+                if expression.op == '*' and (constant <= self.MAX_ADD_CHAIN or is_power_of_two):
+                    self.generate_expression(left)
+                    self._multiply_by_constant(constant)
+                    return
+                if expression.op == '/' and is_power_of_two:
+                    self.generate_expression(left)
+                    self._divide_by_power_of_two(constant)
+                    return
+
+        self.generate_expression(left)
+        self.generate_expression(right)
+        self.writer.write_call(self.CALL_OP[expression.op], 2)
+
+    def _multiply_by_constant(self, constant: int) -> None:
+        """
+        Multiplies the top of the stack by constant, wrapping like Math.multiply. Going over the bits of constant
+        from the highest: the product so far is doubled, then the multiplicand, kept in temp 1, is added for a 1 bit.
+        """
+        if constant == 0:
+            self.writer.write_push('CONST', 0)
+            self.writer.write_arithmetic('AND')
+            return
+        bits = bin(constant)[3:]  # After the highest 1, which is the multiplicand itself
+        if '1' in bits:
+            self.writer.write_pop('TEMP', 1)
+            self.writer.write_push('TEMP', 1)
+        for bit in bits:
+            self.writer.write_pop('TEMP', 2)
+            self.writer.write_push('TEMP', 2)
+            self.writer.write_push('TEMP', 2)
+            self.writer.write_arithmetic('ADD')
+            if bit == '1':
+                self.writer.write_push('TEMP', 1)
+                self.writer.write_arithmetic('ADD')
+
+    def _divide_by_power_of_two(self, divisor: int) -> None:
+        """
+        Divides the top of the stack by divisor, 2^k. For a non-negative dividend, in temp 1, the quotient is the
+        sum of 2^(i-k) over its 1 bits i >= k, each one turned into 2^(i-k) or 0 without branching. A negative
+        dividend calls Math.divide, for its rounding toward zero.
+        """
+        shift = divisor.bit_length() - 1
+        if shift == 0:
+            return
+        call_lbl = f'DIVIDE_CALL_{self._divide_count}'
+        end_lbl = f'DIVIDE_END_{self._divide_count}'
+        self._divide_count += 1
+
+        self.writer.write_pop('TEMP', 1)
+        self.writer.write_push('TEMP', 1)
+        self.writer.write_push('CONST', 0)
+        self.writer.write_arithmetic('LT')
+        self.writer.write_if(call_lbl)
+        self.writer.write_push('CONST', 0)
+        for bit in range(shift, self.WORD_BITS - 1):
+            self.writer.write_push('TEMP', 1)
+            self.writer.write_push('CONST', 1 << bit)
+            self.writer.write_arithmetic('AND')
+            self.writer.write_push('CONST', 0)
+            self.writer.write_arithmetic('GT')  # true is -1, all bits set
+            self.writer.write_push('CONST', 1 << (bit - shift))
+            self.writer.write_arithmetic('AND')
+            self.writer.write_arithmetic('ADD')
+        self.writer.write_goto(end_lbl)
+        self.writer.write_label(call_lbl)
+        self.writer.write_push('TEMP', 1)
+        self.writer.write_push('CONST', divisor)
+        self.writer.write_call('Math.divide', 2)
+        self.writer.write_label(end_lbl)
+
+    def _generate_new_string(self, value: str) -> None:
+        self.writer.write_push('CONST', len(value))
+        self.writer.write_call('String.new', 1)
+        for char in value:
+            self.writer.write_push('CONST', ord(char))
+            self.writer.write_call('String.appendChar', 2)
+
+    def _generate_pooled_string(self, value: str) -> None:
+        """
+        push static S; if-goto STRING_n; <build the string>; pop static S; label STRING_n; push static S
+        """
+        if value not in self.string_pool:
+            self.string_pool[value] = self.table.var_count(Kind.STATIC)
+            # Not a Jack identifier, so it can't clash with the class's own variables
+            self.table.define(f'$string{len(self.string_pool)}', 'String', Kind.STATIC)
+        index = self.string_pool[value]
+        built_lbl = f'STRING_{self.string_uses}'
+        self.string_uses += 1
+        self.string_calls += 1 + len(value)
+
+        self.writer.write_push('STATIC', index)
+        self.writer.write_if(built_lbl)
+        self._generate_new_string(value)
+        self.writer.write_pop('STATIC', index)
+        self.writer.write_label(built_lbl)
+        self.writer.write_push('STATIC', index)
+
+    def _define(self, var_dec: VarDec) -> None:
+        kind = Kind.ARG if var_dec.kind == 'argument' else str_to_kind(var_dec.kind)
+        for name in var_dec.names:
+            self.table.define(name, var_dec.type, kind)
+
+    def _variable(self, name: str):
+        """The segment and index of a variable, for VMWriter."""
+        return convert_kind(self.table.kind_of(name)), self.table.index_of(name)
+
+    _STATEMENT_METHODS = {LetStatement: 'generate_let', IfStatement: 'generate_if', WhileStatement: 'generate_while',
+                          DoStatement: 'generate_do', ReturnStatement: 'generate_return'}
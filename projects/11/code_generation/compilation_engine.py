@@ -230,6 +230,7 @@ class CompilationEngine:
         self._consume(')')
 
         self._consume('{')
+        self.writer.write_arithmetic('NOT')
         self.writer.write_if(while_false_lbl)
 
         self.compile_statements()
@@ -266,6 +267,7 @@ class CompilationEngine:
         self._if_count += 1
 
         self._consume('{')
+        self.writer.write_arithmetic('NOT')
         self.writer.write_if(false_lbl)
 
         self.compile_statements()
@@ -345,17 +347,8 @@ class CompilationEngine:
             self._consume(token_type)
 
         elif token_type == token_type.STRING_CONST:
-            const_str = ''
-            first = True
-            while const_str.count('"') < 2:
-                if first:
-                    const_str += self._get_current_token()
-                    first = False
-                else:
-                    const_str += ' ' + self._get_current_token()
-                if self.tokenizer.has_more_tokens():
-                    self.tokenizer.advance()
-            const_str = const_str.replace('"', '')
+            const_str = self.tokenizer.string_val()
+            self._consume(token_type)
 
             self.writer.write_push('CONST', len(const_str))
             self.writer.write_call('String.new', 1)
@@ -394,13 +387,14 @@ class CompilationEngine:
                 index = self.table.index_of(subroutine_name)
                 self.writer.write_push(kind, index)
                 func_name = f'{var_type}.{sub_name}'
+                n_args += 1
             except KeyError:  # Class
                 func_name = f'{subroutine_name}.{sub_name}'
 
         else:
             func_name = f'{self.class_name}.{subroutine_name}'
             n_args += 1
-            self.writer.write_pop('POINTER', 0)
+            self.writer.write_push('POINTER', 0)
 
         self._consume('(')
         n_args += self.compile_expression_list()
@@ -443,8 +437,8 @@ class CompilationEngine:
 
         curr_token = self._get_current_token()
         if curr_token not in expected_tokens:
-            raise CompilationEngineError(f"Expected {expected_tokens} but current token is {curr_token}. "
-                                         f"Compilation failed.")
+            raise CompilationEngineError(f"{self._position()}: Expected {expected_tokens} but current token is "
+                                         f"{curr_token}. Compilation failed.")
         else:
             if self.tokenizer.has_more_tokens():
                 self.tokenizer.advance()
@@ -456,8 +450,8 @@ class CompilationEngine:
             expected_types = [expected_types]
         curr_type = self.tokenizer.token_type()
         if curr_type not in expected_types:
-            raise CompilationEngineError(f"Expected {expected_types} but current token type is {curr_type}. "
-                                         f"Compilation failed.")
+            raise CompilationEngineError(f"{self._position()}: Expected {expected_types} but current token type is "
+                                         f"{curr_type}. Compilation failed.")
         else:
             if self.tokenizer.has_more_tokens():
                 self.tokenizer.advance()
@@ -473,15 +467,11 @@ class CompilationEngine:
             self._consume(TokenTypes.IDENTIFIER)  # Class name
 
     def _get_current_token(self) -> str:
-        token_type = self.tokenizer.token_type()
-        if token_type is TokenTypes.INT_CONST:
-            curr_token = str(self.tokenizer.int_val())
-        elif token_type is TokenTypes.KEYWORD:
-            curr_token = self.tokenizer.key_word()
-        else:
-            curr_token = self.tokenizer.current_token
+        return self.tokenizer.current_token
 
-        return curr_token
+    def _position(self) -> str:
+        line, column = self.tokenizer.position()
+        return f"line {line}, column {column}"
 
 
 def str_to_kind(str_type: str) -> Kind:
@@ -0,0 +1,154 @@
+"""
+Typed syntax tree of a Jack class, as JackParser builds it and CodeGenerator walks it.
+
+Every node class has __slots__, so a node costs a few machine words and no dict, and the trees of a whole program,
+OS included, fit in one process. Binary operators associate to the left, with no precedence, as in the Jack
+grammar: a + b * c is (a + b) * c.
+"""
+from typing import List, Optional, Union
+
+
+class VarDec:
+    """static/field declaration of a class, parameter, or var declaration of a subroutine: one type, any names."""
+    __slots__ = ('kind', 'type', 'names')
+
+    def __init__(self, kind: str, var_type: str, names: List[str]):
+        self.kind = kind  # 'static', 'field', 'argument' or 'var'
+        self.type = var_type
+        self.names = names
+
+
+# Expressions
+class IntegerConstant:
+    __slots__ = ('value',)
+
+    def __init__(self, value: int):
+        self.value = value
+
+
+class StringConstant:
+    __slots__ = ('value',)
+
+    def __init__(self, value: str):
+        self.value = value
+
+
+class KeywordConstant:
+    __slots__ = ('keyword',)
+
+    def __init__(self, keyword: str):
+        self.keyword = keyword  # 'true', 'false', 'null' or 'this'
+
+
+class VarRef:
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class ArrayRef:
+    __slots__ = ('name', 'index')
+
+    def __init__(self, name: str, index: 'Expression'):
+        self.name = name
+        self.index = index
+
+
+class SubroutineCall:
+    """receiver.name(arguments), where receiver is a variable or a class name, or name(arguments) on this."""
+    __slots__ = ('receiver', 'name', 'arguments', 'line')
+
+    def __init__(self, receiver: Optional[str], name: str, arguments: List['Expression'], line: int):
+        self.receiver = receiver
+        self.name = name
+        self.arguments = arguments
+        self.line = line
+
+
+class UnaryOp:
+    __slots__ = ('op', 'operand')
+
+    def __init__(self, op: str, operand: 'Expression'):
+        self.op = op  # '-' or '~'
+        self.operand = operand
+
+
+class BinaryOp:
+    __slots__ = ('op', 'left', 'right')
+
+    def __init__(self, op: str, left: 'Expression', right: 'Expression'):
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+Expression = Union[IntegerConstant, StringConstant, KeywordConstant, VarRef, ArrayRef, SubroutineCall, UnaryOp,
+                   BinaryOp]
+
+
+# Statements
+class LetStatement:
+    __slots__ = ('name', 'index', 'value')
+
+    def __init__(self, name: str, index: Optional[Expression], value: Expression):
+        self.name = name
+        self.index = index  # The array index, None for a plain variable
+        self.value = value
+
+
+class IfStatement:
+    __slots__ = ('condition', 'then_statements', 'else_statements')
+
+    def __init__(self, condition: Expression, then_statements: List['Statement'],
+                 else_statements: Optional[List['Statement']]):
+        self.condition = condition
+        self.then_statements = then_statements
+        self.else_statements = else_statements  # None without an else clause
+
+
+class WhileStatement:
+    __slots__ = ('condition', 'statements')
+
+    def __init__(self, condition: Expression, statements: List['Statement']):
+        self.condition = condition
+        self.statements = statements
+
+
+class DoStatement:
+    __slots__ = ('call',)
+
+    def __init__(self, call: SubroutineCall):
+        self.call = call
+
+
+class ReturnStatement:
+    __slots__ = ('value',)
+
+    def __init__(self, value: Optional[Expression]):
+        self.value = value  # None for a bare return
+
+
+Statement = Union[LetStatement, IfStatement, WhileStatement, DoStatement, ReturnStatement]
+
+
+class Subroutine:
+    __slots__ = ('kind', 'return_type', 'name', 'parameters', 'locals', 'statements')
+
+    def __init__(self, kind: str, return_type: str, name: str, parameters: List[VarDec], local_vars: List[VarDec],
+                 statements: List[Statement]):
+        self.kind = kind  # 'constructor', 'function' or 'method'
+        self.return_type = return_type
+        self.name = name
+        self.parameters = parameters
+        self.locals = local_vars
+        self.statements = statements
+
+
+class Class:
+    __slots__ = ('name', 'class_vars', 'subroutines')
+
+    def __init__(self, name: str, class_vars: List[VarDec], subroutines: List[Subroutine]):
+        self.name = name
+        self.class_vars = class_vars
+        self.subroutines = subroutines
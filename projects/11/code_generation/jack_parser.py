@@ -0,0 +1,250 @@
+from typing import List, Optional
+
+from jack_ast import *
+from jack_tokenizer import JackTokenizer, TokenTypes
+from compilation_engine import CompilationEngineError
+
+
+class JackParser:
+    """
+    Parses the tokens of a .jack file into a jack_ast.Class, by recursive descent over the tokenizer's arrays.
+    """
+    CLASS_VAR_DEC_TOKENS = ('static', 'field')
+    SUBROUTINE_TOKENS = ('constructor', 'function', 'method')
+    VARIABLE_TYPES = ('int', 'char', 'boolean')
+    KEYWORD_CONSTANTS = ('true', 'false', 'null', 'this')
+    OP = ('+', '-', '*', '/', '&', '|', '<', '>', '=')
+    UNARY_OP = ('-', '~')
+
+    def __init__(self, jack_tokenizer: JackTokenizer):
+        self.tokenizer = jack_tokenizer
+        self._types = jack_tokenizer.types
+        self._values = jack_tokenizer.values
+        self._idx = 0
+
+    def parse_class(self) -> Class:
+        """
+        class: 'class' className '{' classVarDec* subroutineDec* '}'
+        :return: The class.
+        """
+        self._expect('class')
+        name = self._expect_type(TokenTypes.IDENTIFIER)
+        self._expect('{')
+        class_vars = []
+        subroutines = []
+        while self._current() != '}':
+            if self._current() in self.CLASS_VAR_DEC_TOKENS:
+                class_vars.append(self.parse_var_dec(self._advance()))
+            elif self._current() in self.SUBROUTINE_TOKENS:
+                subroutines.append(self.parse_subroutine())
+            else:
+                self._error(f"{self._current()} is an expected token at this point")
+        self._expect('}')
+        if self._idx < len(self._values):
+            self._error(f"{self._current()} after the end of the class")
+        return Class(name, class_vars, subroutines)
+
+    def parse_var_dec(self, kind: str) -> VarDec:
+        """
+        Parses type varName (',' varName)* ';', the rest of a classVarDec or varDec after its keyword.
+        """
+        var_type = self._parse_type()
+        names = [self._expect_type(TokenTypes.IDENTIFIER)]
+        while self._current() != ';':
+            self._expect(',')
+            names.append(self._expect_type(TokenTypes.IDENTIFIER))
+        self._expect(';')
+        return VarDec(kind, var_type, names)
+
+    def parse_subroutine(self) -> Subroutine:
+        """
+        subroutineDec: ('constructor' | 'function' | 'method') ('void' | type) subroutineName '(' parameterList ')'
+                       '{' varDec* statements '}'
+        """
+        kind = self._advance()
+        return_type = self._advance() if self._current() == 'void' else self._parse_type()
+        name = self._expect_type(TokenTypes.IDENTIFIER)
+        self._expect('(')
+        parameters = []
+        if self._current() != ')':
+            parameters.append(VarDec('argument', self._parse_type(), [self._expect_type(TokenTypes.IDENTIFIER)]))
+            while self._current() != ')':
+                self._expect(',')
+                parameters.append(VarDec('argument', self._parse_type(), [self._expect_type(TokenTypes.IDENTIFIER)]))
+        self._expect(')')
+        self._expect('{')
+        local_vars = []
+        while self._current() == 'var':
+            local_vars.append(self.parse_var_dec(self._advance()))
+        statements = self.parse_statements()
+        self._expect('}')
+        return Subroutine(kind, return_type, name, parameters, local_vars, statements)
+
+    def parse_statements(self) -> List[Statement]:
+        """
+        Parses statements up to the closing '}', which is left for the caller.
+        """
+        statements = []
+        while self._current() != '}':
+            keyword = self._current()
+            if keyword == 'let':
+                statements.append(self.parse_let())
+            elif keyword == 'if':
+                statements.append(self.parse_if())
+            elif keyword == 'while':
+                statements.append(self.parse_while())
+            elif keyword == 'do':
+                self._advance()
+                statements.append(DoStatement(self.parse_subroutine_call(self._expect_type(TokenTypes.IDENTIFIER))))
+                self._expect(';')
+            elif keyword == 'return':
+                self._advance()
+                value = None if self._current() == ';' else self.parse_expression()
+                self._expect(';')
+                statements.append(ReturnStatement(value))
+            else:
+                self._error(f"{keyword} is an expected token at this point")
+        return statements
+
+    def parse_let(self) -> LetStatement:
+        """
+        'let' varName ('[' expression ']')? '=' expression ';'
+        """
+        self._expect('let')
+        name = self._expect_type(TokenTypes.IDENTIFIER)
+        index = None
+        if self._current() == '[':
+            self._advance()
+            index = self.parse_expression()
+            self._expect(']')
+        self._expect('=')
+        value = self.parse_expression()
+        self._expect(';')
+        return LetStatement(name, index, value)
+
+    def parse_if(self) -> IfStatement:
+        """
+        'if' '(' expression ')' '{' statements '}' ('else' '{' statements '}')?
+        """
+        self._expect('if')
+        condition, then_statements = self._parse_condition_and_block()
+        else_statements = None
+        if self._current() == 'else':
+            self._advance()
+            self._expect('{')
+            else_statements = self.parse_statements()
+            self._expect('}')
+        return IfStatement(condition, then_statements, else_statements)
+
+    def parse_while(self) -> WhileStatement:
+        """
+        'while' '(' expression ')' '{' statements '}'
+        """
+        self._expect('while')
+        return WhileStatement(*self._parse_condition_and_block())
+
+    def parse_expression(self) -> Expression:
+        """
+        term (op term)*, associating to the left.
+        """
+        expression = self.parse_term()
+        while self._current() in self.OP:
+            op = self._advance()
+            expression = BinaryOp(op, expression, self.parse_term())
+        return expression
+
+    def parse_term(self) -> Expression:
+        """
+        integerConstant | stringConstant | keywordConstant | varName | varName '[' expression ']' |
+        subroutineCall | '(' expression ')' | unaryOp term
+        """
+        token_type = self._types[self._idx] if self._idx < len(self._types) else None
+        if token_type == TokenTypes.IDENTIFIER:
+            name = self._advance()
+            if self._current() in ('(', '.'):
+                return self.parse_subroutine_call(name)
+            elif self._current() == '[':
+                self._advance()
+                index = self.parse_expression()
+                self._expect(']')
+                return ArrayRef(name, index)
+            return VarRef(name)
+        elif token_type == TokenTypes.INT_CONST:
+            return IntegerConstant(int(self._advance()))
+        elif token_type == TokenTypes.STRING_CONST:
+            return StringConstant(self._advance()[1:-1])
+        elif token_type == TokenTypes.KEYWORD and self._current() in self.KEYWORD_CONSTANTS:
+            return KeywordConstant(self._advance())
+        elif self._current() == '(':
+            self._advance()
+            expression = self.parse_expression()
+            self._expect(')')
+            return expression
+        elif self._current() in self.UNARY_OP:
+            op = self._advance()
+            return UnaryOp(op, self.parse_term())
+        self._error(f"Expected a term but current token is {self._current()}. Compilation failed.")
+
+    def parse_subroutine_call(self, name: str) -> SubroutineCall:
+        """
+        The rest of a subroutineCall after its first identifier, name:
+        '(' expressionList ')' | '.' subroutineName '(' expressionList ')'
+        """
+        line = self.tokenizer.lines[self._idx - 1]
+        receiver = None
+        if self._current() == '.':
+            self._advance()
+            receiver, name = name, self._expect_type(TokenTypes.IDENTIFIER)
+        self._expect('(')
+        arguments = []
+        if self._current() != ')':
+            arguments.append(self.parse_expression())
+            while self._current() == ',':
+                self._advance()
+                arguments.append(self.parse_expression())
+        self._expect(')')
+        return SubroutineCall(receiver, name, arguments, line)
+
+    def _parse_condition_and_block(self):
+        self._expect('(')
+        condition = self.parse_expression()
+        self._expect(')')
+        self._expect('{')
+        statements = self.parse_statements()
+        self._expect('}')
+        return condition, statements
+
+    def _parse_type(self) -> str:
+        """
+        int / char / boolean / class name
+        """
+        if self._current() in self.VARIABLE_TYPES:
+            return self._advance()
+        return self._expect_type(TokenTypes.IDENTIFIER)
+
+    def _current(self) -> Optional[str]:
+        """The current token's value, None at the end of the file."""
+        return self._values[self._idx] if self._idx < len(self._values) else None
+
+    def _advance(self) -> str:
+        """Consumes the current token and returns its value."""
+        value = self._current()
+        if value is None:
+            self._error("Unexpected end of file. Compilation failed.")
+        self._idx += 1
+        return value
+
+    def _expect(self, expected: str) -> str:
+        if self._current() != expected:
+            self._error(f"Expected {expected} but current token is {self._current()}. Compilation failed.")
+        return self._advance()
+
+    def _expect_type(self, expected: TokenTypes) -> str:
+        if self._idx >= len(self._types) or self._types[self._idx] != expected:
+            self._error(f"Expected {expected!r} but current token is {self._current()}. Compilation failed.")
+        return self._advance()
+
+    def _error(self, message: str) -> None:
+        idx = min(self._idx, len(self._values) - 1)
+        raise CompilationEngineError(f"line {self.tokenizer.lines[idx]}, column {self.tokenizer.columns[idx]}: "
+                                     f"{message}")
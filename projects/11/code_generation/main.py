@@ -1,29 +1,84 @@
+import argparse
 import glob
-import sys
 from pathlib import Path, PurePath
+from typing import Optional
 from os.path import isfile, isdir, join
 
 from jack_tokenizer import JackTokenizer
+from jack_parser import JackParser
+from code_generator import CodeGenerator
+from class_index import INDEX_FILE, ClassIndex, build_index
 from compilation_engine import CompilationEngine
+from vm_writer import VMWriter
+
+
+def compile_file(jack_file: str, output_file: str, single_pass: bool = False, intern_strings: bool = False,
+                 reduce_strength: bool = False, class_index: Optional[ClassIndex] = None) -> Optional[CodeGenerator]:
+    """
+    Compiles a .jack file into a .vm file.
+    :param single_pass: Use CompilationEngine, which writes VM code while parsing, instead of parsing into a syntax
+                        tree and generating code from the tree.
+    :param intern_strings: Build every string constant once and keep it in a static variable (see CodeGenerator).
+    :param reduce_strength: Multiply and divide by constants inline where possible (see CodeGenerator).
+    :param class_index: Signatures to resolve and check calls with (see CodeGenerator).
+    :return: The code generator, for its string pool statistics. None with single_pass.
+    """
+    tokenizer = JackTokenizer(jack_file)
+    if single_pass:
+        CompilationEngine(tokenizer, output_file).writer.close()
+        return None
+    jack_class = JackParser(tokenizer).parse_class()
+    writer = VMWriter(output_file)
+    generator = CodeGenerator(writer, intern_strings, reduce_strength, class_index)
+    generator.generate_class(jack_class)
+    writer.close()
+    return generator
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        program_path = sys.argv[1]
-        if isfile(program_path):
-            files = [program_path]
-            output_path = Path(program_path).parent
-        elif isdir(program_path):
-            files = glob.glob(join(program_path, '*.jack'))
-            output_path = program_path
-        else:
-            raise FileNotFoundError("[Errno 2] No such file or directory: ", program_path)
-
-        for file in files:
-            output_file_name = PurePath(file).name.split('.')[0] + '.vm'
-            output_file = Path(output_path, output_file_name)
-            file_tokenizer = JackTokenizer(file)
-            CompilationEngine(file_tokenizer, output_file)
+    arg_parser = argparse.ArgumentParser(description='Jack compiler')
+    arg_parser.add_argument('program_path', help='.jack file, or a directory of .jack files')
+    arg_parser.add_argument('--single-pass', action='store_true',
+                            help='write VM code while parsing, without building a syntax tree')
+    arg_parser.add_argument('--intern-strings', action='store_true',
+                            help='build each string constant once, on its first evaluation, and reuse it after that. '
+                                 'The strings are shared, so the program must not change or dispose them')
+    arg_parser.add_argument('--reduce-strength', action='store_true',
+                            help='compute * and / by constants inline, with additions, instead of calling Math')
+    arg_parser.add_argument('--class-index', action='store_true',
+                            help='index the subroutines of every class in the directory first, kept in '
+                                 f'{INDEX_FILE} there, and resolve and check calls with it')
+    arg_parser.add_argument('--library', action='append', default=[], metavar='DIR',
+                            help='with --class-index, also index the classes of this directory, e.g. the OS, '
+                                 'without compiling them. May be repeated')
+    args = arg_parser.parse_args()
+    if args.single_pass and (args.intern_strings or args.reduce_strength or args.class_index):
+        arg_parser.error('--intern-strings, --reduce-strength and --class-index need the syntax tree, they can\'t be '
+                         'used with --single-pass')
 
+    program_path = args.program_path
+    if isfile(program_path):
+        files = [program_path]
+        output_path = Path(program_path).parent
+    elif isdir(program_path):
+        files = glob.glob(join(program_path, '*.jack'))
+        output_path = program_path
     else:
-        raise TypeError("1 argument is required: program path, 0 arguments entered")
+        raise FileNotFoundError("[Errno 2] No such file or directory: ", program_path)
+
+    class_index = None
+    if args.class_index:
+        program_files = glob.glob(join(Path(program_path).parent if isfile(program_path) else program_path, '*.jack'))
+        library_files = [file for directory in args.library for file in glob.glob(join(directory, '*.jack'))]
+        class_index = build_index(program_files + library_files, join(output_path, INDEX_FILE))
+        print(f'class index: {len(class_index.classes)} classes, '
+              f'{sum(map(len, class_index.classes.values()))} subroutines, {class_index.scanned} files scanned')
+
+    for file in files:
+        output_file_name = PurePath(file).name.split('.')[0] + '.vm'
+        generator = compile_file(file, Path(output_path, output_file_name), args.single_pass, args.intern_strings,
+                                 args.reduce_strength, class_index)
+        if args.intern_strings and generator.string_pool:
+            print(f'{generator.class_name}: {len(generator.string_pool)} string constants, {generator.string_uses} '
+                  f'sites, {generator.string_calls} String calls replaced by a static push on every evaluation of all '
+                  f'sites but the first')